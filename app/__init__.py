@@ -2,10 +2,12 @@ import os
 import sys
 import json
 import logging
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, jsonify
 from app.config import Config
 from app.extensions import db, login_manager, migrate, csrf, limiter
 from app.models import User, Notification
+from app.services.notifications import total_nao_lidas
+from app.services.subscriptions import assinatura_vencida, data_validade
 from datetime import datetime
 from sqlalchemy import inspect
 from dotenv import load_dotenv
@@ -33,16 +35,13 @@ def create_app(config_class=None):
     # ATENÇÃO: Versão atualizada para limpar cache dos navegadores
     app.config['APP_VERSION'] = "v13.2-Onboarding"
 
-    # --- CONFIGURAÇÃO DE CACHE BUSTING (AUTOMÁTICO) ---
-    @app.url_defaults
-    def hashed_url_for_static_file(endpoint, values):
-        if 'static' == endpoint or endpoint.endswith('.static'):
-            filename = values.get('filename')
-            if filename:
-                param_name = 'v'
-                while param_name in values:
-                    param_name = '_' + param_name
-                values[param_name] = app.config['APP_VERSION']
+    # --- ESTÁTICOS: nomes com hash + variantes pré-comprimidas (manifesto em static/dist) ---
+    from app.services.assets import registrar_assets
+    registrar_assets(app)
+
+    # --- COMPRESSÃO gzip/Brotli das respostas dinâmicas ---
+    from app.services.compression import registrar_compressao
+    registrar_compressao(app)
 
     if not app.debug:
         handler = logging.StreamHandler(sys.stdout)
@@ -68,13 +67,17 @@ def create_app(config_class=None):
     csrf.init_app(app)
     limiter.init_app(app)
 
+    from app.commands import register_commands
+    register_commands(app)
+
     @login_manager.user_loader
     def load_user(user_id):
         return User.query.get(int(user_id))
 
-    from app.utils import clean_phone_filter, float_to_time_filter
+    from app.utils import clean_phone_filter, float_to_time_filter, to_brasilia
     app.jinja_env.filters['clean_phone'] = clean_phone_filter
     app.jinja_env.filters['float_to_time'] = float_to_time_filter
+    app.jinja_env.filters['brasilia'] = to_brasilia
 
     from flask_login import current_user
 
@@ -83,8 +86,8 @@ def create_app(config_class=None):
         plan_info = app.config.get('PLANS', {}).get('mensal', {})
         unread = 0
         if current_user.is_authenticated:
-            try:
-                unread = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
+            # Contador desnormalizado + avisos gerais acima da marca de leitura (sem consulta quando não há avisos novos)
+            try: unread = total_nao_lidas(current_user)
             except: pass
         return dict(
             current_version=app.config['APP_VERSION'],
@@ -105,23 +108,18 @@ def create_app(config_class=None):
                 return render_template('maintenance.html'), 503
 
         if current_user.is_authenticated:
-            if current_user.validade:
-                try:
-                    hoje = datetime.now().date()
-                    val = current_user.validade
-                    if isinstance(val, str):
-                        try: val = datetime.strptime(val, '%Y-%m-%d').date()
-                        except: val = hoje
-                    if val < hoje:
-                        if current_user.category != 'expired':
-                            current_user.category = 'expired'; db.session.commit()
-                        whitelist = ['payments.', 'webhook', 'auth.', 'static', 'main.healthz']
-                        if request.endpoint and not any(x in request.endpoint for x in whitelist):
-                            stripe_key = os.environ.get('STRIPE_PUBLIC_KEY')
-                            return render_template('bloqueio_assinatura.html', nome=current_user.nome, validade=val.strftime('%d/%m/%Y'), email=current_user.email, stripe_public_key=stripe_key)
-                except Exception as e: app.logger.error(f"Erro check_status: {e}")
+            # Só leitura: a troca de category para 'expired' é feita em lote por 'flask subscriptions sweep'
+            try:
+                if assinatura_vencida(current_user):
+                    whitelist = ['payments.', 'webhook', 'auth.', 'static', 'main.healthz']
+                    if request.endpoint and not any(x in request.endpoint for x in whitelist):
+                        if request.blueprint == 'api': return jsonify({'erro': 'assinatura vencida'}), 402
+                        stripe_key = os.environ.get('STRIPE_PUBLIC_KEY')
+                        return render_template('bloqueio_assinatura.html', nome=current_user.nome, validade=data_validade(current_user).strftime('%d/%m/%Y'), email=current_user.email, stripe_public_key=stripe_key)
+            except Exception as e: app.logger.error(f"Erro check_status: {e}")
 
             if getattr(current_user, 'is_temp_password', False) and request.endpoint != 'auth.change_password_force':
+                if request.blueprint == 'api': return jsonify({'erro': 'troca de senha pendente'}), 403
                 return redirect(url_for('auth.change_password_force'))
 
     print(">>> APP: Carregando Blueprints...")
@@ -133,6 +131,7 @@ def create_app(config_class=None):
         from app.routes.admin import bp as admin_bp
         from app.routes.user_settings import bp as settings_bp
         from app.routes.payments import bp as payments_bp
+        from app.routes.api import bp as api_bp
 
         app.register_blueprint(auth_bp) 
         app.register_blueprint(main_bp) 
@@ -140,6 +139,7 @@ def create_app(config_class=None):
         app.register_blueprint(admin_bp, url_prefix='/admin')
         app.register_blueprint(settings_bp)
         app.register_blueprint(payments_bp)
+        app.register_blueprint(api_bp, url_prefix='/api/v1')
         
         print(">>> APP: Blueprints registrados com sucesso.")
     except Exception as e:
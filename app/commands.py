@@ -0,0 +1,192 @@
+import click
+from flask.cli import AppGroup
+from app.extensions import db
+
+# --- COMANDOS DE MANUTENÇÃO (flask <grupo> <comando>) ---
+rollups_cli = AppGroup('rollups', help='Buckets pré-agregados do Diario (dia/semana/mês).')
+
+@rollups_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Recria apenas os buckets deste usuário.')
+def rollups_rebuild(user_id):
+    """Apaga e recalcula os buckets a partir do Diario."""
+    from app.services.rollups import rebuild_rollups
+    try:
+        total = rebuild_rollups(user_id)
+        db.session.commit()
+        click.echo(f"✅ {total} buckets recriados.")
+    except Exception as e:
+        db.session.rollback()
+        raise click.ClickException(f"Erro ao recriar buckets: {e}")
+
+@rollups_cli.command('verify')
+@click.option('--user-id', type=int, default=None, help='Verifica apenas este usuário.')
+@click.option('--fix', is_flag=True, help='Recria os buckets dos usuários com divergência.')
+def rollups_verify(user_id, fix):
+    """Compara os buckets com o Diario e lista as divergências."""
+    from app.services.rollups import verificar_rollups, rebuild_rollups
+    divergencias = verificar_rollups(user_id)
+    if not divergencias:
+        click.echo("✅ Nenhuma divergência encontrada.")
+        return
+    for d in divergencias[:50]:
+        click.echo(f"user={d['user_id']} {d['periodo']} {d['inicio']} {d['campo']}: esperado={d['esperado']} atual={d['atual']}")
+    if len(divergencias) > 50: click.echo(f"... e mais {len(divergencias) - 50} divergências.")
+    usuarios = sorted({d['user_id'] for d in divergencias})
+    click.echo(f"⚠️ {len(divergencias)} divergências em {len(usuarios)} usuário(s).")
+    if fix:
+        for uid in usuarios: rebuild_rollups(uid)
+        db.session.commit()
+        click.echo("✅ Buckets recriados para os usuários afetados.")
+    else:
+        raise SystemExit(1)
+
+odometer_cli = AppGroup('odometer', help='Odômetro materializado (UserStats.km_total / km_30_dias).')
+
+@odometer_cli.command('check')
+@click.option('--user-id', type=int, default=None, help='Verifica apenas este usuário.')
+@click.option('--fix', is_flag=True, help='Recalcula os contadores dos usuários com divergência.')
+def odometer_check(user_id, fix):
+    """Compara o km materializado com a soma do Diario."""
+    from app.services.user_stats import verificar_user_stats, rebuild_user_stats
+    divergencias = verificar_user_stats(user_id, campos=('km_total', 'km_30_dias'))
+    if not divergencias:
+        click.echo("✅ Odômetros consistentes.")
+        return
+    for d in divergencias[:50]:
+        click.echo(f"user={d['user_id']} {d['campo']}: esperado={d['esperado']:.1f} atual={d['atual']:.1f}")
+    usuarios = sorted({d['user_id'] for d in divergencias})
+    click.echo(f"⚠️ {len(divergencias)} divergências em {len(usuarios)} usuário(s).")
+    if fix:
+        for uid in usuarios: rebuild_user_stats(uid)
+        db.session.commit()
+        click.echo("✅ Contadores recalculados para os usuários afetados.")
+    else:
+        raise SystemExit(1)
+
+stats_cli = AppGroup('stats', help='Contadores vitalícios por usuário (UserStats).')
+
+@stats_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Recalcula apenas este usuário.')
+def stats_rebuild(user_id):
+    """Recria o UserStats a partir do Diario e dos Agendamentos."""
+    from app.services.user_stats import rebuild_user_stats, rebuild_all_user_stats
+    try:
+        if user_id: rebuild_user_stats(user_id); total = 1
+        else: total = rebuild_all_user_stats()
+        db.session.commit()
+        click.echo(f"✅ {total} usuário(s) recalculado(s).")
+    except Exception as e:
+        db.session.rollback()
+        raise click.ClickException(f"Erro ao recalcular UserStats: {e}")
+
+@stats_cli.command('check')
+@click.option('--user-id', type=int, default=None, help='Verifica apenas este usuário.')
+def stats_check(user_id):
+    """Compara todos os contadores do UserStats com as tabelas de origem."""
+    from app.services.user_stats import verificar_user_stats
+    divergencias = verificar_user_stats(user_id)
+    if not divergencias:
+        click.echo("✅ Contadores consistentes.")
+        return
+    for d in divergencias[:50]:
+        click.echo(f"user={d['user_id']} {d['campo']}: esperado={d['esperado']} atual={d['atual']}")
+    click.echo(f"⚠️ {len(divergencias)} divergências. Rode 'flask stats rebuild' para corrigir.")
+    raise SystemExit(1)
+
+achievements_cli = AppGroup('achievements', help='Regras declarativas das conquistas (Achievement.metrica / meta).')
+
+@achievements_cli.command('seed-rules')
+def achievements_seed_rules():
+    """Grava as regras padrão nas conquistas que ainda não têm métrica."""
+    from app.models import Achievement
+    from app.services.gamification import REGRAS_PADRAO, invalidate_achievement_catalog
+    total = 0
+    for a in Achievement.query.filter(Achievement.id.in_(list(REGRAS_PADRAO)), Achievement.metrica.is_(None)).all():
+        a.metrica, a.meta = REGRAS_PADRAO[a.id]; total += 1
+    db.session.commit()
+    invalidate_achievement_catalog()
+    click.echo(f"✅ {total} regra(s) gravada(s).")
+
+@achievements_cli.command('backfill')
+@click.argument('achievement_id', required=False)
+@click.option('--all', 'todas', is_flag=True, help='Aplica todas as regras do catálogo.')
+def achievements_backfill(achievement_id, todas):
+    """Concede a conquista a todos os usuários que já atingiram a regra (INSERT ... SELECT)."""
+    from app.services.gamification import backfill_achievement, regras_ativas, invalidate_achievement_catalog
+    if not achievement_id and not todas: raise click.UsageError("Informe ACHIEVEMENT_ID ou --all.")
+    invalidate_achievement_catalog()
+    ids = [b.id for b in regras_ativas()] if todas else [achievement_id]
+    try:
+        for aid in ids:
+            click.echo(f"{aid}: {backfill_achievement(aid)} usuário(s) premiado(s).")
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        raise click.ClickException(str(e))
+    except Exception as e:
+        db.session.rollback()
+        raise click.ClickException(f"Erro no backfill: {e}")
+    click.echo("✅ Backfill concluído.")
+
+notifications_cli = AppGroup('notifications', help='Contador de notificações não lidas (User.notificacoes_nao_lidas).')
+
+@notifications_cli.command('reconcile')
+@click.option('--user-id', type=int, default=None, help='Verifica apenas este usuário.')
+@click.option('--fix', is_flag=True, help='Regrava o contador a partir da tabela Notification.')
+def notifications_reconcile(user_id, fix):
+    """Compara o contador de não lidas com a tabela Notification."""
+    from app.services.notifications import verificar_nao_lidas, reconciliar_nao_lidas
+    divergencias = verificar_nao_lidas(user_id)
+    if not divergencias:
+        click.echo("✅ Contadores de notificações consistentes.")
+        return
+    for uid, esperado, atual in divergencias[:50]:
+        click.echo(f"user={uid}: esperado={esperado} atual={atual}")
+    click.echo(f"⚠️ {len(divergencias)} usuário(s) com contador divergente.")
+    if fix:
+        reconciliar_nao_lidas(user_id)
+        db.session.commit()
+        click.echo("✅ Contadores regravados.")
+    else:
+        raise SystemExit(1)
+
+subscriptions_cli = AppGroup('subscriptions', help='Assinaturas (varredura de vencidos).')
+
+@subscriptions_cli.command('sweep')
+def subscriptions_sweep():
+    """Move todos os usuários com validade vencida para 'expired' (agendar diariamente no cron)."""
+    from app.services.subscriptions import varrer_expirados
+    try: r = varrer_expirados('cli')
+    except Exception as e: raise click.ClickException(f"Erro na varredura: {e}")
+    click.echo(f"✅ {r.expirados} usuário(s) expirado(s). Vencidos: {r.total_vencidos} | Ativos: {r.total_ativos}")
+
+business_cli = AppGroup('business', help='Painel executivo (BusinessSnapshot).')
+
+@business_cli.command('snapshot')
+def business_snapshot():
+    """Recalcula as métricas do /admin/business e grava um novo snapshot (agendar no cron)."""
+    from app.services.business import gerar_snapshot
+    try: snap = gerar_snapshot('cli')
+    except Exception as e: raise click.ClickException(f"Erro ao gerar snapshot: {e}")
+    click.echo(f"✅ Snapshot #{snap.id} gerado em {snap.duracao_ms} ms (MRR líquido R$ {snap.mrr_liquido:.2f}).")
+
+assets_cli = AppGroup('assets', help='Estáticos com hash no nome e variantes .gz/.br (static/dist).')
+
+@assets_cli.command('build')
+def assets_build():
+    """Gera static/dist/ e o manifesto usado por url_for('static') e pelo /sw.js."""
+    from flask import current_app
+    from app.services.assets import build_assets, brotli
+    manifesto = build_assets(current_app.static_folder)
+    current_app.extensions['assets_manifesto'] = manifesto
+    click.echo(f"✅ {len(manifesto['arquivos'])} arquivo(s), {len(manifesto['comprimidos'])} comprimido(s){'' if brotli else ' (sem .br: pacote brotli não instalado)'}. Versão {manifesto['versao']}.")
+
+def register_commands(app):
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(odometer_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(achievements_cli)
+    app.cli.add_command(notifications_cli)
+    app.cli.add_command(subscriptions_cli)
+    app.cli.add_command(business_cli)
+    app.cli.add_command(assets_cli)
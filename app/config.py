@@ -50,6 +50,20 @@ class Config:
         "pool_timeout": 30
     }
 
+    # --- RESTORE GLOBAL (admin) ---
+    RESTORE_LOTE = 500          # linhas por lote (uma consulta IN por lote)
+    RESTORE_COMMIT_A_CADA = 10  # commit a cada N lotes (0 = uma única transação no final)
+    IMPORT_LOTE = 500           # importar_dados do usuário: linhas por bulk insert
+
+    # --- ESTÁTICOS ---
+    ASSETS_AUTO_BUILD = os.environ.get('ASSETS_AUTO_BUILD', 'True') == 'True' # gera static/dist na subida se algo mudou
+
+    # --- COMPRESSÃO DAS RESPOSTAS ---
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'True') == 'True' # desligar se o proxy já comprime
+    COMPRESS_MIN_SIZE = 500     # bytes; abaixo disso não compensa
+    COMPRESS_NIVEL = 6          # gzip
+    COMPRESS_BR_QUALIDADE = 5   # Brotli dinâmico (11 só no build dos estáticos)
+
     @staticmethod
     def get_db_uri():
         # 1. Prioridade: Variável de Ambiente (Render / Codespaces configurado)
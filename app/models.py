@@ -36,6 +36,15 @@ class User(UserMixin, db.Model, DictMixin):
     data_nascimento = db.Column(db.Date, nullable=True)
     endereco = db.Column(db.String(255), nullable=True)
     
+    # Incrementado a cada escrita em Config (invalida o cache de configurações)
+    config_version = db.Column(db.Integer, default=0)
+    data_version = db.Column(db.Integer, default=0, nullable=False, server_default='0') # sobe a cada escrita em Diario/Config/Manutencao
+    # Contador desnormalizado de Notification não lidas (mantido por app.services.notifications)
+    notificacoes_nao_lidas = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    # Estado de leitura dos avisos gerais (BroadcastMessage): ids <= lido_ate já lidos, <= oculto_ate apagados
+    broadcast_lido_ate = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    broadcast_oculto_ate = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    
     # PLAN TYPE REAL
     plan_type = db.Column(db.String(20), default='premium') 
     
@@ -54,6 +63,8 @@ class User(UserMixin, db.Model, DictMixin):
     notificacoes = db.relationship('Notification', backref='recipient', lazy=True, cascade="all, delete-orphan")
     tickets = db.relationship('SupportTicket', backref='dono', lazy=True, cascade="all, delete-orphan")
     conquistas_desbloqueadas = db.relationship('UserAchievement', backref='user', lazy=True, cascade="all, delete-orphan")
+    rollups = db.relationship('DiarioRollup', backref='dono', lazy=True, cascade="all, delete-orphan")
+    stats = db.relationship('UserStats', backref='dono', lazy=True, uselist=False, cascade="all, delete-orphan")
     
     def set_password(self, password): self.password_hash = generate_password_hash(password)
     def check_password(self, password): return check_password_hash(self.password_hash, password)
@@ -74,6 +85,21 @@ class Notification(db.Model, DictMixin):
     created_at = db.Column(db.DateTime, default=datetime.now) 
     is_read = db.Column(db.Boolean, default=False, index=True) # INDEX ADICIONADO
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True) # INDEX ADICIONADO
+    __table_args__ = (db.Index('ix_notification_user_created', 'user_id', 'created_at'),) # feed paginado por usuário
+
+class BroadcastMessage(db.Model, DictMixin):
+    """Aviso para todos os usuários: uma linha por envio (não uma por usuário)."""
+    __tablename__ = 'broadcast_message'
+    id = db.Column(db.Integer, primary_key=True)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+class BroadcastRead(db.Model, DictMixin):
+    """Avisos lidos individualmente acima do User.broadcast_lido_ate."""
+    __tablename__ = 'broadcast_read'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast_message.id'), primary_key=True)
+    lido_em = db.Column(db.DateTime, default=datetime.now)
 
 class SupportTicket(db.Model, DictMixin):
     id = db.Column(db.Integer, primary_key=True) 
@@ -110,6 +136,42 @@ class Diario(db.Model, DictMixin):
     km_percorrido = db.Column(db.Float, default=0.0)
     horas_trabalhadas = db.Column(db.Float, default=0.0)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True) # INDEX ADICIONADO
+    __table_args__ = (db.Index('ix_diario_user_data_id', 'user_id', 'data', 'id'),) # histórico paginado por (data, id)
+
+class DiarioRollup(db.Model, DictMixin):
+    # Totais pré-agregados do Diario por dia, semana (Domingo a Sábado) e mês
+    __tablename__ = 'diario_rollup'
+    __table_args__ = (db.UniqueConstraint('user_id', 'periodo', 'inicio', name='uq_diario_rollup_bucket'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    periodo = db.Column(db.String(10), nullable=False) # 'dia', 'semana' ou 'mes'
+    inicio = db.Column(db.Date, nullable=False) # Data inicial do bucket
+    registros = db.Column(db.Integer, default=0)
+    ganho_bruto = db.Column(db.Numeric(12,2), default=0.00)
+    ganho_uber = db.Column(db.Numeric(12,2), default=0.00)
+    ganho_99 = db.Column(db.Numeric(12,2), default=0.00)
+    ganho_part = db.Column(db.Numeric(12,2), default=0.00)
+    ganho_outros = db.Column(db.Numeric(12,2), default=0.00)
+    despesa_combustivel = db.Column(db.Numeric(12,2), default=0.00)
+    despesa_alimentacao = db.Column(db.Numeric(12,2), default=0.00)
+    despesa_manutencao = db.Column(db.Numeric(12,2), default=0.00)
+    qtd_uber = db.Column(db.Integer, default=0)
+    qtd_99 = db.Column(db.Integer, default=0)
+    qtd_part = db.Column(db.Integer, default=0)
+    qtd_outros = db.Column(db.Integer, default=0)
+    km_percorrido = db.Column(db.Float, default=0.0)
+    horas_trabalhadas = db.Column(db.Float, default=0.0)
+
+class UserStats(db.Model, DictMixin):
+    # Contadores materializados por usuário, atualizados a cada escrita em Diario
+    __tablename__ = 'user_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    km_total = db.Column(db.Float, default=0.0) # Soma de todo o km_percorrido (odômetro = km_atual_carro + km_total)
+    km_30_dias = db.Column(db.Float, default=0.0) # Soma dos lançamentos com data >= km_30_ref - 30 dias
+    km_30_ref = db.Column(db.Date) # Dia (Brasília) em que km_30_dias foi calculado
+    total_registros = db.Column(db.Integer, default=0) # Quantidade de lançamentos no Diario
+    total_faturamento = db.Column(db.Numeric(14,2), default=0.00, index=True) # Soma de ganho_bruto (ranking do admin)
+    agendamentos_concluidos = db.Column(db.Integer, default=0)
 
 class Agendamentos(db.Model, DictMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -123,6 +185,17 @@ class Agendamentos(db.Model, DictMixin):
     status = db.Column(db.String(20), default='pendente', index=True) # INDEX ADICIONADO
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True) # INDEX ADICIONADO
 
+class SyncOperation(db.Model, DictMixin):
+    """Chave de idempotência de cada lançamento enviado pela fila offline do PWA (evita duplicar no reenvio)."""
+    __tablename__ = 'sync_operation'
+    __table_args__ = (db.UniqueConstraint('user_id', 'chave', name='uq_sync_operation_chave'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    chave = db.Column(db.String(64), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False) # 'diario' ou 'agendamento'
+    objeto_id = db.Column(db.Integer)
+    criado_em = db.Column(db.DateTime, default=datetime.now)
+
 class Manutencao(db.Model, DictMixin):
     id = db.Column(db.Integer, primary_key=True) 
     item = db.Column(db.String(100)) 
@@ -152,15 +225,49 @@ class Achievement(db.Model, DictMixin):
     icone = db.Column(db.String(20), default='🏆') 
     categoria = db.Column(db.String(30), default='geral') 
     xp = db.Column(db.Integer, default=10)
+    # Regra declarativa: concede quando UserStats.<metrica> >= meta (NULL = conquista por evento)
+    metrica = db.Column(db.String(40), nullable=True)
+    meta = db.Column(db.Integer, nullable=True)
 
 class UserAchievement(db.Model, DictMixin):
     __tablename__ = 'user_achievement'
     id = db.Column(db.Integer, primary_key=True) 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True) # INDEX ADICIONADO
-    achievement_id = db.Column(db.String(50), db.ForeignKey('achievement.id'), nullable=False) 
+    achievement_id = db.Column(db.String(50), db.ForeignKey('achievement.id'), nullable=False, index=True) 
     conquistado_em = db.Column(db.DateTime, default=datetime.utcnow) 
     visto = db.Column(db.Boolean, default=False) 
     detalhes = db.relationship('Achievement', lazy='joined')
 
+class ExpirySweep(db.Model, DictMixin):
+    """Histórico das varreduras de assinaturas vencidas (flask subscriptions sweep)."""
+    __tablename__ = 'expiry_sweep'
+    id = db.Column(db.Integer, primary_key=True)
+    executado_em = db.Column(db.DateTime, default=datetime.now, index=True)
+    origem = db.Column(db.String(20), default='cli') # cli / admin
+    expirados = db.Column(db.Integer, default=0) # movidos para 'expired' nesta execução
+    total_vencidos = db.Column(db.Integer, default=0)
+    total_ativos = db.Column(db.Integer, default=0)
 
-
+class BusinessSnapshot(db.Model, DictMixin):
+    """Métricas do painel executivo (/admin/business) calculadas por job; o histórico fica para gráficos de tendência."""
+    __tablename__ = 'business_snapshot'
+    id = db.Column(db.Integer, primary_key=True)
+    criado_em = db.Column(db.DateTime, default=datetime.now, index=True)
+    origem = db.Column(db.String(20), default='cli') # cli / admin
+    duracao_ms = db.Column(db.Integer, default=0)
+    mrr_liquido = db.Column(db.Float, default=0.0)
+    mrr_basic = db.Column(db.Float, default=0.0)
+    mrr_premium = db.Column(db.Float, default=0.0)
+    arr = db.Column(db.Float, default=0.0)
+    ltv = db.Column(db.Float, default=0.0)
+    count_basic = db.Column(db.Integer, default=0)
+    count_premium = db.Column(db.Integer, default=0)
+    subs_card = db.Column(db.Integer, default=0)
+    subs_pix = db.Column(db.Integer, default=0)
+    qtd_risco = db.Column(db.Integer, default=0)
+    dau = db.Column(db.Integer, default=0)
+    mau = db.Column(db.Integer, default=0)
+    stickiness = db.Column(db.Float, default=0.0)
+    media_reais_km = db.Column(db.Float, default=0.0)
+    custo_medio_km = db.Column(db.Float, default=0.0)
+    detalhes = db.Column(db.Text, default='{}') # JSON: share_data, top_users, growth_labels, growth_values
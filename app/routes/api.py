@@ -0,0 +1,133 @@
+from functools import wraps
+from flask import Blueprint, request, jsonify
+from flask_login import current_user
+from app.extensions import csrf
+from app.utils import get_config, get_brasilia_now, etag_condicional
+from app.services import get_date_range_local, get_filter_label, MESES_PT
+from app.services import reports
+from app.services.dashboard_cache import payload_dashboard
+from app.services.rollups import somar_periodo
+from app.services.lancamentos import sincronizar_lote, inserir_diarios, LOTE_MAXIMO
+
+# API JSON do PWA (/api/v1). Autenticação pela mesma sessão do site; sem CSRF por formulário, mas só
+# aceita corpo application/json (um formulário de outro site não consegue enviar esse tipo sem CORS).
+bp = Blueprint('api', __name__)
+API_VERSAO = 1 # sobe quando o formato das respostas de leitura mudar de forma incompatível
+TIPOS_PERIODO = ('dia', 'semana', 'mes', 'anual')
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated: return jsonify({'erro': 'não autenticado'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+def _corpo_json():
+    if not request.is_json: return None
+    return request.get_json(silent=True)
+
+def _n(v):
+    return round(float(v or 0), 2)
+
+def _colunas(linhas, campos):
+    """Lista de dicts -> {campo: [valores]} (formato colunar: cada chave aparece uma vez só)."""
+    return {c: [l.get(c) for l in linhas] for c in campos}
+
+def _periodo(tipo_padrao):
+    """Filtro só pela URL (?tipo=&valor=): a API não mexe no filtro guardado na sessão das páginas."""
+    tipo = request.args.get('tipo', tipo_padrao)
+    if tipo not in TIPOS_PERIODO: return None
+    start, end, titulo, valor = get_date_range_local(tipo, request.args.get('valor'))
+    return {'tipo': tipo, 'valor': valor, 'inicio': start.isoformat(), 'fim': end.isoformat(), 'titulo': titulo, 'label': get_filter_label(tipo, start, end)}, start, end
+
+def _nomes_apps(user):
+    return ['Uber', '99', 'Particular', get_config(user.id, 'app_local_name', 'Outros')]
+
+@bp.route('/dashboard', endpoint='dashboard')
+@api_login_required
+@etag_condicional()
+def dashboard():
+    """Payload do dashboard (mesmo cache do HTML) em JSON compacto. ?tipo=dia|semana|mes|anual&valor=..."""
+    periodo = _periodo('dia')
+    if not periodo: return jsonify({'erro': f'tipo deve ser um de {", ".join(TIPOS_PERIODO)}'}), 400
+    periodo, start, end = periodo
+    try: payload = payload_dashboard(current_user, periodo['tipo'], start, end, get_brasilia_now().date())
+    except Exception as e:
+        print(f"Erro api dashboard: {e}")
+        return jsonify({'erro': 'falha ao calcular o dashboard'}), 500
+    d = payload['dados']
+    return jsonify({
+        'v': API_VERSAO, 'periodo': periodo,
+        'resumo': {'ganho': _n(d['ganho']), 'despesa': _n(d['despesa_var']), 'operacional': _n(d['operacional']), 'km': _n(d['km']), 'horas': _n(d['horas']), 'corridas': d['total_corridas']},
+        'metricas': {k: _n(v) for k, v in d['metricas'].items()},
+        'apps': {'labels': _nomes_apps(current_user), 'ganho': [_n(v) for v in d['dados_apps'].values()]},
+        'despesas': {'labels': [x['nome'] for x in d['lista_despesas']], 'valor': [_n(x['valor']) for x in d['lista_despesas']], 'cor': [x['cor'] for x in d['lista_despesas']]},
+        'meta': {'semanal': _n(payload['meta_semanal']), 'acumulado': _n(payload['lucro_semanal_acumulado']), 'smart': payload['smart_goal']},
+        'odometro': _n(d['odo_atual']),
+        'manutencao': _colunas(d['lista_manutencao'], ('id', 'item', 'km_proxima', 'falta_km', 'urgencia', 'previsao_txt')),
+    })
+
+@bp.route('/relatorios', endpoint='relatorios')
+@api_login_required
+@etag_condicional()
+def relatorios():
+    """Séries dos relatórios em colunas: por dia (ou por mês no anual), por app e média por dia da semana."""
+    periodo = _periodo('semana')
+    if not periodo: return jsonify({'erro': f'tipo deve ser um de {", ".join(TIPOS_PERIODO)}'}), 400
+    periodo, start, end = periodo
+    if current_user.plan_type == 'basic' and periodo['tipo'] == 'anual': return jsonify({'erro': 'relatório anual disponível no plano premium'}), 403
+    uid = current_user.id
+    totais = somar_periodo(uid, start, end)
+    despesa = totais['despesa_combustivel'] + totais['despesa_alimentacao'] + totais['despesa_manutencao']
+    if periodo['tipo'] == 'anual':
+        linhas = reports.por_mes(uid, start, end)
+        serie = {'agrupamento': 'mes', 'labels': [f"{a}-{m:02d}" for a, m, _, _ in linhas], 'nomes': [MESES_PT.get(m, str(m)) for _, m, _, _ in linhas], 'ganho': [_n(g) for _, _, g, _ in linhas], 'registros': [n for _, _, _, n in linhas]}
+    else:
+        linhas = reports.por_data(uid, start, end)
+        serie = {'agrupamento': 'dia', 'labels': [d.isoformat() for d, _, _, _ in linhas], 'ganho': [_n(g) for _, g, _, _ in linhas], 'despesa': [_n(x) for _, _, x, _ in linhas], 'registros': [n for _, _, _, n in linhas]}
+    semana = dict((dow, (g, n)) for dow, g, n in reports.por_dia_semana(uid, start, end)) if totais['registros'] else {}
+    melhor = reports.melhor_dia(uid, start, end) if totais['registros'] else None
+    return jsonify({
+        'v': API_VERSAO, 'periodo': periodo,
+        'totais': {'ganho': _n(totais['ganho_bruto']), 'despesa': _n(despesa), 'lucro': _n(totais['ganho_bruto'] - despesa), 'km': _n(totais['km_percorrido']), 'horas': _n(totais['horas_trabalhadas']), 'dias': totais['registros']},
+        'serie': serie,
+        'apps': {'labels': _nomes_apps(current_user), 'ganho': [_n(totais[c]) for c in ('ganho_uber', 'ganho_99', 'ganho_part', 'ganho_outros')], 'qtd': [totais[c] for c in ('qtd_uber', 'qtd_99', 'qtd_part', 'qtd_outros')]},
+        'dia_semana': {'labels': list(reports.DIAS_SEMANA), 'media': [_n(semana[i][0] / semana[i][1]) if semana.get(i, (0, 0))[1] else 0 for i in range(7)], 'registros': [semana.get(i, (0, 0))[1] for i in range(7)]},
+        'melhor_dia': {'data': melhor[0].isoformat(), 'ganho': _n(melhor[1])} if melhor else None,
+    })
+
+@bp.route('/sync', methods=['POST'], endpoint='sync')
+@csrf.exempt
+@api_login_required
+def sync():
+    """Fila offline do service worker: {"itens": [{"chave", "tipo": "diario"|"agendamento", "dados": {...}}]}."""
+    corpo = _corpo_json()
+    itens = corpo.get('itens') if isinstance(corpo, dict) else None
+    if not isinstance(itens, list): return jsonify({'erro': 'esperado {"itens": [...]} em application/json'}), 400
+    if len(itens) > LOTE_MAXIMO: return jsonify({'erro': f'máximo de {LOTE_MAXIMO} itens por envio'}), 413
+    try: resultados = sincronizar_lote(current_user, [i for i in itens if isinstance(i, dict)])
+    except Exception as e:
+        print(f"Erro sync: {e}")
+        return jsonify({'erro': 'falha ao gravar o lote'}), 500
+    return jsonify({'resultados': resultados})
+
+@bp.route('/diarios', methods=['POST'], endpoint='diarios')
+@csrf.exempt
+@api_login_required
+def diarios():
+    """Carga em massa de dias: [{"data": "YYYY-MM-DD", "ganho_uber": ..., "chave": opcional}, ...] ou {"diarios": [...]}.
+
+    Mesmos campos e regras do formulário 'adicionar'. Linhas inválidas voltam com status 'erro' e as demais
+    são gravadas numa transação; gamificação roda uma vez no final.
+    """
+    corpo = _corpo_json()
+    entradas = corpo.get('diarios') if isinstance(corpo, dict) else corpo
+    if not isinstance(entradas, list): return jsonify({'erro': 'esperado uma lista de dias em application/json'}), 400
+    if len(entradas) > LOTE_MAXIMO: return jsonify({'erro': f'máximo de {LOTE_MAXIMO} dias por envio'}), 413
+    try: resultados, conquistas = inserir_diarios(current_user, entradas)
+    except Exception as e:
+        print(f"Erro api diarios: {e}")
+        return jsonify({'erro': 'falha ao gravar os dias'}), 500
+    for i, r in enumerate(resultados): r['indice'] = i
+    criados = sum(1 for r in resultados if r['status'] == 'criado')
+    return jsonify({'criados': criados, 'erros': sum(1 for r in resultados if r['status'] == 'erro'), 'conquistas': conquistas or [], 'resultados': resultados}), (201 if criados else 200)
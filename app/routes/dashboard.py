@@ -2,9 +2,9 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from flask_login import login_required, current_user
 from app.extensions import db
 from app.models import Diario, Config, Manutencao
-from app.utils import safe_float, safe_money, get_config, get_brasilia_now
-from app.services import calculate_dashboard, generate_week_options, get_date_range_local, get_filter_label, calculate_smart_goal
-from app.services.gamification import AchievementService
+from app.utils import safe_float, safe_money, get_config, get_brasilia_now, filtro_sessao, etag_condicional
+from app.services import generate_week_options, get_date_range_local, get_filter_label
+from app.services.dashboard_cache import payload_dashboard
 from decimal import Decimal
 from datetime import datetime
 
@@ -12,6 +12,7 @@ from datetime import datetime
 bp = Blueprint('dashboard', __name__)
 
 @bp.route('/', endpoint='index')
+@etag_condicional(sessao=('dash', 'dia'))
 def index():
     if not current_user.is_authenticated: 
         return render_template('landing.html')
@@ -22,14 +23,7 @@ def index():
         return redirect(url_for('main.bem_vindo'))
 
     # Filtros de Sessão
-    tipo = request.args.get('tipo')
-    valor_bruto = request.args.get('valor')
-    
-    if not tipo: tipo = session.get('dash_tipo', 'dia')
-    if not valor_bruto: valor_bruto = session.get('dash_valor')
-    
-    session['dash_tipo'] = tipo
-    if valor_bruto: session['dash_valor'] = valor_bruto
+    tipo, valor_bruto = filtro_sessao('dash', 'dia')
 
     start_date, end_date, titulo, valor_ajustado = get_date_range_local(tipo, valor_bruto)
     filter_label = get_filter_label(tipo, start_date, end_date)
@@ -41,21 +35,13 @@ def index():
         if get_config(current_user.id, 'meta_last_update_date') != hoje_dt.strftime('%Y-%m-%d'): 
             ask_for_goal = True
 
-    try:
-        dados = calculate_dashboard(current_user, start_date, end_date)
-        meta_semanal = safe_money(get_config(current_user.id, 'meta_semanal'))
-        
-        lucro_raw = dados.get('lucro_semanal_acumulado', 0.0)
-        lucro_semanal_acumulado = Decimal(str(lucro_raw)) if isinstance(lucro_raw, float) else lucro_raw
-        
-        smart_goal = calculate_smart_goal(current_user, lucro_semanal_acumulado, meta_semanal, dados['metricas'])
+    # Payload em cache por (usuário, versão dos dados, período, dia): só recalcula quando algo mudou
+    try: payload = payload_dashboard(current_user, tipo, start_date, end_date, hoje_dt.date())
     except Exception as e:
         print(f"Erro Dash: {e}")
         return "Erro ao carregar dashboard.", 500
+    dados = payload['dados']; meta_semanal = payload['meta_semanal']; lucro_semanal_acumulado = payload['lucro_semanal_acumulado']; smart_goal = payload['smart_goal']
 
-    # Gamificação: Carrega apenas o necessário para visualização
-    AchievementService.get_badges_with_progress(current_user)
-    
     week_options = generate_week_options(start_date.year)
 
     context = {
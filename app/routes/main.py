@@ -1,27 +1,21 @@
 from flask import Blueprint, render_template, request, redirect, url_for, current_app, jsonify, make_response, session
 from flask_login import login_required, current_user
-from sqlalchemy import func, extract
+from sqlalchemy import func, extract, or_, and_
 from datetime import datetime, timedelta, date
 from app.extensions import db
 from app.models import Diario, Agendamentos, Notification, Config, Manutencao, MaintenanceLog, SupportTicket, TicketMessage
-from app.utils import safe_float, safe_money, time_to_float, float_to_parts, get_config, set_config, get_brasilia_now
-from app.services import get_semanas_dropdown, MESES_PT, get_maintenance_prediction, get_date_range_local, get_filter_label, generate_week_options
+from app.utils import safe_float, safe_money, time_to_float, float_to_parts, get_config, set_config, get_user_settings, get_brasilia_now, filtro_sessao, etag_condicional
+from app.services import get_semanas_dropdown, MESES_PT, get_maintenance_prediction, get_odometro, get_date_range_local, get_filter_label, generate_week_options
 from app.services.gamification import AchievementService 
+from app.services.rollups import somar_periodo, anos_disponiveis
+from app.services import reports
+from app.services.assets import service_worker_js
+from app.services.lancamentos import montar_diario, montar_agendamento
 import calendar
 from decimal import Decimal
 
 bp = Blueprint('main', __name__)
-
-def no_cache(view):
-    from functools import wraps
-    @wraps(view)
-    def no_cache_view(*args, **kwargs):
-        response = make_response(view(*args, **kwargs))
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
-    return no_cache_view
+HISTORICO_POR_PAGINA = 15
 
 @bp.route('/healthz', methods=['GET'])
 def health_check(): return jsonify({'status': 'ok'}), 200
@@ -31,7 +25,9 @@ def manifest(): return current_app.send_static_file('manifest.json')
 
 @bp.route('/sw.js')
 def service_worker():
-    response = current_app.send_static_file('sw.js')
+    # Lista de precache e nome do cache gerados do manifesto: muda só quando algum estático muda
+    response = current_app.response_class(service_worker_js(current_app), mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
     response.headers.add('Service-Worker-Allowed', '/')
     return response
 
@@ -86,26 +82,7 @@ def adicionar():
     custom_app_name = get_config(current_user.id, 'app_local_name', 'OUTROS')
     if request.method=='POST':
         try:
-            data_obj = datetime.strptime(request.form['data'], '%Y-%m-%d').date()
-            h = time_to_float(request.form.get('horas_qtd'), request.form.get('minutos_qtd'))
-            g_uber = safe_money(request.form.get('ganho_uber'))
-            g_99 = safe_money(request.form.get('ganho_99'))
-            g_part = safe_money(request.form.get('ganho_part'))
-            g_out = safe_money(request.form.get('ganho_out'))
-            app_sum = g_uber + g_99 + g_part + g_out
-            gb_input = safe_money(request.form.get('ganho_bruto'))
-            final_gb = app_sum if app_sum > 0 else gb_input
-            d_comb = safe_money(request.form.get('total_combustivel'))
-            d_alim = safe_money(request.form.get('total_alimentacao'))
-            d_manu = safe_money(request.form.get('total_manutencao'))
-            novo = Diario(
-                data=data_obj, ganho_bruto=final_gb, 
-                ganho_uber=g_uber, ganho_99=g_99, ganho_part=g_part, ganho_outros=g_out, 
-                despesa_combustivel=d_comb, despesa_alimentacao=d_alim, despesa_manutencao=d_manu, 
-                qtd_uber=int(request.form.get('qtd_uber') or 0), qtd_99=int(request.form.get('qtd_99') or 0), 
-                qtd_part=int(request.form.get('qtd_part') or 0), qtd_outros=int(request.form.get('qtd_outros') or 0), 
-                km_percorrido=safe_float(request.form.get('km_percorrido')), horas_trabalhadas=h, user_id=current_user.id
-            )
+            novo = montar_diario(request.form, current_user.id)
             db.session.add(novo); db.session.commit()
             unlocks = AchievementService.check_new_entries(current_user)
             unlock_str = ",".join(unlocks) if unlocks else ""
@@ -120,27 +97,38 @@ def adicionar():
 
 @bp.route('/historico', endpoint='historico')
 @login_required
-@no_cache
+@etag_condicional()
 def historico():
-    page = request.args.get('page', 1, type=int)
+    antes = request.args.get('antes') # cursor "AAAA-MM-DD_id" do último registro da página anterior
     tipo = request.args.get('tipo', 'mes')
     valor = request.args.get('valor')
     if current_user.plan_type == 'basic' and tipo == 'anual': tipo = 'mes'; valor = None 
     start_date, end_date, _, valor_ajustado = get_date_range_local(tipo, valor)
     filter_label = get_filter_label(tipo, start_date, end_date)
     query = Diario.query.filter_by(user_id=current_user.id).filter(Diario.data >= start_date, Diario.data <= end_date)
+    inicio_visivel = start_date
     if current_user.plan_type == 'basic': 
         data_limite_basic = date.today() - timedelta(days=30)
-        query = query.filter(Diario.data >= data_limite_basic)
-    paginacao = query.order_by(Diario.data.desc()).paginate(page=page, per_page=15)
+        query = query.filter(Diario.data >= data_limite_basic); inicio_visivel = max(start_date, data_limite_basic)
+    if antes:
+        try:
+            d, i = antes.split('_'); d = date.fromisoformat(d); i = int(i)
+            query = query.filter(or_(Diario.data < d, and_(Diario.data == d, Diario.id < i)))
+        except ValueError: pass
+    # Keyset em (data, id) com LIMIT n+1: uma consulta por página, sem OFFSET nem COUNT
+    itens = query.order_by(Diario.data.desc(), Diario.id.desc()).limit(HISTORICO_POR_PAGINA + 1).all()
+    has_next = len(itens) > HISTORICO_POR_PAGINA; itens = itens[:HISTORICO_POR_PAGINA]
+    next_cursor = f"{itens[-1].data.isoformat()}_{itens[-1].id}" if has_next else None
     week_options = generate_week_options(start_date.year)
-    context = {'registros': [r.to_dict() for r in paginacao.items], 'page': page, 'has_next': paginacao.has_next, 'tipo': tipo, 'valor': valor_ajustado, 'filter_label': filter_label, 'week_options': week_options, 'total_pages': paginacao.pages}
+    context = {'registros': [r.to_dict() for r in itens], 'has_next': has_next, 'next_cursor': next_cursor, 'tipo': tipo, 'valor': valor_ajustado, 'filter_label': filter_label, 'week_options': week_options}
     if request.headers.get('HX-Request'): return render_template('partials/history_list.html', **context)
-    return render_template('historico.html', **context)
+    # Total só na página inteira (o "carregar mais" não usa): sem próxima página é o tamanho da lista, senão vem dos buckets
+    total = somar_periodo(current_user.id, inicio_visivel, end_date)['registros'] if has_next and inicio_visivel <= end_date else len(itens)
+    return render_template('historico.html', total_registros=total, **context)
 
 @bp.route('/editar/<int:id>', methods=('GET', 'POST'), endpoint='editar')
 @login_required
-@no_cache
+@etag_condicional()
 def editar(id):
     r = Diario.query.get_or_404(id)
     if r.user_id != current_user.id: return redirect(url_for('dashboard.index'))
@@ -195,9 +183,7 @@ def agenda():
 def novo_agendamento():
     if request.method == 'POST':
         try:
-            dt_str = f"{request.form['data_ag']} {request.form['hora_ag']}"
-            novo = Agendamentos(cliente=request.form['cliente'], data_hora=datetime.strptime(dt_str, "%Y-%m-%d %H:%M"), origem=request.form['origem'], destino=request.form['destino'], valor=safe_money(request.form['valor']), observacao=request.form['observacao'], user_id=current_user.id)
-            if 'parada' in request.form: novo.parada = request.form['parada']
+            novo = montar_agendamento(request.form, current_user.id)
             db.session.add(novo); db.session.commit()
             unlocks = AchievementService.check_usage(current_user, 'agenda_add')
             return redirect(url_for('main.agenda') + f"?new_badges={','.join(unlocks) if unlocks else ''}")
@@ -253,7 +239,7 @@ def concluir_manutencao(id):
     m = Manutencao.query.get_or_404(id)
     if m.user_id == current_user.id:
         try:
-            odo_sistema, _ = get_maintenance_prediction(current_user)
+            odo_sistema, _ = get_odometro(current_user)
             km_final = odo_sistema; custo_final = Decimal('0.00')
             if current_user.plan_type == 'premium':
                 km_custom = request.args.get('km_real'); custo_custom = request.args.get('custo_real')
@@ -277,9 +263,7 @@ def imprimir_historico_manutencao():
 @login_required
 def adicionar_manutencao():
     try:
-        kmi = safe_float(get_config(current_user.id, 'km_atual_carro'))
-        total_km_all = db.session.query(db.func.sum(Diario.km_percorrido)).filter_by(user_id=current_user.id).scalar() or 0
-        odo_atual = kmi + total_km_all
+        odo_atual, _ = get_odometro(current_user)
         intervalo = safe_float(request.form['km_proxima'])
         km_alvo = odo_atual + intervalo
         novo = Manutencao(item=request.form['item'], km_proxima=km_alvo, user_id=current_user.id)
@@ -292,7 +276,7 @@ def adicionar_manutencao():
 def editar_manutencao(id):
     m = Manutencao.query.get_or_404(id)
     if m.user_id != current_user.id: return redirect(url_for('main.manutencao'))
-    odo_atual, _ = get_maintenance_prediction(current_user)
+    odo_atual, _ = get_odometro(current_user)
     if request.method == 'POST':
         m.item = request.form['item']
         novo_alvo = safe_float(request.form['km_proxima'])
@@ -319,10 +303,10 @@ def imprimir_pdf():
     if current_user.plan_type == 'basic': return redirect(url_for('payments.assinar'))
     tipo = session.get('rep_tipo', 'mes'); valor = session.get('rep_valor')
     start_date, end_date, _, titulo = get_date_range_local(tipo, valor)
-    resumo = Diario.query.filter_by(user_id=current_user.id).filter(Diario.data >= start_date, Diario.data <= end_date).with_entities(func.sum(Diario.ganho_bruto), func.sum(Diario.despesa_combustivel + Diario.despesa_alimentacao + Diario.despesa_manutencao), func.sum(Diario.km_percorrido), func.sum(Diario.horas_trabalhadas), func.sum(Diario.qtd_uber + Diario.qtd_99 + Diario.qtd_part + Diario.qtd_outros), func.sum(Diario.ganho_uber), func.sum(Diario.qtd_uber), func.sum(Diario.ganho_99), func.sum(Diario.qtd_99), func.sum(Diario.ganho_part), func.sum(Diario.qtd_part), func.sum(Diario.ganho_outros), func.sum(Diario.qtd_outros)).first()
+    resumo = reports.resumo_periodo(current_user.id, start_date, end_date)
     def val(idx): return float(resumo[idx] or 0)
     ganho = val(0); despesa = val(1); km = val(2); horas = val(3); corridas = int(val(4))
-    cfg = Config.query.filter_by(user_id=current_user.id).all(); c = {i.chave: i.valor for i in cfg}
+    c = get_user_settings(current_user.id)
     depreciacao = safe_float(c.get('depreciacao_km', 0.20)); manutencao = safe_float(c.get('manutencao_km', 0.15))
     reserva = km * (depreciacao + manutencao); lucro_real = (ganho - despesa) - reserva
     dados = {'ganho': ganho, 'despesa': despesa, 'operacional': ganho - despesa, 'lucro_real': lucro_real, 'reserva': reserva, 'km': km, 'horas': horas, 'corridas': corridas, 'media_hora': (ganho/horas) if horas > 0 else 0, 'media_km': (ganho/km) if km > 0 else 0}
@@ -332,42 +316,32 @@ def imprimir_pdf():
 
 @bp.route('/relatorios', endpoint='relatorios')
 @login_required
+@etag_condicional(sessao=('rep', 'semana'))
 def relatorios():
-    tipo = request.args.get('tipo'); valor = request.args.get('valor')
-    if not tipo: tipo = session.get('rep_tipo', 'semana')
-    if not valor: valor = session.get('rep_valor')
-    session['rep_tipo'] = tipo; 
-    if valor: session['rep_valor'] = valor
+    tipo, valor = filtro_sessao('rep', 'semana')
     if current_user.plan_type == 'basic' and tipo == 'anual': return redirect(url_for('main.relatorios', tipo='mes'))
     start_date, end_date, titulo, valor_ajustado = get_date_range_local(tipo, valor)
     filter_label = get_filter_label(tipo, start_date, end_date)
-    registros = Diario.query.filter_by(user_id=current_user.id).filter(Diario.data >= start_date, Diario.data <= end_date).order_by(Diario.data.asc()).all()
-    total_ganho = sum(r.ganho_bruto for r in registros)
-    total_despesa = sum(r.despesa_combustivel + r.despesa_alimentacao + r.despesa_manutencao for r in registros)
+    totais = somar_periodo(current_user.id, start_date, end_date)
+    total_ganho = totais['ganho_bruto']
+    total_despesa = totais['despesa_combustivel'] + totais['despesa_alimentacao'] + totais['despesa_manutencao']
     chart_labels = []; chart_data = []; chart_despesa = []; qtd_apps = [0, 0, 0, 0]; dados_apps = [0, 0, 0, 0]
     if tipo != 'dia':
-        dados_agg = {}
-        for r in registros:
-            d_str = r.data.strftime('%d/%m')
-            if d_str not in dados_agg: dados_agg[d_str] = {'g': 0.0, 'd': 0.0}
-            dados_agg[d_str]['g'] += float(r.ganho_bruto)
-            dados_agg[d_str]['d'] += float(r.despesa_combustivel + r.despesa_alimentacao + r.despesa_manutencao)
-            dados_apps[0] += float(r.ganho_uber); dados_apps[1] += float(r.ganho_99); dados_apps[2] += float(r.ganho_part); dados_apps[3] += float(r.ganho_outros)
-            qtd_apps[0] += int(r.qtd_uber or 0); qtd_apps[1] += int(r.qtd_99 or 0); qtd_apps[2] += int(r.qtd_part or 0); qtd_apps[3] += int(r.qtd_outros or 0)
-        for k in sorted(dados_agg.keys()): chart_labels.append(k); chart_data.append(dados_agg[k]['g']); chart_despesa.append(dados_agg[k]['d'])
+        # Série do gráfico agrupada por data no banco (um bucket por dia, já em ordem cronológica)
+        for d, ganho, despesa, _ in reports.por_data(current_user.id, start_date, end_date):
+            chart_labels.append(d.strftime('%d/%m')); chart_data.append(float(ganho or 0)); chart_despesa.append(float(despesa or 0))
+        dados_apps = [float(totais['ganho_uber']), float(totais['ganho_99']), float(totais['ganho_part']), float(totais['ganho_outros'])]
+        qtd_apps = [totais['qtd_uber'], totais['qtd_99'], totais['qtd_part'], totais['qtd_outros']]
     best_month = {'val': 0, 'lbl': '-'}; best_week = {'val': 0, 'lbl': '-'}; best_day = {'val': 0, 'full': '-'}; best_wd = {'media': 0, 'dia': '-'}; worst_wd = {'media': 0, 'dia': '-'}
-    if registros:
-        rec_day = max(registros, key=lambda x: x.ganho_bruto)
-        best_day = {'val': float(rec_day.ganho_bruto), 'full': rec_day.data.strftime('%d/%m/%Y')}
-        wd_map = {0:'Seg', 1:'Ter', 2:'Qua', 3:'Qui', 4:'Sex', 5:'Sáb', 6:'Dom'}; wd_stats = {k: {'soma': 0, 'count': 0} for k in range(7)}
-        for r in registros: wd = r.data.weekday(); wd_stats[wd]['soma'] += float(r.ganho_bruto); wd_stats[wd]['count'] += 1
-        medias = [{'dia': wd_map[k], 'val': v['soma']/v['count']} for k,v in wd_stats.items() if v['count']>0]
+    if totais['registros']:
+        rec_day = reports.melhor_dia(current_user.id, start_date, end_date)
+        if rec_day: best_day = {'val': float(rec_day[1] or 0), 'full': rec_day[0].strftime('%d/%m/%Y')}
+        medias = [{'dia': reports.DIAS_SEMANA[dow], 'val': float(soma or 0) / qtd} for dow, soma, qtd in reports.por_dia_semana(current_user.id, start_date, end_date) if qtd > 0]
         if medias: b_wd = max(medias, key=lambda x: x['val']); w_wd = min(medias, key=lambda x: x['val']); best_wd = {'media': b_wd['val'], 'dia': b_wd['dia']}; worst_wd = {'media': w_wd['val'], 'dia': w_wd['dia']}
         if tipo == 'anual':
-            m_stats = {}
-            for r in registros: m_stats[r.data.month] = m_stats.get(r.data.month, 0) + float(r.ganho_bruto)
-            if m_stats: bm = max(m_stats.items(), key=lambda x: x[1]); best_month = {'val': bm[1], 'lbl': MESES_PT.get(bm[0], str(bm[0]))}
-    anos = db.session.query(extract('year', Diario.data)).distinct().order_by(extract('year', Diario.data).desc()).all(); anos = [int(a[0]) for a in anos]
+            m_stats = [(mes, float(ganho or 0)) for _, mes, ganho, _ in reports.por_mes(current_user.id, start_date, end_date)]
+            if m_stats: bm = max(m_stats, key=lambda x: x[1]); best_month = {'val': bm[1], 'lbl': MESES_PT.get(bm[0], str(bm[0]))}
+    anos = sorted(set(anos_disponiveis(current_user)) | {get_brasilia_now().year}, reverse=True) # buckets mensais do usuário
     custom_app_name = get_config(current_user.id, 'app_local_name', 'Outros')
     return render_template('relatorios.html', tipo=tipo, valor=valor_ajustado, titulo=titulo, chart_labels=chart_labels, chart_data=chart_data, chart_despesa=chart_despesa, total_ganho=total_ganho, total_despesa=total_despesa, best_month=best_month, best_week=best_week, best_day=best_day, best_wd=best_wd, worst_wd=worst_wd, anos=anos, semanas=[], dados_apps=dados_apps, qtd_apps=qtd_apps, filter_label=filter_label, week_options=generate_week_options(start_date.year), custom_app_name=custom_app_name)
 
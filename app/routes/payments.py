@@ -7,6 +7,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, jsonif
 from flask_login import login_required, current_user
 from app.extensions import db, csrf
 from app.models import User, Notification
+from app.services.compression import sem_compressao
 
 bp = Blueprint('payments', __name__)
 
@@ -210,6 +211,7 @@ def create_pix_payment():
 
 @bp.route('/webhook/stripe', methods=['POST'])
 @csrf.exempt
+@sem_compressao
 def stripe_webhook():
     payload = request.get_data(as_text=True)
     sig_header = request.headers.get('Stripe-Signature')
@@ -232,6 +234,7 @@ def stripe_webhook():
 
 @bp.route('/webhook/mercadopago', methods=['POST'])
 @csrf.exempt
+@sem_compressao
 def mp_webhook():
     if not mp: return jsonify({'status': 'ignored'})
     if request.args.get('type') == 'payment':
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, send_file, Response, flash, current_app, jsonify, session
+from flask import Blueprint, render_template, request, redirect, url_for, send_file, Response, stream_with_context, flash, current_app, jsonify, session
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta, date
 import json
@@ -8,9 +8,12 @@ import string
 from decimal import Decimal, ROUND_HALF_UP
 from app.extensions import db
 from app.models import Config, Manutencao, Diario, Agendamentos, SupportTicket, TicketMessage, User, Notification, Achievement, UserAchievement, CustosFixos
-from app.utils import set_config, safe_float, safe_money, get_config, get_brasilia_now
+from app.utils import set_config, safe_float, safe_money, get_config, get_user_settings, bump_config_version, get_brasilia_now
 from app.services import get_maintenance_prediction, get_filter_label # Importado get_filter_label
 from app.services.gamification import AchievementService
+from app.services import reports
+from app.services.notifications import zerar_nao_lidas, pagina_notificacoes, marcar_broadcast_lido, marcar_broadcasts_lidos
+from app.services.backup import gerar_export_json, gzip_stream, importar_export_json, EXPORT_SCHEMA
 
 bp = Blueprint('settings', __name__)
 
@@ -62,7 +65,7 @@ def configuracoes():
             if (val - cad).days <= 7: is_trial=True; dias = (val - get_brasilia_now().date()).days
     except: pass
     app_version = current_app.config.get('APP_VERSION', 'v3.3-Stable')
-    return render_template('configuracoes.html', version=app_version, is_trial=is_trial, dias_restantes=dias)
+    return render_template('configuracoes.html', version=app_version, is_trial=is_trial, dias_restantes=dias, importacao=session.pop('ultimo_import', None))
 
 @bp.route('/dados_pessoais', endpoint='dados_pessoais')
 @login_required
@@ -134,48 +137,53 @@ def page_conquistas():
     return render_template('conquistas.html', categorias=categorias, total_unlocked=total_unlocked, total_all=len(badges_list))
 
 # --- IMPORTAÇÃO E EXPORTAÇÃO ---
+def _fim_importacao(msg):
+    # Envio por XHR (barra de progresso): devolve o destino em JSON em vez do 302, senão o XHR seguiria o
+    # redirect e o GET dele consumiria o relatório da sessão antes da navegação do navegador
+    destino = url_for('settings.configuracoes') + f"?msg={msg}"
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest': return jsonify({'msg': msg, 'redirect': destino})
+    return redirect(destino)
+
 @bp.route('/configuracoes/importar', methods=['POST'], endpoint='importar_dados')
 @login_required
 def importar_dados():
-    if 'file' not in request.files: return redirect(url_for('settings.configuracoes') + "?msg=erro_arquivo")
+    if 'file' not in request.files: return _fim_importacao('erro_arquivo')
     file = request.files['file']
     try:
-        data = json.load(file)
+        # Leitura incremental + inserts em lote (bulk_insert_mappings) dentro do savepoint
         with db.session.begin_nested():
-            if 'user' in data:
-                u_data = data['user']
-                if 'nome' in u_data: current_user.nome = u_data['nome']
-                if 'whatsapp' in u_data: current_user.whatsapp = u_data['whatsapp']
-            Diario.query.filter_by(user_id=current_user.id).delete(); Agendamentos.query.filter_by(user_id=current_user.id).delete(); Manutencao.query.filter_by(user_id=current_user.id).delete(); Config.query.filter_by(user_id=current_user.id).delete()
-            def parse_dt(d_str):
-                try: return datetime.strptime(d_str, '%Y-%m-%d').date()
-                except: return None
-            if 'diarios' in data:
-                for d in data['diarios']:
-                    d_val = parse_dt(d.get('data'))
-                    db.session.add(Diario(data=d_val, ganho_bruto=safe_money(d.get('ganho_bruto')), ganho_uber=safe_money(d.get('ganho_uber')), ganho_99=safe_money(d.get('ganho_99')), ganho_part=safe_money(d.get('ganho_part')), ganho_outros=safe_money(d.get('ganho_outros')), despesa_combustivel=safe_money(d.get('despesa_combustivel')), despesa_alimentacao=safe_money(d.get('despesa_alimentacao')), despesa_manutencao=safe_money(d.get('despesa_manutencao')), qtd_uber=d.get('qtd_uber'), qtd_99=d.get('qtd_99'), qtd_part=d.get('qtd_part'), qtd_outros=d.get('qtd_outros'), km_percorrido=d.get('km_percorrido'), horas_trabalhadas=d.get('horas_trabalhadas'), user_id=current_user.id))
-            if 'manutencao' in data:
-                for m in data['manutencao']: db.session.add(Manutencao(item=m.get('item'), km_troca=m.get('km_troca'), km_proxima=m.get('km_proxima'), status=m.get('status'), user_id=current_user.id))
-            if 'configs' in data:
-                for cfg in data['configs']: db.session.add(Config(chave=cfg.get('chave'), valor=cfg.get('valor'), user_id=current_user.id))
+            relatorio = importar_export_json(current_user, file.stream, lote=current_app.config.get('IMPORT_LOTE', 500))
         db.session.commit()
-        return redirect(url_for('settings.configuracoes') + f"?msg=restaurado_ok")
-    except: db.session.rollback(); return redirect(url_for('settings.configuracoes') + "?msg=erro_processar")
+        session['ultimo_import'] = {k: relatorio[k] for k in ('importados', 'ignorados', 'lotes', 'segundos')}
+        session['ultimo_import']['erros'] = relatorio['erros'][:5]
+        return _fim_importacao('restaurado_ok')
+    except ValueError as e:
+        db.session.rollback(); print(f"Erro importar_dados: {e}")
+        return _fim_importacao('erro_versao' if 'schema' in str(e) else 'erro_processar')
+    except Exception as e: db.session.rollback(); print(f"Erro importar_dados: {e}"); return _fim_importacao('erro_processar')
 
 @bp.route('/exportar', endpoint='exportar_dados')
 @login_required
 def exportar_dados():
-    data = { 'user': current_user.to_dict(), 'diarios': [d.to_dict() for d in Diario.query.filter_by(user_id=current_user.id).all()], 'manutencao': [m.to_dict() for m in Manutencao.query.filter_by(user_id=current_user.id).all()], 'configs': [c.to_dict() for c in Config.query.filter_by(user_id=current_user.id).all()] }
-    if 'password_hash' in data['user']: del data['user']['password_hash']
-    return Response(json.dumps(data, indent=4, ensure_ascii=False, default=str), mimetype='application/json', headers={'Content-Disposition': f'attachment;filename=backup_motoristapro_{current_user.id}.json'})
+    # JSON gerado em streaming direto das consultas; ?gzip=1 comprime no caminho
+    nome = f'backup_motoristapro_{current_user.id}.json'
+    headers = {'X-Backup-Schema': str(EXPORT_SCHEMA)}
+    pedacos = gerar_export_json(current_user)
+    if request.args.get('gzip') == '1':
+        pedacos = gzip_stream(pedacos); nome += '.gz'; mimetype = 'application/gzip'
+    else: mimetype = 'application/json'
+    headers['Content-Disposition'] = f'attachment;filename={nome}'
+    return Response(stream_with_context(pedacos), mimetype=mimetype, headers=headers)
 
 # --- NOTIFICAÇÕES ---
 @bp.route('/notifications', endpoint='notifications')
 @login_required
 def notifications():
-    notifs = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).all()
-    for n in notifs: n.created_at = n.created_at - timedelta(hours=3)
-    return render_template('notifications.html', notifications=notifs)
+    # Feed somente leitura em páginas (tuplas, fuso aplicado no template com o filtro |brasilia)
+    notifs, next_cursor = pagina_notificacoes(current_user, request.args.get('antes'))
+    context = dict(notifications=notifs, next_cursor=next_cursor)
+    if request.headers.get('HX-Request'): return render_template('partials/notification_items.html', **context)
+    return render_template('notifications.html', **context)
 
 @bp.route('/mark_notification/<int:id>', endpoint='mark_notification')
 @login_required
@@ -184,17 +192,24 @@ def mark_notification(id):
     if n.user_id == current_user.id: n.is_read = True; db.session.commit()
     return redirect(url_for('settings.notifications'))
 
+@bp.route('/mark_broadcast/<int:id>', endpoint='mark_broadcast')
+@login_required
+def mark_broadcast(id):
+    try: marcar_broadcast_lido(current_user, id); db.session.commit()
+    except: db.session.rollback()
+    return redirect(url_for('settings.notifications'))
+
 @bp.route('/mark_all_read', endpoint='mark_all_read')
 @login_required
 def mark_all_read():
-    try: Notification.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True}); db.session.commit()
+    try: Notification.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True}); zerar_nao_lidas(current_user.id); marcar_broadcasts_lidos(current_user); db.session.commit()
     except: db.session.rollback()
     return redirect(url_for('settings.notifications'))
 
 @bp.route('/clear_notifications', endpoint='clear_notifications')
 @login_required
 def clear_notifications():
-    try: Notification.query.filter_by(user_id=current_user.id).delete(); db.session.commit()
+    try: Notification.query.filter_by(user_id=current_user.id).delete(); zerar_nao_lidas(current_user.id); marcar_broadcasts_lidos(current_user, ocultar=True); db.session.commit()
     except: db.session.rollback()
     return redirect(url_for('settings.notifications'))
 
@@ -208,7 +223,7 @@ def calculadora():
         if 'consumo_etanol' in request.form: 
             set_config(current_user.id, 'consumo_etanol', request.form['consumo_etanol']); set_config(current_user.id, 'consumo_gasolina', request.form['consumo_gasolina'])
         return redirect(url_for('settings.calculadora'))
-    cfg_list = Config.query.filter_by(user_id=current_user.id).all(); cfg = {c.chave: c.valor for c in cfg_list}
+    cfg = get_user_settings(current_user.id)
     return render_template('calculadora.html', p_km=cfg.get('preco_km'), p_min=cfg.get('preco_min'), taxa=cfg.get('taxa_base'), c_etanol=cfg.get('consumo_etanol','7'), c_gas=cfg.get('consumo_gasolina','10'))
 
 @bp.route('/lucro_real', endpoint='lucro_real')
@@ -217,8 +232,7 @@ def lucro_real():
     if not get_config(current_user.id, 'veiculo_modelo'): 
         return redirect(url_for('settings.setup_veiculo') + "?msg=config_required")
     
-    cfg_list = Config.query.filter_by(user_id=current_user.id).all()
-    cfg = {c.chave: c.valor for c in cfg_list}
+    cfg = get_user_settings(current_user.id)
     
     # Pega os parâmetros do Dashboard (via query params ou sessão)
     tipo = request.args.get('tipo', session.get('dash_tipo', 'dia'))
@@ -232,19 +246,11 @@ def lucro_real():
     # Gera o rótulo amigável (ex: "Semana Atual")
     periodo_label = get_filter_label(tipo, start_date, end_date)
     
-    registros = Diario.query.filter_by(user_id=current_user.id).filter(Diario.data >= start_date).filter(Diario.data <= end_date).all()
-    
-    # === CÁLCULO FINANCEIRO SEGURO (Decimal) ===
-    ganho_total = sum((r.ganho_bruto or Decimal('0.00')) for r in registros)
-    
-    despesa_var = sum(
-        (r.despesa_combustivel or Decimal('0.00')) + 
-        (r.despesa_alimentacao or Decimal('0.00')) + 
-        (r.despesa_manutencao or Decimal('0.00')) 
-        for r in registros
-    )
-    
-    km_total = sum((r.km_percorrido or 0.0) for r in registros)
+    # === CÁLCULO FINANCEIRO SEGURO (Decimal) — somas feitas no banco ===
+    resumo = dict(zip(reports.RESUMO_CAMPOS, reports.resumo_periodo(current_user.id, start_date, end_date)))
+    ganho_total = resumo['ganho']
+    despesa_var = resumo['despesa']
+    km_total = resumo['km']
     lucro_operacional = ganho_total - despesa_var
     
     # Configurações Variáveis
@@ -304,6 +310,7 @@ def setup_veiculo():
             for k in keys_to_delete:
                 c = Config.query.filter_by(user_id=current_user.id, chave=k).first()
                 if c: db.session.delete(c)
+            bump_config_version(current_user.id)
             db.session.commit(); return redirect(url_for('settings.lucro_real'))
         else:
             for campo in ['veiculo_marca', 'veiculo_modelo', 'veiculo_ano', 'autonomia_kml', 'preco_combustivel', 'depreciacao_km', 'manutencao_km', 'km_atual_carro']: 
@@ -315,7 +322,7 @@ def setup_veiculo():
             
             return redirect(url_for('settings.lucro_real'))
             
-    cfg_list = Config.query.filter_by(user_id=current_user.id).all(); c = {cfg.chave: cfg.valor for cfg in cfg_list}
+    c = get_user_settings(current_user.id)
     return render_template('setup_veiculo.html', c=c)
 
 @bp.route('/gerar_recibo', methods=['GET', 'POST'], endpoint='gerar_recibo')
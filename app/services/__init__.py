@@ -4,8 +4,12 @@ from dateutil.relativedelta import relativedelta
 from app.extensions import db
 from app.models import Diario, Config, Manutencao, MaintenanceLog, CustosFixos
 from app.utils import safe_float, safe_money, get_config, get_brasilia_now
+from app.services.rollups import somar_periodo
+from app.services.user_stats import get_user_stats
 from decimal import Decimal
 import calendar
+from functools import lru_cache
+from types import MappingProxyType
 
 # Mapeamento de meses para gráficos
 MESES_PT = {1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun', 7: 'Jul', 8: 'Ago', 9: 'Set', 10: 'Out', 11: 'Nov', 12: 'Dez'}
@@ -21,7 +25,12 @@ def get_current_week_range():
 
 def generate_week_options(year):
     """Gera lista de semanas para o dropdown (Domingo a Sábado)."""
-    hoje = get_brasilia_now().date()
+    current_start, _ = get_current_week_range()
+    return list(_semanas_do_ano(year, current_start, year == get_brasilia_now().year))
+
+@lru_cache(maxsize=32)
+def _semanas_do_ano(year, current_start, ano_atual):
+    # Memoizado por (ano, semana atual): a lista só muda quando vira a semana (ou o ano)
     try:
         d = date(year, 1, 1)
         idx_domingo = (d.weekday() + 1) % 7
@@ -34,18 +43,16 @@ def generate_week_options(year):
             start_date = d
             end_date = d + timedelta(days=6)
             label = f"{start_date.strftime('%d/%m')} - {end_date.strftime('%d/%m')}"
-            weeks.append({'value': start_date.strftime('%Y-%m-%d'), 'label': label})
+            weeks.append(MappingProxyType({'value': start_date.strftime('%Y-%m-%d'), 'label': label}))
             d += timedelta(weeks=1)
             if d.year > year + 1: break
         
-        current_start, _ = get_current_week_range()
-        
-        if year == hoje.year:
+        if ano_atual:
             # Adiciona opção de destaque "Esta Semana"
-            weeks.insert(0, {
+            weeks.insert(0, MappingProxyType({
                 'value': current_start.strftime('%Y-%m-%d'), 
                 'label': f"ESTA SEMANA: {current_start.strftime('%d/%m')} - {(current_start + timedelta(days=6)).strftime('%d/%m')}"
-            })
+            }))
             
             # Remove duplicatas
             seen = set()
@@ -54,12 +61,12 @@ def generate_week_options(year):
                 if w['value'] not in seen:
                     unique_weeks.append(w)
                     seen.add(w['value'])
-            return unique_weeks
+            return tuple(unique_weeks)
             
-        return weeks
+        return tuple(weeks)
     except Exception as e:
         print(f"Erro generate_week_options: {e}")
-        return []
+        return ()
 
 # --- FUNÇÃO DE COMPATIBILIDADE (CRÍTICA PARA EVITAR ERRO) ---
 def get_semanas_dropdown(year):
@@ -128,16 +135,16 @@ def get_date_range_local(tipo, valor):
         
     return start_date, end_date, titulo, valor_ajustado
 
+def get_odometro(user):
+    """Retorna (odômetro atual, média de km/dia nos últimos 30 dias) lidos do UserStats."""
+    stats = get_user_stats(user.id)
+    km_inicial = safe_float(get_config(user.id, 'km_atual_carro'))
+    return km_inicial + (stats.km_total or 0.0), (stats.km_30_dias or 0.0) / 30.0
+
 def get_maintenance_prediction(user):
     try:
-        km_inicial = safe_float(get_config(user.id, 'km_atual_carro'))
-        km_rodado_total = db.session.query(func.sum(Diario.km_percorrido)).filter_by(user_id=user.id).scalar() or 0.0
-        odo_atual = km_inicial + km_rodado_total
-
+        odo_atual, media_km_dia = get_odometro(user)
         hoje = get_brasilia_now().date()
-        data_30_dias = hoje - timedelta(days=30)
-        km_30_dias = db.session.query(func.sum(Diario.km_percorrido)).filter(Diario.user_id == user.id, Diario.data >= data_30_dias).scalar() or 0.0
-        media_km_dia = float(km_30_dias) / 30.0
 
         itens = Manutencao.query.filter_by(user_id=user.id).all()
         resultado = []
@@ -171,24 +178,20 @@ def calculate_dashboard(user, start_date, end_date):
     metricas = {'ganho_km': 0, 'ganho_h': 0, 'ganho_corr': 0, 'ganho_dia': 0, 'lucro_km': 0, 'lucro_h': 0, 'lucro_corr': 0, 'lucro_dia': 0}
     dados_apps = [0,0,0,0]; lista_despesas = []; dados_rosca = []
     
-    resumo_db = Diario.query.filter_by(user_id=user.id).filter(Diario.data >= start_date, Diario.data <= end_date).with_entities(
-        func.sum(Diario.ganho_bruto), func.sum(Diario.despesa_combustivel), func.sum(Diario.despesa_alimentacao), func.sum(Diario.despesa_manutencao), 
-        func.sum(Diario.km_percorrido), func.sum(Diario.horas_trabalhadas), func.sum(Diario.ganho_uber), func.sum(Diario.ganho_99), 
-        func.sum(Diario.ganho_part), func.sum(Diario.ganho_outros), func.sum(Diario.qtd_uber), func.sum(Diario.qtd_99), 
-        func.sum(Diario.qtd_part), func.sum(Diario.qtd_outros), func.count(Diario.id)
-    ).first()
+    # Soma apenas os buckets pré-agregados (dia/semana/mês) que cobrem o período
+    resumo = somar_periodo(user.id, start_date, end_date)
 
     total_corridas = 0; dias_trabalhados = 0
+    soma_apps = {'Uber': 0, '99': 0, 'Particular': 0, 'Outros': 0}
 
-    if resumo_db and resumo_db[0] is not None:
-        to_dec = lambda v: Decimal(str(v)) if v is not None else Decimal('0.00')
-        ganho = to_dec(resumo_db[0])
-        d_comb = to_dec(resumo_db[1]); d_alim = to_dec(resumo_db[2]); d_manu = to_dec(resumo_db[3])
-        km = float(resumo_db[4] or 0.0); horas = float(resumo_db[5] or 0.0)
+    if resumo['registros'] > 0:
+        ganho = resumo['ganho_bruto']
+        d_comb = resumo['despesa_combustivel']; d_alim = resumo['despesa_alimentacao']; d_manu = resumo['despesa_manutencao']
+        km = resumo['km_percorrido']; horas = resumo['horas_trabalhadas']
         
-        g_uber = to_dec(resumo_db[6]); g_99 = to_dec(resumo_db[7]); g_part = to_dec(resumo_db[8]); g_out = to_dec(resumo_db[9])
-        q_uber = int(resumo_db[10] or 0); q_99 = int(resumo_db[11] or 0); q_part = int(resumo_db[12] or 0); q_out = int(resumo_db[13] or 0)
-        dias_trabalhados = int(resumo_db[14] or 0)
+        g_uber = resumo['ganho_uber']; g_99 = resumo['ganho_99']; g_part = resumo['ganho_part']; g_out = resumo['ganho_outros']
+        q_uber = resumo['qtd_uber']; q_99 = resumo['qtd_99']; q_part = resumo['qtd_part']; q_out = resumo['qtd_outros']
+        dias_trabalhados = resumo['registros']
         
         despesa_var = d_comb + d_alim + d_manu; operacional = ganho - despesa_var
         dados_apps = [float(g_uber), float(g_99), float(g_part), float(g_out)]
@@ -201,14 +204,11 @@ def calculate_dashboard(user, start_date, end_date):
         
         lista_despesas = [{'nome':'Combustível','valor':float(d_comb),'cor':'#FFC107'}, {'nome':'Alimentação','valor':float(d_alim),'cor':'#FF5722'}, {'nome':'Manutenção','valor':float(d_manu),'cor':'#9E9E9E'}]
         dados_rosca = [d['valor'] for d in lista_despesas]
-    
-    soma_apps = {'Uber': 0, '99': 0, 'Particular': 0, 'Outros': 0}
-    if resumo_db and resumo_db[6] is not None:
-         soma_apps['Uber'] = resumo_db[6] or 0; soma_apps['99'] = resumo_db[7] or 0; soma_apps['Particular'] = resumo_db[8] or 0; soma_apps['Outros'] = resumo_db[9] or 0
+        soma_apps['Uber'] = g_uber; soma_apps['99'] = g_99; soma_apps['Particular'] = g_part; soma_apps['Outros'] = g_out
 
     domingo_atual, sabado_atual = get_current_week_range()
-    acumulado_semanal_db = db.session.query(func.sum(Diario.ganho_bruto) - func.sum(func.coalesce(Diario.despesa_combustivel, 0) + func.coalesce(Diario.despesa_alimentacao, 0) + func.coalesce(Diario.despesa_manutencao, 0))).filter(Diario.user_id == user.id, Diario.data >= domingo_atual, Diario.data <= sabado_atual).scalar()
-    lucro_semanal_acumulado = Decimal(str(acumulado_semanal_db)) if acumulado_semanal_db else Decimal('0.00')
+    semana = somar_periodo(user.id, domingo_atual, sabado_atual)
+    lucro_semanal_acumulado = semana['ganho_bruto'] - (semana['despesa_combustivel'] + semana['despesa_alimentacao'] + semana['despesa_manutencao'])
 
     odo_atual, lista_manutencao = get_maintenance_prediction(user)
     lista_manutencao_dash = lista_manutencao[:3]
@@ -220,8 +220,8 @@ def calculate_smart_goal(user, lucro_acumulado, meta_semanal, metricas):
     if meta_semanal <= 0: return {'status': 'sem_meta', 'msg': 'Defina sua meta semanal!'}
     
     hoje = get_brasilia_now().date()
-    ganho_hoje_res = db.session.query(func.sum(Diario.ganho_bruto), func.sum(Diario.despesa_combustivel + Diario.despesa_alimentacao + Diario.despesa_manutencao)).filter_by(user_id=user.id, data=hoje).first()
-    gh = float(ganho_hoje_res[0] or 0); dh = float(ganho_hoje_res[1] or 0); lucro_hoje = gh - dh
+    res_hoje = somar_periodo(user.id, hoje, hoje)
+    gh = float(res_hoje['ganho_bruto']); dh = float(res_hoje['despesa_combustivel'] + res_hoje['despesa_alimentacao'] + res_hoje['despesa_manutencao']); lucro_hoje = gh - dh
     
     acumulado_total = float(lucro_acumulado)
     acumulado_anterior = acumulado_total - lucro_hoje 
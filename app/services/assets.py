@@ -0,0 +1,123 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import mimetypes
+from flask import request, send_from_directory, url_for
+
+try: import brotli # opcional: sem o pacote só os .gz são gerados
+except ImportError: brotli = None
+
+# --- ESTÁTICOS COM HASH NO NOME ---
+# 'flask assets build' (ou a subida da app) copia cada arquivo de static/ para static/dist/ com o hash do
+# conteúdo no nome, grava as variantes .gz/.br e o manifest.json. url_for('static') resolve pelo manifesto
+# e o arquivo é servido pré-comprimido com cache imutável: só muda de URL o que mudou de conteúdo.
+DIST = 'dist'
+MANIFESTO = 'manifest.json'
+IGNORAR = {'sw.js', 'manifest.json'} # precisam de URL fixa (service worker e manifesto do PWA)
+COMPRIMIR = ('.css', '.js', '.json', '.svg', '.html', '.txt', '.map')
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+
+def _arquivos_fonte(static_folder):
+    for raiz, pastas, arquivos in os.walk(static_folder):
+        if os.path.relpath(raiz, static_folder).split(os.sep)[0] == DIST: pastas[:] = []; continue
+        for nome in arquivos:
+            rel = os.path.relpath(os.path.join(raiz, nome), static_folder).replace(os.sep, '/')
+            if rel not in IGNORAR and not nome.startswith('.'): yield rel
+
+def _nome_com_hash(rel, digest):
+    base, ext = os.path.splitext(rel)
+    return f"{DIST}/{base}.{digest[:10]}{ext}"
+
+def build_assets(static_folder):
+    """Gera static/dist/ (arquivos com hash + .gz/.br) e o manifesto. Retorna o manifesto."""
+    dist = os.path.join(static_folder, DIST)
+    arquivos, comprimidos = {}, {}
+    for rel in sorted(_arquivos_fonte(static_folder)):
+        with open(os.path.join(static_folder, rel), 'rb') as f: conteudo = f.read()
+        destino = _nome_com_hash(rel, hashlib.sha256(conteudo).hexdigest())
+        arquivos[rel] = destino
+        caminho = os.path.join(static_folder, destino)
+        if not os.path.exists(caminho):
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, 'wb') as f: f.write(conteudo)
+        if not rel.endswith(COMPRIMIR): continue
+        variantes = []
+        if brotli:
+            if not os.path.exists(caminho + '.br'):
+                with open(caminho + '.br', 'wb') as f: f.write(brotli.compress(conteudo, quality=11))
+            variantes.append('br')
+        if not os.path.exists(caminho + '.gz'):
+            with open(caminho + '.gz', 'wb') as f: f.write(gzip.compress(conteudo, 9, mtime=0))
+        variantes.append('gzip')
+        comprimidos[destino] = variantes
+    versao = hashlib.sha256(json.dumps(arquivos, sort_keys=True).encode()).hexdigest()[:12]
+    manifesto = {'versao': versao, 'arquivos': arquivos, 'comprimidos': comprimidos}
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFESTO), 'w') as f: json.dump(manifesto, f, indent=2, sort_keys=True)
+    return manifesto
+
+def carregar_manifesto(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFESTO)) as f: return json.load(f)
+    except (OSError, ValueError): return None
+
+def _desatualizado(static_folder, manifesto):
+    """Algum arquivo de static/ foi criado ou alterado depois do último build?"""
+    if not manifesto: return True
+    fontes = set(_arquivos_fonte(static_folder))
+    if fontes != set(manifesto.get('arquivos', {})): return True
+    gerado_em = os.path.getmtime(os.path.join(static_folder, DIST, MANIFESTO))
+    return any(os.path.getmtime(os.path.join(static_folder, rel)) > gerado_em for rel in fontes)
+
+def registrar_assets(app):
+    """Liga o manifesto ao url_for('static'), à rota de estáticos e ao /sw.js."""
+    static_folder = app.static_folder
+    manifesto = carregar_manifesto(static_folder)
+    if app.config.get('ASSETS_AUTO_BUILD', True) and not app.testing:
+        try:
+            if _desatualizado(static_folder, manifesto): manifesto = build_assets(static_folder)
+        except OSError as e: app.logger.error(f"Erro build de estáticos: {e}")
+    app.extensions['assets_manifesto'] = manifesto or {'versao': None, 'arquivos': {}, 'comprimidos': {}}
+
+    @app.url_defaults
+    def hashed_url_for_static_file(endpoint, values):
+        if 'static' == endpoint or endpoint.endswith('.static'):
+            filename = values.get('filename')
+            if not filename: return
+            hashed = app.extensions['assets_manifesto']['arquivos'].get(filename)
+            if hashed: values['filename'] = hashed; return
+            # Fora do manifesto (sem build): cache busting pela versão da app
+            param_name = 'v'
+            while param_name in values:
+                param_name = '_' + param_name
+            values[param_name] = app.config['APP_VERSION']
+
+    def static(filename):
+        if not filename.startswith(DIST + '/'): return app.send_static_file(filename)
+        variantes = app.extensions['assets_manifesto']['comprimidos'].get(filename, ())
+        for encoding, ext in (('br', '.br'), ('gzip', '.gz')):
+            if encoding in variantes and request.accept_encodings[encoding]:
+                response = send_from_directory(static_folder, filename + ext, mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else: response = app.send_static_file(filename)
+        response.headers['Cache-Control'] = CACHE_IMUTAVEL
+        response.vary.add('Accept-Encoding')
+        return response
+    app.view_functions['static'] = static
+
+_sw_cache = {}
+
+def service_worker_js(app):
+    """sw.js com o nome do cache e a lista de precache vindos do manifesto (gerado uma vez por versão)."""
+    manifesto = app.extensions.get('assets_manifesto') or {}
+    versao = manifesto.get('versao') or app.config['APP_VERSION']
+    if versao not in _sw_cache:
+        with open(os.path.join(app.static_folder, 'sw.js'), encoding='utf-8') as f: texto = f.read()
+        locais = [url_for('static', filename=rel) for rel in sorted(manifesto.get('arquivos', {})) if rel.endswith(('.css', '.js', '.png', '.svg', '.webp'))]
+        texto = re.sub(r"^const CACHE_NAME = .*$", f"const CACHE_NAME = 'motoristapro-{versao}';", texto, count=1, flags=re.M)
+        if locais: texto = re.sub(r"^const PRECACHE_LOCAL = .*$", f"const PRECACHE_LOCAL = {json.dumps(locais)};", texto, count=1, flags=re.M)
+        _sw_cache[versao] = texto
+    return _sw_cache[versao]
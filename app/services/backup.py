@@ -0,0 +1,383 @@
+import io
+import csv
+import gzip
+import json
+import time
+import zipfile
+import zlib
+from datetime import datetime, date
+from decimal import Decimal
+from sqlalchemy import select, bindparam, text
+from app.extensions import db
+from app.models import User, Diario, Agendamentos, Manutencao, Config, SupportTicket, TicketMessage
+
+# Arquivos do backup global na ordem de restauração (pais antes dos filhos)
+ARQUIVOS_BACKUP = [('users.csv', User), ('configs.csv', Config), ('manutencao.csv', Manutencao), ('agendamentos.csv', Agendamentos), ('diarios.csv', Diario), ('tickets.csv', SupportTicket), ('tickets_msg.csv', TicketMessage)]
+LOTE_BACKUP = 1000 # linhas por ida ao cursor do banco / por pedaço enviado
+
+class ZipStream:
+    """Destino "não seekable" para o ZipFile: acumula o que foi escrito até o próximo drain().
+
+    Sem seek() o zipfile grava cada arquivo com data descriptor, então o ZIP pode ser enviado
+    em pedaços enquanto é gerado.
+    """
+    def __init__(self):
+        self._partes = []; self._pos = 0
+    def write(self, data):
+        self._partes.append(bytes(data)); self._pos += len(data)
+        return len(data)
+    def tell(self): return self._pos
+    def flush(self): pass
+    def drain(self):
+        dados = b''.join(self._partes); self._partes = []
+        return dados
+
+def _valor_csv(v):
+    return str(v) if v is not None else ''
+
+def gerar_backup_zip(app_version=None):
+    """Gera o ZIP do backup global em pedaços de bytes (memória constante).
+
+    Cada tabela é lida com yield_per (cursor no servidor) e escrita direto no arquivo do ZIP;
+    no final entra um manifest.json com a contagem de linhas de cada arquivo.
+    """
+    buf = ZipStream()
+    manifesto = {'gerado_em': datetime.now().isoformat(timespec='seconds'), 'app_version': app_version, 'arquivos': {}}
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for filename, model_class in ARQUIVOS_BACKUP:
+            tabela = model_class.__table__
+            columns = [c.name for c in tabela.columns]
+            total = 0
+            with zf.open(filename, 'w', force_zip64=True) as destino:
+                texto = io.TextIOWrapper(destino, encoding='utf-8', newline='')
+                cw = csv.writer(texto); cw.writerow(columns)
+                for row in db.session.execute(select(tabela).order_by(*tabela.primary_key.columns).execution_options(yield_per=LOTE_BACKUP)):
+                    cw.writerow([_valor_csv(v) for v in row]); total += 1
+                    if total % LOTE_BACKUP == 0:
+                        texto.flush()
+                        yield buf.drain()
+                texto.flush(); texto.detach()
+            manifesto['arquivos'][filename] = total
+            yield buf.drain()
+        zf.writestr('manifest.json', json.dumps(manifesto, ensure_ascii=False, indent=2))
+    yield buf.drain()
+
+# --- EXPORTAÇÃO DO USUÁRIO (JSON em streaming) ---
+EXPORT_SCHEMA = 2 # 1 = arquivo antigo sem "schema_version" (json.dumps de tudo de uma vez)
+EXPORT_TABELAS = [('diarios', Diario), ('manutencao', Manutencao), ('configs', Config)]
+
+def _json(v):
+    return json.dumps(v, ensure_ascii=False, default=str)
+
+def _linha_dict(row):
+    return {k: (str(v) if isinstance(v, (datetime, date)) else v) for k, v in row._mapping.items()}
+
+def gerar_export_json(user):
+    """Backup do usuário em pedaços de texto JSON, lido das tabelas com yield_per (memória constante).
+
+    O primeiro campo é "schema_version", para o importar_dados reconhecer o formato antes do resto.
+    """
+    dados_user = user.to_dict(); dados_user.pop('password_hash', None)
+    yield '{"schema_version": %d, "gerado_em": %s, "user": %s' % (EXPORT_SCHEMA, _json(datetime.now().isoformat(timespec='seconds')), _json(dados_user))
+    for chave, model_class in EXPORT_TABELAS:
+        tabela = model_class.__table__
+        yield ', %s: [' % _json(chave)
+        partes = []; primeiro = True
+        for row in db.session.execute(select(tabela).where(tabela.c.user_id == user.id).order_by(tabela.c.id).execution_options(yield_per=LOTE_BACKUP)):
+            partes.append(('\n' if primeiro else ',\n') + _json(_linha_dict(row))); primeiro = False
+            if len(partes) >= LOTE_BACKUP: yield ''.join(partes); partes = []
+        yield ''.join(partes) + ']'
+    yield '}\n'
+
+def gzip_stream(pedacos, nivel=6):
+    """Comprime um gerador de texto/bytes em gzip sem juntar tudo na memória."""
+    z = zlib.compressobj(nivel, zlib.DEFLATED, 31) # wbits 31 = cabeçalho gzip
+    for p in pedacos:
+        dados = z.compress(p.encode('utf-8') if isinstance(p, str) else p)
+        if dados: yield dados
+    yield z.flush()
+
+def abrir_export(arquivo):
+    """Texto do backup do usuário a partir do upload (JSON puro ou .gz detectado pelo cabeçalho)."""
+    inicio = arquivo.read(2); arquivo.seek(0)
+    if inicio == b'\x1f\x8b': arquivo = gzip.GzipFile(fileobj=arquivo)
+    return io.TextIOWrapper(arquivo, encoding='utf-8')
+
+class LeitorJson:
+    """Leitor incremental do objeto JSON do backup: campos simples inteiros e listas item a item.
+
+    Lê o arquivo em blocos e usa raw_decode em cada valor, então a memória fica no tamanho de um item
+    (sem dependência externa). Gera ('campo', chave, valor) e ('item', chave, valor).
+    """
+    BLOCO = 64 * 1024
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, texto):
+        self.texto = texto; self.buf = ''; self.pos = 0; self.fim = False
+
+    def _ler(self):
+        if self.fim: return False
+        bloco = self.texto.read(self.BLOCO)
+        if not bloco: self.fim = True; return False
+        self.buf = self.buf[self.pos:] + bloco; self.pos = 0
+        return True
+
+    def _proximo(self):
+        """Próximo caractere não branco (sem consumir)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n': self.pos += 1
+            if self.pos < len(self.buf): return self.buf[self.pos]
+            if not self._ler(): raise ValueError("JSON incompleto.")
+
+    def _esperar(self, *chars):
+        c = self._proximo()
+        if c not in chars: raise ValueError(f"JSON inválido: esperado {' ou '.join(chars)} na posição {self.pos}.")
+        self.pos += 1
+        return c
+
+    def _valor(self):
+        self._proximo()
+        while True:
+            try:
+                valor, fim = self._decoder.raw_decode(self.buf, self.pos)
+                # Número no fim do bloco pode estar cortado: só aceita se houver mais texto ou acabou o arquivo
+                if fim < len(self.buf) or self.fim: self.pos = fim; return valor
+            except json.JSONDecodeError:
+                if self.fim: raise ValueError("JSON inválido.")
+            self._ler()
+
+    def eventos(self):
+        self._esperar('{')
+        if self._proximo() == '}': return
+        while True:
+            chave = self._valor()
+            self._esperar(':')
+            if self._proximo() == '[':
+                self.pos += 1
+                if self._proximo() == ']': self.pos += 1
+                else:
+                    while True:
+                        yield 'item', chave, self._valor()
+                        if self._esperar(',', ']') == ']': break
+            else: yield 'campo', chave, self._valor()
+            if self._esperar(',', '}') == '}': return
+
+# --- IMPORTAÇÃO DO USUÁRIO EM LOTES ---
+IMPORT_TABELAS = {'diarios': Diario, 'manutencao': Manutencao, 'configs': Config}
+IMPORT_CAMPOS = {
+    Diario: ('data', 'ganho_bruto', 'ganho_uber', 'ganho_99', 'ganho_part', 'ganho_outros', 'despesa_combustivel', 'despesa_alimentacao', 'despesa_manutencao', 'qtd_uber', 'qtd_99', 'qtd_part', 'qtd_outros', 'km_percorrido', 'horas_trabalhadas'),
+    Manutencao: ('item', 'km_troca', 'km_proxima', 'status'),
+    Config: ('chave', 'valor'),
+}
+
+def _conversores(model_class):
+    """(campo, função) por coluna, montado uma vez por tabela em vez de decidir o tipo a cada valor."""
+    from app.utils import safe_money
+    def data(v): return date.fromisoformat(str(v)[:10])
+    def inteiro(v): return int(float(v)) if v not in (None, '') else None
+    def real(v): return float(v) if v not in (None, '') else None
+    conv = []
+    for campo in IMPORT_CAMPOS[model_class]:
+        t = model_class.__table__.c[campo].type
+        if isinstance(t, db.Date): f = data
+        elif isinstance(t, db.Numeric): f = safe_money
+        elif isinstance(t, db.Integer): f = inteiro
+        elif isinstance(t, db.Float): f = real
+        else: f = lambda v: v
+        conv.append((campo, f))
+    return conv
+
+def _inserir_lote(model_class, chave, linhas, n_lote, relatorio):
+    try:
+        with db.session.begin_nested():
+            db.session.bulk_insert_mappings(model_class, linhas)
+        relatorio['importados'][chave] = relatorio['importados'].get(chave, 0) + len(linhas)
+    except Exception as e:
+        relatorio['ignorados'] += len(linhas)
+        relatorio['erros'].append(f"{chave} lote {n_lote}: {len(linhas)} linha(s) não gravadas ({str(e).splitlines()[0][:150]})")
+
+def importar_export_json(user, arquivo, lote=500):
+    """Substitui os dados do usuário pelo backup (JSON/.gz) lendo o arquivo de forma incremental.
+
+    Cada lista é convertida e validada em lotes e gravada com bulk_insert_mappings (executemany) num
+    savepoint por lote; linhas inválidas e lotes com erro vão para o relatório. Não faz commit.
+    ValueError se o schema for mais novo que EXPORT_SCHEMA ou o JSON for inválido.
+    """
+    inicio = time.monotonic()
+    relatorio = {'schema_version': 1, 'importados': {}, 'ignorados': 0, 'lotes': 0, 'erros': []}
+    conversores = {m: _conversores(m) for m in IMPORT_CAMPOS}
+    apagado = False; pendentes = {}
+    def apagar():
+        for m in (Diario, Agendamentos, Manutencao, Config): m.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+    def gravar(chave):
+        relatorio['lotes'] += 1
+        _inserir_lote(IMPORT_TABELAS[chave], chave, pendentes.pop(chave), relatorio['lotes'], relatorio)
+
+    for tipo, chave, valor in LeitorJson(abrir_export(arquivo)).eventos():
+        if tipo == 'campo':
+            if chave == 'schema_version':
+                relatorio['schema_version'] = int(valor or 1)
+                if relatorio['schema_version'] > EXPORT_SCHEMA: raise ValueError(f"Backup com schema {valor} (suportado até {EXPORT_SCHEMA}).")
+            elif chave == 'user' and isinstance(valor, dict):
+                if 'nome' in valor: user.nome = valor['nome']
+                if 'whatsapp' in valor: user.whatsapp = valor['whatsapp']
+            continue
+        if chave not in IMPORT_TABELAS or not isinstance(valor, dict): continue
+        if not apagado: apagar(); apagado = True
+        try: linha = {campo: f(valor.get(campo)) for campo, f in conversores[IMPORT_TABELAS[chave]]}
+        except (ValueError, TypeError, ArithmeticError) as e:
+            relatorio['ignorados'] += 1
+            if len(relatorio['erros']) < 20: relatorio['erros'].append(f"{chave}: linha inválida ({e})")
+            continue
+        linha['user_id'] = user.id
+        pendentes.setdefault(chave, []).append(linha)
+        if len(pendentes[chave]) >= lote: gravar(chave)
+    for chave in list(pendentes): gravar(chave)
+    if not apagado: apagar() # backup sem listas: fica igual ao arquivo (vazio), como antes
+
+    # bulk_insert_mappings e o delete em massa não passam pelos eventos do ORM: recria os derivados
+    from app.utils import bump_config_version
+    from app.services.rollups import rebuild_rollups
+    from app.services.user_stats import rebuild_user_stats
+    rebuild_rollups(user.id); rebuild_user_stats(user.id); bump_config_version(user.id)
+    relatorio['segundos'] = round(time.monotonic() - inicio, 2)
+    return relatorio
+
+# --- RESTAURAÇÃO EM LOTES ---
+def _tipar(coluna, v):
+    """Converte o texto do CSV para o tipo da coluna ('' vira None)."""
+    if v is None or v == '': return None
+    t = coluna.type
+    if isinstance(t, db.Boolean): return v.strip().lower() == 'true'
+    if isinstance(t, db.DateTime): return datetime.fromisoformat(v)
+    if isinstance(t, db.Date): return date.fromisoformat(v[:10])
+    if isinstance(t, db.Integer): return int(float(v))
+    if isinstance(t, db.Float): return float(v)
+    if isinstance(t, db.Numeric): return Decimal(v)
+    return v
+
+def _existentes(model_class, linhas):
+    """Resolve quais linhas já existem com uma consulta IN por chave (id, e email / (user_id, chave) como alternativa)."""
+    tabela = model_class.__table__
+    ids = [l['id'] for l in linhas if l.get('id') is not None]
+    existentes = {pk for (pk,) in db.session.execute(select(tabela.c.id).where(tabela.c.id.in_(ids)))} if ids else set()
+    sem_id = [l for l in linhas if l.get('id') not in existentes]
+    if model_class is User and sem_id:
+        emails = [l['email'] for l in sem_id if l.get('email')]
+        por_email = dict(db.session.execute(select(tabela.c.email, tabela.c.id).where(tabela.c.email.in_(emails))).all()) if emails else {}
+        for l in sem_id:
+            if l.get('email') in por_email: l['id'] = por_email[l['email']]; existentes.add(l['id'])
+    elif model_class is Config and sem_id:
+        uids = list({l['user_id'] for l in sem_id if l.get('user_id') is not None})
+        por_chave = {(u, c): i for i, u, c in db.session.execute(select(tabela.c.id, tabela.c.user_id, tabela.c.chave).where(tabela.c.user_id.in_(uids)))} if uids else {}
+        for l in sem_id:
+            i = por_chave.get((l.get('user_id'), l.get('chave')))
+            if i is not None: l['id'] = i; existentes.add(i)
+    return existentes
+
+def _gravar_lote(model_class, linhas):
+    """Um lote: resolve existentes, UPDATE em executemany e INSERT em executemany. Retorna (inseridos, atualizados)."""
+    tabela = model_class.__table__
+    existentes = _existentes(model_class, linhas)
+    atualizar = [l for l in linhas if l.get('id') in existentes]
+    inserir = [l for l in linhas if l.get('id') not in existentes]
+    if atualizar:
+        stmt = tabela.update().where(tabela.c.id == bindparam('_pk'))
+        for chaves, grupo in _por_chaves(atualizar):
+            db.session.execute(stmt, [dict({k: l[k] for k in chaves if k != 'id'}, _pk=l['id']) for l in grupo])
+    if inserir:
+        inserir = [{k: v for k, v in l.items() if not (k == 'id' and v is None)} for l in inserir] # sem id: usa o autoincremento
+        for _, grupo in _por_chaves(inserir): db.session.execute(tabela.insert(), grupo)
+    return len(inserir), len(atualizar)
+
+def _por_chaves(linhas):
+    # executemany exige o mesmo conjunto de colunas em todas as linhas
+    grupos = {}
+    for l in linhas: grupos.setdefault(tuple(sorted(l)), []).append(l)
+    return grupos.items()
+
+def _processar_lote(model_class, linhas, relatorio, erros):
+    try:
+        with db.session.begin_nested():
+            ins, upd = _gravar_lote(model_class, linhas)
+        relatorio['inseridos'] += ins; relatorio['atualizados'] += upd
+    except Exception:
+        # Lote com erro: refaz linha a linha para pular só as linhas problemáticas
+        for l in linhas:
+            try:
+                with db.session.begin_nested():
+                    ins, upd = _gravar_lote(model_class, [l])
+                relatorio['inseridos'] += ins; relatorio['atualizados'] += upd
+            except Exception as e:
+                relatorio['ignorados'] += 1
+                if len(erros) < 20: erros.append(f"{model_class.__tablename__} id={l.get('id')}: {str(e).splitlines()[0][:200]}")
+
+def _ajustar_sequencias():
+    """Postgres: após inserir ids explícitos, avança as sequences para o MAX(id) de cada tabela."""
+    if db.engine.dialect.name != 'postgresql': return
+    for _, model_class in ARQUIVOS_BACKUP:
+        t = model_class.__tablename__
+        db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{t}\"', 'id'), COALESCE((SELECT MAX(id) FROM \"{t}\"), 1))"))
+
+def _recalcular_derivados(relatorio, configs_alterados, tudo=False):
+    """Escritas em massa não passam pelos listeners do ORM: recalcula os derivados. Não faz commit."""
+    from app.utils import bump_config_version
+    from app.services.rollups import rebuild_rollups
+    from app.services.user_stats import rebuild_all_user_stats
+    from app.services.notifications import reconciliar_nao_lidas
+    from app.services.dashboard_cache import bump_data_version
+    for uid in configs_alterados: bump_config_version(uid)
+    if tudo or any(relatorio['arquivos'].get(n) for n in ('diarios.csv', 'agendamentos.csv')):
+        rebuild_rollups(); rebuild_all_user_stats()
+    reconciliar_nao_lidas() # users.csv traz o contador do banco de origem
+    bump_data_version() # manutencao.csv / configs.csv também entram no dashboard
+    _ajustar_sequencias()
+
+def restaurar_backup_zip(arquivo, lote=500, commit_a_cada=10):
+    """Restaura um ZIP do backup global lendo cada CSV em streaming e gravando em lotes.
+
+    arquivo: caminho ou arquivo seekable (o upload já vem em disco/spool, não é lido inteiro para a memória).
+    commit_a_cada: commit a cada N lotes (0 = tudo numa transação). Os derivados (buckets, UserStats,
+    contadores, sequences) são recalculados no final, e também quando uma falha chega depois de lotes já commitados. Retorna o relatório por arquivo com inseridos/atualizados/ignorados.
+    """
+    inicio = time.monotonic()
+    relatorio = {'arquivos': {}, 'erros': [], 'inseridos': 0, 'atualizados': 0, 'ignorados': 0}
+    lotes = 0; configs_alterados = set(); comitados = False
+    try:
+        with zipfile.ZipFile(arquivo) as zf:
+            nomes = set(zf.namelist())
+            for filename, model_class in ARQUIVOS_BACKUP:
+                if filename not in nomes: continue
+                colunas = {c.name: c for c in model_class.__table__.columns}
+                rel = relatorio['arquivos'][filename] = {'inseridos': 0, 'atualizados': 0, 'ignorados': 0}
+                with zf.open(filename) as f:
+                    pendentes = []
+                    for row in csv.DictReader(io.TextIOWrapper(f, encoding='utf-8', newline='')):
+                        try: linha = {k: _tipar(colunas[k], v) for k, v in row.items() if k in colunas}
+                        except (ValueError, ArithmeticError) as e:
+                            rel['ignorados'] += 1
+                            if len(relatorio['erros']) < 20: relatorio['erros'].append(f"{filename} id={row.get('id')}: {e}")
+                            continue
+                        if model_class is Config and linha.get('user_id'): configs_alterados.add(linha['user_id'])
+                        pendentes.append(linha)
+                        if len(pendentes) >= lote:
+                            _processar_lote(model_class, pendentes, rel, relatorio['erros']); pendentes = []; lotes += 1
+                            if commit_a_cada and lotes % commit_a_cada == 0: db.session.commit(); comitados = True
+                    if pendentes: _processar_lote(model_class, pendentes, rel, relatorio['erros']); lotes += 1
+                for k in ('inseridos', 'atualizados', 'ignorados'): relatorio[k] += rel[k]
+
+        _recalcular_derivados(relatorio, configs_alterados)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if comitados:
+            # Lotes já commitados ficaram no banco: recalcula os derivados mesmo assim (e ajusta as sequences)
+            try:
+                _recalcular_derivados(relatorio, configs_alterados, tudo=True); db.session.commit()
+            except Exception as e:
+                db.session.rollback(); print(f"Erro ao recalcular derivados após falha no restore: {e}")
+        raise
+    duracao = time.monotonic() - inicio
+    total = relatorio['inseridos'] + relatorio['atualizados'] + relatorio['ignorados']
+    relatorio.update(lotes=lotes, segundos=round(duracao, 2), linhas_por_segundo=int(total / duracao) if duracao > 0 else total)
+    return relatorio
@@ -0,0 +1,164 @@
+import json
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, distinct
+from app.extensions import db
+from app.models import User, Diario, UserStats, BusinessSnapshot
+
+# --- PAINEL EXECUTIVO (BI) ---
+# As agregações sobre todas as tabelas rodam aqui, num job (flask business snapshot / botão "Atualizar agora"),
+# e o /admin/business só lê o snapshot mais recente.
+PRICE_BASIC = 9.90
+PRICE_PREMIUM = 19.90
+TAXA_MEDIA = 0.04
+HISTORICO_GRAFICO = 30 # snapshots exibidos no gráfico de tendência
+
+def calcular_metricas():
+    """Calcula todas as métricas do painel. Retorna um dict com os campos do BusinessSnapshot + 'detalhes'."""
+    # 1. Métricas Gerais (Usando agregadores SQL)
+    metrics = db.session.query(
+        func.sum(Diario.ganho_bruto),
+        func.sum(Diario.km_percorrido),
+        func.sum(Diario.despesa_combustivel + Diario.despesa_manutencao)
+    ).first()
+
+    total_faturamento_app = metrics[0] or 0
+    total_km_rodados = metrics[1] or 1
+    total_despesas = metrics[2] or 0
+
+    media_reais_km = float(total_faturamento_app) / float(total_km_rodados)
+    custo_medio_km = float(total_despesas) / float(total_km_rodados)
+
+    # 2. Análise de Assinantes (Otimizada)
+    hoje = datetime.now().date()
+    hoje_str = hoje.strftime('%Y-%m-%d')
+
+    # Subquery para contar tipos de plano diretamente no banco
+    subs_stats = db.session.query(
+        User.plan_type,
+        User.payment_method,
+        User.referral_balance,
+        func.count(User.id)
+    ).filter(
+        User.category == 'subscriber',
+        User.validade >= hoje_str
+    ).group_by(User.plan_type, User.payment_method, User.referral_balance).all()
+
+    count_basic = 0
+    count_premium = 0
+    mrr_basic_bruto = 0.0
+    mrr_premium_bruto = 0.0
+    subs_card = 0
+    subs_pix = 0
+
+    # Itera sobre os GRUPOS, não sobre os usuários individuais (Escala infinita)
+    for plano, metodo, saldo_ref, qtd in subs_stats:
+        # Método
+        if metodo == 'card': subs_card += qtd
+        else: subs_pix += qtd
+
+        # Valor base
+        valor_base = PRICE_BASIC if plano == 'basic' else PRICE_PREMIUM
+
+        # Desconto
+        valor_final = (valor_base / 2) if (saldo_ref or 0) > 0 else valor_base
+
+        if plano == 'basic':
+            count_basic += qtd
+            mrr_basic_bruto += (valor_final * qtd)
+        else:
+            count_premium += qtd
+            mrr_premium_bruto += (valor_final * qtd)
+
+    # 3. Cálculo de Taxas
+    mrr_basic_liq = mrr_basic_bruto * (1 - TAXA_MEDIA)
+    mrr_premium_liq = mrr_premium_bruto * (1 - TAXA_MEDIA)
+    mrr_total_liquido = mrr_basic_liq + mrr_premium_liq
+    arr_projetado = mrr_total_liquido * 12
+
+    # 4. Métricas de Engajamento
+    dau = db.session.query(func.count(distinct(Diario.user_id))).filter(Diario.data == hoje).scalar() or 0
+    mau = db.session.query(func.count(distinct(Diario.user_id))).filter(Diario.data >= (hoje - timedelta(days=30))).scalar() or 0
+    stickiness = (dau / mau) * 100 if mau else 0.0
+
+    # LTV
+    total_active = count_basic + count_premium
+    ticket_medio = (mrr_total_liquido / total_active) if total_active > 0 else 0
+    ltv = ticket_medio * 6
+
+    # Risco de Churn (Simplificado para performance)
+    data_limite_risco = hoje - timedelta(days=7)
+    # Subquery para pegar última atividade de cada usuário
+    last_seen = db.session.query(
+        Diario.user_id,
+        func.max(Diario.data).label('max_date')
+    ).group_by(Diario.user_id).subquery()
+
+    # Usuários ativos que não têm diário recente ou nunca tiveram
+    qtd_risco = db.session.query(func.count(User.id)).outerjoin(
+        last_seen, User.id == last_seen.c.user_id
+    ).filter(
+        User.category == 'subscriber',
+        (last_seen.c.max_date < data_limite_risco) | (last_seen.c.max_date == None)
+    ).scalar() or 0
+
+    # Ranking lido do UserStats (índice em total_faturamento) em vez de agrupar todo o Diario
+    top_users = db.session.query(User.nome, User.email, UserStats.total_faturamento, UserStats.total_registros).join(UserStats, UserStats.user_id == User.id).filter(UserStats.total_registros > 0).order_by(UserStats.total_faturamento.desc()).limit(5).all()
+
+    share = db.session.query(func.sum(Diario.ganho_uber), func.sum(Diario.ganho_99), func.sum(Diario.ganho_part), func.sum(Diario.ganho_outros)).first()
+    share_data = [float(x or 0) for x in share] if share else [0,0,0,0]
+
+    # Crescimento (últimos 15 dias)
+    users_last_15 = db.session.query(
+        func.date(User.data_cadastro),
+        func.count(User.id)
+    ).filter(User.data_cadastro >= (hoje - timedelta(days=15)))\
+     .group_by(func.date(User.data_cadastro)).all()
+
+    # Popula o dicionário
+    map_growth = {str(d): c for d, c in users_last_15}
+
+    labels_growth = []
+    values_growth = []
+    for i in range(15, -1, -1):
+        d_obj = hoje - timedelta(days=i)
+        labels_growth.append(d_obj.strftime('%d/%m'))
+        values_growth.append(map_growth.get(d_obj.strftime('%Y-%m-%d'), 0))
+
+    return {
+        'mrr_liquido': mrr_total_liquido, 'mrr_basic': mrr_basic_liq, 'mrr_premium': mrr_premium_liq, 'arr': arr_projetado, 'ltv': ltv,
+        'count_basic': count_basic, 'count_premium': count_premium, 'subs_card': subs_card, 'subs_pix': subs_pix,
+        'qtd_risco': qtd_risco, 'dau': dau, 'mau': mau, 'stickiness': stickiness,
+        'media_reais_km': media_reais_km, 'custo_medio_km': custo_medio_km,
+        'detalhes': {
+            'share_data': share_data,
+            'top_users': [{'nome': n, 'email': e, 'total_ganho': float(g or 0), 'dias_uso': int(d or 0)} for n, e, g, d in top_users],
+            'growth_labels': labels_growth, 'growth_values': values_growth,
+        },
+    }
+
+def gerar_snapshot(origem='cli'):
+    """Calcula e grava um novo BusinessSnapshot (mantém os anteriores). Faz commit."""
+    inicio = time.monotonic()
+    try:
+        metricas = calcular_metricas()
+        detalhes = metricas.pop('detalhes')
+        snap = BusinessSnapshot(origem=origem, detalhes=json.dumps(detalhes), duracao_ms=int((time.monotonic() - inicio) * 1000), **metricas)
+        db.session.add(snap); db.session.commit()
+        return snap
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro BusinessSnapshot: {e}")
+        raise
+
+def snapshots_recentes(limite=HISTORICO_GRAFICO):
+    """Os últimos snapshots, do mais recente para o mais antigo (uma consulta)."""
+    return BusinessSnapshot.query.order_by(BusinessSnapshot.criado_em.desc(), BusinessSnapshot.id.desc()).limit(limite).all()
+
+def contexto_snapshot(snap):
+    """Variáveis do template admin_business.html a partir de um snapshot."""
+    try: detalhes = json.loads(snap.detalhes or '{}')
+    except: detalhes = {}
+    ctx = {c: getattr(snap, c) for c in ('mrr_liquido', 'mrr_basic', 'mrr_premium', 'arr', 'ltv', 'count_basic', 'count_premium', 'subs_card', 'subs_pix', 'qtd_risco', 'stickiness', 'media_reais_km', 'custo_medio_km')}
+    ctx.update(share_data=detalhes.get('share_data', [0, 0, 0, 0]), top_users=detalhes.get('top_users', []), growth_labels=detalhes.get('growth_labels', []), growth_values=detalhes.get('growth_values', []))
+    return ctx
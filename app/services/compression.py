@@ -0,0 +1,70 @@
+import zlib
+from flask import request
+
+try: import brotli # opcional: sem o pacote só gzip
+except ImportError: brotli = None
+
+# --- COMPRESSÃO DAS RESPOSTAS (HTML, partials HTMX, JSON) ---
+# after_request que comprime conforme o Accept-Encoding. Respostas em streaming são comprimidas pedaço a
+# pedaço (sync flush), então continuam chegando aos poucos. Ficam de fora: respostas pequenas, já
+# comprimidas, arquivos do send_file (direct_passthrough) e views marcadas com @sem_compressao.
+TIPOS_COMPRIMIVEIS = {'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml'}
+
+def sem_compressao(view):
+    """Marca a view para nunca ser comprimida (webhooks, downloads). Usar abaixo do @bp.route."""
+    view.sem_compressao = True
+    return view
+
+def _codificacao():
+    aceitas = request.accept_encodings
+    if brotli and aceitas['br']: return 'br'
+    if aceitas['gzip']: return 'gzip'
+    return None
+
+def _compressor(encoding, app):
+    """(comprimir(bytes), finalizar()) para o encoding escolhido."""
+    if encoding == 'br':
+        c = brotli.Compressor(quality=app.config.get('COMPRESS_BR_QUALIDADE', 5))
+        return (lambda dados: c.process(dados) + c.flush()), c.finish
+    c = zlib.compressobj(app.config.get('COMPRESS_NIVEL', 6), zlib.DEFLATED, 31) # wbits 31 = gzip
+    return (lambda dados: c.compress(dados) + c.flush(zlib.Z_SYNC_FLUSH)), c.flush
+
+def _stream(pedacos, encoding, app):
+    comprimir, finalizar = _compressor(encoding, app)
+    try:
+        for p in pedacos:
+            dados = comprimir(p.encode('utf-8') if isinstance(p, str) else p)
+            if dados: yield dados
+        yield finalizar()
+    finally:
+        if hasattr(pedacos, 'close'): pedacos.close()
+
+def _marcar_etag(response, encoding):
+    # Representação comprimida tem outra ETag forte (mesmo sufixo que o etag_condicional aceita)
+    etag, fraca = response.get_etag()
+    if etag and not fraca and not etag.endswith(('-gzip', '-br')): response.set_etag(f"{etag}-{encoding}")
+
+def registrar_compressao(app):
+    @app.after_request
+    def comprimir_resposta(response):
+        if not app.config.get('COMPRESS_ENABLED', True) or request.method == 'HEAD': return response
+        view = app.view_functions.get(request.endpoint)
+        if getattr(view, 'sem_compressao', False) or response.direct_passthrough: return response
+        if response.mimetype not in TIPOS_COMPRIMIVEIS or 'Content-Encoding' in response.headers: return response
+        encoding = _codificacao()
+        response.vary.add('Accept-Encoding')
+        if not encoding: return response
+        if response.status_code == 304: _marcar_etag(response, encoding); return response
+        if response.status_code < 200 or response.status_code == 204: return response
+
+        if response.is_streamed:
+            response.response = _stream(response.response, encoding, app)
+            response.headers.pop('Content-Length', None)
+        else:
+            dados = response.get_data()
+            if len(dados) < app.config.get('COMPRESS_MIN_SIZE', 500): return response
+            comprimir, finalizar = _compressor(encoding, app)
+            response.set_data(comprimir(dados) + finalizar())
+        response.headers['Content-Encoding'] = encoding
+        _marcar_etag(response, encoding)
+        return response
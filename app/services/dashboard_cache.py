@@ -0,0 +1,62 @@
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import User, Diario, Config, Manutencao
+from app.utils import LRUCache
+
+# --- CACHE DO DASHBOARD ---
+# User.data_version sobe a cada escrita em Diario/Config/Manutencao (mesma transação).
+# O payload calculado do dashboard fica num LRU por processo com a versão na chave: trocar de
+# período e voltar, ou recarregar o PWA, não recalcula nada enquanto os dados não mudarem.
+VERSIONADOS = (Diario, Config, Manutencao)
+_user = User.__table__
+_payloads = LRUCache(maxsize=1024)
+
+def bump_data_version(user_ids=None, executor=None):
+    """Invalida os payloads do(s) usuário(s) (None = todos). Chamar após escritas em massa. Não faz commit."""
+    q = _user.update().values(data_version=func.coalesce(_user.c.data_version, 0) + 1)
+    if user_ids is not None:
+        user_ids = [u for u in user_ids if u]
+        if not user_ids: return
+        q = q.where(_user.c.id.in_(user_ids))
+    (executor or db.session).execute(q)
+
+@event.listens_for(Session, 'before_flush')
+def _versionar_escritas(session, flush_context, instances):
+    # Escritas em massa (query.delete / bulk_insert) chamam bump_data_version direto
+    with session.no_autoflush:
+        uids = {o.user_id for o in session.new if isinstance(o, VERSIONADOS)}
+        uids |= {o.user_id for o in session.deleted if isinstance(o, VERSIONADOS)}
+        uids |= {o.user_id for o in session.dirty if isinstance(o, VERSIONADOS) and session.is_modified(o)}
+        if uids: bump_data_version(sorted(u for u in uids if u), session)
+
+def chave_dashboard(user, *partes):
+    return (user.id, user.data_version or 0) + partes
+
+def get_payload(chave):
+    return _payloads.get(chave)
+
+def set_payload(chave, payload):
+    _payloads.set(chave, payload)
+    return payload
+
+def payload_dashboard(user, tipo, start_date, end_date, hoje):
+    """{dados, meta_semanal, lucro_semanal_acumulado, smart_goal} do período, do cache ou calculado (HTML e API)."""
+    from decimal import Decimal
+    from app.services import calculate_dashboard, calculate_smart_goal
+    from app.services.gamification import AchievementService
+    from app.utils import get_config, safe_money
+    chave = chave_dashboard(user, tipo, start_date, end_date, hoje)
+    payload = get_payload(chave)
+    if payload is not None: return payload
+    dados = calculate_dashboard(user, start_date, end_date)
+    meta_semanal = safe_money(get_config(user.id, 'meta_semanal'))
+    lucro_raw = dados.get('lucro_semanal_acumulado', 0.0)
+    lucro_semanal_acumulado = Decimal(str(lucro_raw)) if isinstance(lucro_raw, float) else lucro_raw
+    smart_goal = calculate_smart_goal(user, lucro_semanal_acumulado, meta_semanal, dados['metricas'])
+    # Gamificação: Carrega apenas o necessário para visualização
+    AchievementService.get_badges_with_progress(user)
+    return set_payload(chave, {'dados': dados, 'meta_semanal': meta_semanal, 'lucro_semanal_acumulado': lucro_semanal_acumulado, 'smart_goal': smart_goal})
+
+def limpar_cache():
+    _payloads.clear()
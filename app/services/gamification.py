@@ -1,6 +1,94 @@
-from app.models import Achievement, UserAchievement, Diario, Agendamentos
+import time
+from datetime import datetime
+from collections import namedtuple
+from sqlalchemy import select, insert, exists, literal
+from app.models import Achievement, UserAchievement, UserStats
 from app.extensions import db
-from sqlalchemy import func
+from app.services.user_stats import get_user_stats, criar_user_stats_faltantes
+
+# --- REGRAS DECLARATIVAS (métrica do UserStats >= meta) ---
+# Métricas que uma conquista pode usar, na ordem em que são avaliadas
+METRICAS = {
+    'total_registros': UserStats.total_registros,
+    'km_total': UserStats.km_total,
+    'total_faturamento': UserStats.total_faturamento,
+    'agendamentos_concluidos': UserStats.agendamentos_concluidos,
+}
+# Regras das conquistas originais, usadas enquanto Achievement.metrica estiver vazio no banco
+# ('flask achievements seed-rules' grava estes valores nas colunas)
+REGRAS_PADRAO = {
+    'primeira_marcha': ('total_registros', 1), 'maratonista': ('total_registros', 30), 'veterano': ('total_registros', 365),
+    'viajante': ('km_total', 1000), 'estradeiro': ('km_total', 10000), 'rei_da_pista': ('km_total', 50000),
+    'primeiro_k': ('total_faturamento', 1000), 'faturou_10k': ('total_faturamento', 10000), 'magnata': ('total_faturamento', 100000),
+    'agenda_lotada': ('agendamentos_concluidos', 5), 'executivo': ('agendamentos_concluidos', 50),
+}
+PALAVRAS_PROIBIDAS = ('bronze', 'prata', 'ouro', 'nível', 'investidor')
+
+# --- CATÁLOGO DE CONQUISTAS (cache imutável em processo) ---
+AchievementInfo = namedtuple('AchievementInfo', ['id', 'nome', 'descricao', 'icone', 'categoria', 'xp', 'metrica', 'meta'])
+CATALOGO_TTL = 3600 # segundos
+_catalogo = {'itens': None, 'carregado_em': 0.0}
+
+def _info(row):
+    aid, nome, descricao, icone, categoria, xp, metrica, meta = row
+    if not metrica and aid in REGRAS_PADRAO: metrica, meta = REGRAS_PADRAO[aid]
+    return AchievementInfo(aid, nome, descricao, icone, categoria, xp, metrica, meta)
+
+def get_achievement_catalog():
+    """Tupla de AchievementInfo (imutável, compartilhada entre threads). Recarrega a cada CATALOGO_TTL."""
+    itens = _catalogo['itens']
+    if itens is None or time.monotonic() - _catalogo['carregado_em'] > CATALOGO_TTL:
+        rows = db.session.query(Achievement.id, Achievement.nome, Achievement.descricao, Achievement.icone, Achievement.categoria, Achievement.xp, Achievement.metrica, Achievement.meta).all()
+        itens = tuple(_info(r) for r in rows)
+        _catalogo['itens'] = itens; _catalogo['carregado_em'] = time.monotonic()
+    return itens
+
+def invalidate_achievement_catalog():
+    _catalogo['itens'] = None
+
+def visivel(badge):
+    nome_lower = badge.nome.lower(); id_lower = badge.id.lower()
+    return not any(p in nome_lower or p in id_lower for p in PALAVRAS_PROIBIDAS)
+
+def regras_ativas(catalogo=None):
+    """Conquistas visíveis com regra válida, ordenadas por métrica e meta."""
+    catalogo = get_achievement_catalog() if catalogo is None else catalogo
+    ordem = list(METRICAS)
+    regras = [b for b in catalogo if b.metrica in METRICAS and b.meta is not None and visivel(b)]
+    return sorted(regras, key=lambda b: (ordem.index(b.metrica), b.meta))
+
+def avaliar_regras(stats, catalogo=None):
+    """Avalia todas as regras para um usuário numa única passada: {id: (atual, meta, atingiu)}."""
+    res = {}
+    for b in regras_ativas(catalogo):
+        atual = getattr(stats, b.metrica, None) or 0
+        res[b.id] = (int(atual), b.meta, atual >= b.meta)
+    return res
+
+def conceder_por_regras(user, stats=None):
+    """Concede (sem commit) as conquistas cujas regras o usuário já atingiu. Retorna os ids novos."""
+    stats = stats or get_user_stats(user.id)
+    existentes = {aid for (aid,) in db.session.query(UserAchievement.achievement_id).filter_by(user_id=user.id).all()}
+    unlocks = []
+    for aid, (_, _, atingiu) in avaliar_regras(stats).items():
+        if atingiu and aid not in existentes:
+            db.session.add(UserAchievement(user_id=user.id, achievement_id=aid))
+            unlocks.append(aid)
+    return unlocks
+
+def backfill_achievement(achievement_id):
+    """Concede a conquista a todos os usuários que já atingiram a regra com um único INSERT ... SELECT.
+
+    Retorna o número de usuários premiados. Não faz commit.
+    """
+    regra = next((b for b in get_achievement_catalog() if b.id == achievement_id), None)
+    if regra is None: raise ValueError(f"Conquista '{achievement_id}' não existe.")
+    if regra.metrica not in METRICAS or regra.meta is None: raise ValueError(f"Conquista '{achievement_id}' não tem regra (é concedida por evento).")
+    criar_user_stats_faltantes()
+    ja_tem = exists().where(UserAchievement.user_id == UserStats.user_id, UserAchievement.achievement_id == regra.id)
+    origem = select(UserStats.user_id, literal(regra.id), literal(datetime.utcnow()), literal(False)).where(METRICAS[regra.metrica] >= regra.meta, ~ja_tem)
+    res = db.session.execute(insert(UserAchievement).from_select(['user_id', 'achievement_id', 'conquistado_em', 'visto'], origem))
+    return res.rowcount or 0
 
 class AchievementService:
     @staticmethod
@@ -11,7 +99,7 @@ class AchievementService:
     def get_badges_with_progress(user):
         try:
             # OTIMIZAÇÃO: Busca todas as conquistas do usuário de uma vez só em memória
-            all_badges = Achievement.query.all()
+            all_badges = get_achievement_catalog()
             
             # Se não houver conquistas cadastradas no sistema, retorna vazio sem erro
             if not all_badges:
@@ -23,46 +111,16 @@ class AchievementService:
             badges_list = []
             new_unlocks = []
             
-            stats = db.session.query(
-                func.count(Diario.id),
-                func.coalesce(func.sum(Diario.km_percorrido), 0),
-                func.coalesce(func.sum(Diario.ganho_bruto), 0)
-            ).filter_by(user_id=user.id).first()
-            
-            total_dias = stats[0] or 0
-            total_km = stats[1]
-            total_faturamento = stats[2]
-            
-            total_agendamentos = Agendamentos.query.filter_by(user_id=user.id, status='concluido').count()
-            
-            filtered_badges = []
-            palavras_proibidas = ['bronze', 'prata', 'ouro', 'nível', 'investidor']
-            for badge in all_badges:
-                nome_lower = badge.nome.lower()
-                id_lower = badge.id.lower()
-                if any(p in nome_lower for p in palavras_proibidas) or any(p in id_lower for p in palavras_proibidas):
-                    continue
-                filtered_badges.append(badge)
+            # Regras avaliadas numa passada sobre os contadores materializados (UserStats)
+            progresso = avaliar_regras(get_user_stats(user.id), all_badges)
+            filtered_badges = [b for b in all_badges if visivel(b)]
 
             for badge in filtered_badges:
                 if badge.id == 'lenda_viva': continue
 
                 unlocked = badge.id in user_badges
-                current = 0; target = 1
-                
-                if badge.id == 'primeira_marcha': current, target = total_dias, 1
-                elif badge.id == 'maratonista': current, target = total_dias, 30
-                elif badge.id == 'veterano': current, target = total_dias, 365
-                elif badge.id == 'viajante': current, target = int(total_km), 1000
-                elif badge.id == 'estradeiro': current, target = int(total_km), 10000
-                elif badge.id == 'rei_da_pista': current, target = int(total_km), 50000
-                elif badge.id == 'agenda_lotada': current, target = total_agendamentos, 5
-                elif badge.id == 'executivo': current, target = total_agendamentos, 50
-                elif badge.id == 'primeiro_k': current, target = int(total_faturamento), 1000
-                elif badge.id == 'faturou_10k': current, target = int(total_faturamento), 10000
-                elif badge.id == 'magnata': current, target = int(total_faturamento), 100000
-                elif badge.id == 'empreendedor': current = 1 if unlocked else 0 
-                elif badge.id == 'expert_manutencao': current = 1 if unlocked else 0
+                if badge.id in progresso: current, target, _ = progresso[badge.id]
+                else: current, target = (1 if unlocked else 0), 1 # conquistas por evento (recibo, manutenção)
                 
                 progress = min(100, int((current / target) * 100)) if target > 0 else 0
                 
@@ -111,39 +169,7 @@ class AchievementService:
     @staticmethod
     def check_new_entries(user):
         try:
-            unlocks = []
-            stats = db.session.query(
-                func.count(Diario.id),
-                func.coalesce(func.sum(Diario.km_percorrido), 0),
-                func.coalesce(func.sum(Diario.ganho_bruto), 0)
-            ).filter_by(user_id=user.id).first()
-            
-            total_dias = stats[0] or 0
-            total_km = stats[1]
-            total_fat = stats[2]
-            
-            existing_ids = {ua.achievement_id for ua in UserAchievement.query.filter_by(user_id=user.id).all()}
-            
-            def give(bid):
-                if bid not in existing_ids:
-                    # Verifica se o achievement existe antes de dar
-                    if db.session.query(Achievement.id).filter_by(id=bid).first():
-                        db.session.add(UserAchievement(user_id=user.id, achievement_id=bid))
-                        unlocks.append(bid)
-                        existing_ids.add(bid)
-
-            if total_dias >= 1: give('primeira_marcha')
-            if total_dias >= 30: give('maratonista')
-            if total_dias >= 365: give('veterano')
-            
-            if total_km >= 1000: give('viajante')
-            if total_km >= 10000: give('estradeiro')
-            if total_km >= 50000: give('rei_da_pista')
-            
-            if total_fat >= 1000: give('primeiro_k')
-            if total_fat >= 10000: give('faturou_10k')
-            if total_fat >= 100000: give('magnata')
-
+            unlocks = conceder_por_regras(user)
             if unlocks:
                 db.session.commit()
             return unlocks
@@ -154,24 +180,14 @@ class AchievementService:
     def check_usage(user, action_type):
         try:
             unlocks = []
-            existing_ids = {ua.achievement_id for ua in UserAchievement.query.filter_by(user_id=user.id).all()}
-            
             if action_type == 'agenda_concluir':
-                total = Agendamentos.query.filter_by(user_id=user.id, status='concluido').count()
-                if total >= 5 and 'agenda_lotada' not in existing_ids:
-                    if db.session.query(Achievement.id).filter_by(id='agenda_lotada').first():
-                        db.session.add(UserAchievement(user_id=user.id, achievement_id='agenda_lotada'))
-                        unlocks.append('agenda_lotada')
-                if total >= 50 and 'executivo' not in existing_ids:
-                    if db.session.query(Achievement.id).filter_by(id='executivo').first():
-                        db.session.add(UserAchievement(user_id=user.id, achievement_id='executivo'))
-                        unlocks.append('executivo')
+                unlocks = conceder_por_regras(user)
             
             elif action_type == 'recibo':
-                 if 'empreendedor' not in existing_ids:
-                    if db.session.query(Achievement.id).filter_by(id='empreendedor').first():
-                        db.session.add(UserAchievement(user_id=user.id, achievement_id='empreendedor'))
-                        unlocks.append('empreendedor')
+                existentes = {aid for (aid,) in db.session.query(UserAchievement.achievement_id).filter_by(user_id=user.id).all()}
+                if 'empreendedor' not in existentes and any(b.id == 'empreendedor' for b in get_achievement_catalog()):
+                    db.session.add(UserAchievement(user_id=user.id, achievement_id='empreendedor'))
+                    unlocks.append('empreendedor')
 
             if unlocks:
                 db.session.commit()
@@ -0,0 +1,94 @@
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models import Diario, Agendamentos, SyncOperation
+from app.utils import safe_money, safe_float, time_to_float
+
+# --- LANÇAMENTOS (formulários, fila offline do PWA e API) ---
+# As mesmas regras de conversão do formulário 'adicionar' / 'novo_agendamento' para qualquer origem.
+LOTE_MAXIMO = 200 # itens por requisição de sincronização
+
+def montar_diario(campos, user_id):
+    """Diario a partir dos campos do formulário 'adicionar'. ValueError/KeyError se inválido."""
+    data_obj = datetime.strptime(campos['data'], '%Y-%m-%d').date()
+    g_uber = safe_money(campos.get('ganho_uber'))
+    g_99 = safe_money(campos.get('ganho_99'))
+    g_part = safe_money(campos.get('ganho_part'))
+    g_out = safe_money(campos.get('ganho_out'))
+    app_sum = g_uber + g_99 + g_part + g_out
+    return Diario(
+        data=data_obj, ganho_bruto=app_sum if app_sum > 0 else safe_money(campos.get('ganho_bruto')),
+        ganho_uber=g_uber, ganho_99=g_99, ganho_part=g_part, ganho_outros=g_out,
+        despesa_combustivel=safe_money(campos.get('total_combustivel')), despesa_alimentacao=safe_money(campos.get('total_alimentacao')), despesa_manutencao=safe_money(campos.get('total_manutencao')),
+        qtd_uber=int(campos.get('qtd_uber') or 0), qtd_99=int(campos.get('qtd_99') or 0),
+        qtd_part=int(campos.get('qtd_part') or 0), qtd_outros=int(campos.get('qtd_outros') or 0),
+        km_percorrido=safe_float(campos.get('km_percorrido')), horas_trabalhadas=time_to_float(campos.get('horas_qtd'), campos.get('minutos_qtd')), user_id=user_id
+    )
+
+def montar_agendamento(campos, user_id):
+    """Agendamentos a partir dos campos do formulário 'novo_agendamento'. ValueError/KeyError se inválido."""
+    novo = Agendamentos(cliente=campos['cliente'], data_hora=datetime.strptime(f"{campos['data_ag']} {campos['hora_ag']}", "%Y-%m-%d %H:%M"), origem=campos['origem'], destino=campos['destino'], valor=safe_money(campos['valor']), observacao=campos.get('observacao'), user_id=user_id)
+    if campos.get('parada'): novo.parada = campos['parada']
+    return novo
+
+MONTADORES = {'diario': montar_diario, 'agendamento': montar_agendamento}
+
+def _gravar_lote(user, itens, chave_obrigatoria=True):
+    """Uma transação: ignora chaves já gravadas, insere o resto e registra as chaves. Retorna os resultados.
+
+    Com chave_obrigatoria=False, item sem chave é só inserido (sem idempotência).
+    """
+    chaves = [str(i.get('chave') or '')[:64] for i in itens]
+    ja_gravadas = dict(db.session.query(SyncOperation.chave, SyncOperation.objeto_id).filter(SyncOperation.user_id == user.id, SyncOperation.chave.in_([c for c in chaves if c])).all()) if any(chaves) else {}
+    resultados, novos, vistas = [], [], set()
+    for item, chave in zip(itens, chaves):
+        tipo = item.get('tipo')
+        if (chave_obrigatoria and not chave) or tipo not in MONTADORES:
+            resultados.append({'chave': chave, 'status': 'erro', 'erro': 'chave ou tipo inválido'}); continue
+        if chave and (chave in ja_gravadas or chave in vistas):
+            resultados.append({'chave': chave, 'status': 'duplicado', 'id': ja_gravadas.get(chave)}); continue
+        dados = item.get('dados')
+        try: obj = MONTADORES[tipo](dados if isinstance(dados, dict) else {}, user.id)
+        except (ValueError, KeyError, TypeError, ArithmeticError) as e:
+            resultados.append({'chave': chave, 'status': 'erro', 'erro': f"dados inválidos: {e}"}); continue
+        if chave: vistas.add(chave)
+        novos.append((chave, tipo, obj)); resultados.append({'chave': chave, 'status': 'criado', '_obj': obj})
+    if novos:
+        db.session.add_all([obj for _, _, obj in novos]); db.session.flush() # um flush: rollups/UserStats pelo before_flush
+        db.session.add_all([SyncOperation(user_id=user.id, chave=chave, tipo=tipo, objeto_id=obj.id) for chave, tipo, obj in novos if chave])
+        ids = {chave: obj.id for chave, _, obj in novos if chave}
+        for r in resultados:
+            if '_obj' in r: r['id'] = r.pop('_obj').id
+            elif r['status'] == 'duplicado' and r['chave'] in ids: r['id'] = ids[r['chave']]
+    db.session.commit()
+    return resultados, any(tipo == 'diario' for _, tipo, _ in novos)
+
+def _com_retentativa(user, itens, **kw):
+    from app.services.gamification import AchievementService
+    for tentativa in (1, 2):
+        try:
+            resultados, teve_diario = _gravar_lote(user, itens, **kw)
+            break
+        except IntegrityError:
+            # Outro envio com as mesmas chaves gravou ao mesmo tempo: a 2ª passada as vê como duplicadas
+            db.session.rollback()
+            if tentativa == 2: raise
+    novas = AchievementService.check_new_entries(user) if teve_diario else []
+    return resultados, novas
+
+def sincronizar_lote(user, itens):
+    """Grava a fila offline (lista de {chave, tipo, dados}) numa transação, sem duplicar chaves já recebidas.
+
+    Reenvio da mesma chave devolve 'duplicado' com o id original. Gamificação roda uma vez no final.
+    Retorna a lista de resultados na ordem dos itens.
+    """
+    return _com_retentativa(user, itens)[0]
+
+def inserir_diarios(user, entradas):
+    """Carga em massa de dias (API): cada entrada tem os campos do formulário 'adicionar' e, opcionalmente,
+    uma 'chave' de idempotência. Entradas inválidas voltam como 'erro' sem impedir as demais.
+
+    Retorna (resultados na ordem das entradas, conquistas novas).
+    """
+    itens = [{'chave': e.get('chave'), 'tipo': 'diario', 'dados': e} if isinstance(e, dict) else {'tipo': 'diario', 'dados': None} for e in entradas]
+    return _com_retentativa(user, itens, chave_obrigatoria=False)
@@ -0,0 +1,169 @@
+import time
+from collections import Counter
+from datetime import datetime
+from flask import g, has_request_context
+from sqlalchemy import event, func, select, literal, case, or_, and_
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import User, Notification, BroadcastMessage, BroadcastRead
+
+_user = User.__table__
+
+def _ajustar(executor, deltas):
+    """Soma os deltas no contador com UPDATE atômico (seguro entre workers)."""
+    for user_id, delta in deltas.items():
+        if not user_id or not delta: continue
+        executor.execute(_user.update().where(_user.c.id == user_id).values(notificacoes_nao_lidas=func.coalesce(_user.c.notificacoes_nao_lidas, 0) + delta))
+
+@event.listens_for(Session, 'before_flush')
+def _sincronizar_nao_lidas(session, flush_context, instances):
+    # Inserções, leituras e exclusões de Notification via ORM atualizam o contador na mesma transação.
+    # Escritas em massa (bulk_insert / query.update / query.delete) usam as funções abaixo.
+    with session.no_autoflush:
+        novas = [o for o in session.new if isinstance(o, Notification)]
+        alteradas = [o for o in session.dirty if isinstance(o, Notification) and session.is_modified(o)]
+        excluidas = [o for o in session.deleted if isinstance(o, Notification)]
+        if not (novas or alteradas or excluidas): return
+        ids = [o.id for o in alteradas + excluidas if o.id]
+        gravadas = {i: (uid, lida) for i, uid, lida in session.query(Notification.id, Notification.user_id, Notification.is_read).filter(Notification.id.in_(ids)).all()} if ids else {}
+        deltas = Counter()
+        for o in novas:
+            if not o.is_read: deltas[o.user_id] += 1
+        for o in alteradas + excluidas:
+            if o.id in gravadas and not gravadas[o.id][1]: deltas[gravadas[o.id][0]] -= 1
+        for o in alteradas:
+            if not o.is_read: deltas[o.user_id] += 1
+        _ajustar(session, deltas)
+
+def incrementar_nao_lidas(user_id=None, n=1):
+    """Após um bulk insert de notificações: soma n no usuário (ou em todos quando user_id=None). Não faz commit."""
+    q = _user.update().values(notificacoes_nao_lidas=func.coalesce(_user.c.notificacoes_nao_lidas, 0) + n)
+    if user_id: q = q.where(_user.c.id == user_id)
+    db.session.execute(q)
+
+def zerar_nao_lidas(user_id):
+    """Após marcar todas como lidas ou apagar todas (escritas em massa). Não faz commit."""
+    db.session.execute(_user.update().where(_user.c.id == user_id).values(notificacoes_nao_lidas=0))
+
+def _contagem_real():
+    return select(func.count(Notification.id)).where(Notification.user_id == _user.c.id, Notification.is_read == False).scalar_subquery()
+
+def verificar_nao_lidas(user_id=None):
+    """Lista (user_id, esperado, atual) dos usuários com contador divergente."""
+    q = select(_user.c.id, _contagem_real(), _user.c.notificacoes_nao_lidas)
+    if user_id: q = q.where(_user.c.id == user_id)
+    return [(uid, int(esp or 0), atual) for uid, esp, atual in db.session.execute(q).all() if int(esp or 0) != (atual or 0)]
+
+def reconciliar_nao_lidas(user_id=None):
+    """Regrava o contador a partir da tabela Notification com um único UPDATE. Não faz commit."""
+    q = _user.update().values(notificacoes_nao_lidas=_contagem_real())
+    if user_id: q = q.where(_user.c.id == user_id)
+    db.session.execute(q)
+
+# --- AVISOS GERAIS (BroadcastMessage + estado de leitura por usuário) ---
+BROADCAST_TTL = 60 # segundos; a lista de avisos é pequena e muda raramente
+_broadcasts = {'itens': None, 'carregado_em': 0.0}
+
+def enviar_broadcast(mensagem):
+    """Aviso para todos os usuários com um único INSERT. Não faz commit."""
+    b = BroadcastMessage(message=mensagem)
+    db.session.add(b)
+    _broadcasts['itens'] = None
+    return b
+
+def _lista_broadcasts():
+    """Tupla (id, created_at) de todos os avisos, em cache por processo."""
+    itens = _broadcasts['itens']
+    if itens is None or time.monotonic() - _broadcasts['carregado_em'] > BROADCAST_TTL:
+        itens = tuple(db.session.query(BroadcastMessage.id, BroadcastMessage.created_at).order_by(BroadcastMessage.id).all())
+        _broadcasts['itens'] = itens; _broadcasts['carregado_em'] = time.monotonic()
+    return itens
+
+def _visivel(user, created_at):
+    # Avisos enviados antes do cadastro não aparecem (antes eram gravados só para quem já existia)
+    return not user.data_cadastro or not created_at or created_at.date() >= user.data_cadastro
+
+def broadcasts_nao_lidos(user):
+    """Quantidade de avisos não lidos. Sem consulta quando não há aviso acima da marca de leitura."""
+    marca = max(user.broadcast_lido_ate or 0, user.broadcast_oculto_ate or 0)
+    candidatos = [i for i, criado in _lista_broadcasts() if i > marca and _visivel(user, criado)]
+    if not candidatos: return 0
+    cache = g.setdefault('_broadcasts_nao_lidos', {}) if has_request_context() else {}
+    if user.id not in cache:
+        lidos = db.session.query(func.count()).select_from(BroadcastRead).filter(BroadcastRead.user_id == user.id, BroadcastRead.broadcast_id.in_(candidatos)).scalar() or 0
+        cache[user.id] = len(candidatos) - lidos
+    return cache[user.id]
+
+def total_nao_lidas(user):
+    return max(0, user.notificacoes_nao_lidas or 0) + broadcasts_nao_lidos(user)
+
+NOTIF_POR_PAGINA = 20
+_RANK = {'aviso': 0, 'pessoal': 1} # desempate entre as duas fontes no mesmo created_at
+
+def _cursor(item):
+    # Linhas antigas sem created_at vêm depois de todas as datadas: cursor com data vazia
+    return f"{item.created_at.isoformat() if item.created_at else ''}_{_RANK[item.tipo]}_{item.id}"
+
+def _ler_cursor(antes):
+    try:
+        ts, rank, pk = antes.rsplit('_', 2)
+        return (datetime.fromisoformat(ts) if ts else None), int(rank), int(pk)
+    except (AttributeError, ValueError): return None
+
+def _apos_cursor(coluna_data, coluna_id, rank, cursor):
+    """Filtro keyset para a ordem (created_at, rank, id) decrescente (só linhas com created_at)."""
+    ct, cr, cid = cursor
+    if rank < cr: return coluna_data <= ct
+    if rank > cr: return coluna_data < ct
+    return or_(coluna_data < ct, and_(coluna_data == ct, coluna_id < cid))
+
+def _pagina_fonte(q, coluna_data, coluna_id, rank, cursor, limite):
+    """Até limite+1 linhas de uma fonte: as datadas pelo índice (created_at, id) e, só quando elas acabam,
+    as legadas com created_at NULL (ordenadas por id, como as mais antigas do feed)."""
+    itens = []
+    if not cursor or cursor[0] is not None:
+        datadas = q.filter(coluna_data.isnot(None))
+        if cursor: datadas = datadas.filter(_apos_cursor(coluna_data, coluna_id, rank, cursor))
+        itens = datadas.order_by(coluna_data.desc(), coluna_id.desc()).limit(limite + 1).all()
+    if len(itens) <= limite:
+        sem_data = q.filter(coluna_data.is_(None))
+        if cursor and cursor[0] is None:
+            if rank > cursor[1]: return itens
+            if rank == cursor[1]: sem_data = sem_data.filter(coluna_id < cursor[2])
+        itens += sem_data.order_by(coluna_id.desc()).limit(limite + 1 - len(itens)).all()
+    return itens
+
+def pagina_notificacoes(user, antes=None, limite=NOTIF_POR_PAGINA):
+    """Uma página do feed (notificações pessoais + avisos gerais), mais recentes primeiro.
+
+    Lê tuplas (id, tipo, message, created_at, is_read) sem carregar objetos do ORM; cada fonte usa
+    keyset com LIMIT n+1. Retorna (itens, cursor_da_proxima_pagina ou None).
+    """
+    cursor = _ler_cursor(antes) if antes else None
+    pessoal = db.session.query(Notification.id, literal('pessoal').label('tipo'), Notification.message, Notification.created_at, Notification.is_read).filter(Notification.user_id == user.id)
+    itens = _pagina_fonte(pessoal, Notification.created_at, Notification.id, _RANK['pessoal'], cursor, limite)
+
+    lido = or_(BroadcastMessage.id <= (user.broadcast_lido_ate or 0), BroadcastRead.broadcast_id.isnot(None))
+    avisos = db.session.query(BroadcastMessage.id, literal('aviso').label('tipo'), BroadcastMessage.message, BroadcastMessage.created_at, case((lido, True), else_=False).label('is_read')).outerjoin(
+        BroadcastRead, and_(BroadcastRead.broadcast_id == BroadcastMessage.id, BroadcastRead.user_id == user.id)
+    ).filter(BroadcastMessage.id > (user.broadcast_oculto_ate or 0))
+    # Avisos enviados antes do cadastro não aparecem (antes eram gravados só para quem já existia); sem data, aparece (_visivel)
+    if user.data_cadastro: avisos = avisos.filter(or_(BroadcastMessage.created_at >= datetime.combine(user.data_cadastro, datetime.min.time()), BroadcastMessage.created_at.is_(None)))
+    itens += _pagina_fonte(avisos, BroadcastMessage.created_at, BroadcastMessage.id, _RANK['aviso'], cursor, limite)
+
+    itens.sort(key=lambda n: (n.created_at is not None, n.created_at or datetime.min, _RANK[n.tipo], n.id), reverse=True)
+    if len(itens) > limite: return itens[:limite], _cursor(itens[limite - 1])
+    return itens, None
+
+def marcar_broadcast_lido(user, broadcast_id):
+    """Não faz commit."""
+    if broadcast_id <= (user.broadcast_lido_ate or 0): return
+    if not db.session.get(BroadcastRead, (user.id, broadcast_id)) and db.session.get(BroadcastMessage, broadcast_id):
+        db.session.add(BroadcastRead(user_id=user.id, broadcast_id=broadcast_id))
+
+def marcar_broadcasts_lidos(user, ocultar=False):
+    """Avança a marca de leitura (e de ocultação) até o último aviso e descarta as leituras avulsas. Não faz commit."""
+    ultimo = db.session.query(func.max(BroadcastMessage.id)).scalar() or 0
+    user.broadcast_lido_ate = max(user.broadcast_lido_ate or 0, ultimo)
+    if ocultar: user.broadcast_oculto_ate = max(user.broadcast_oculto_ate or 0, ultimo)
+    BroadcastRead.query.filter(BroadcastRead.user_id == user.id, BroadcastRead.broadcast_id <= ultimo).delete(synchronize_session=False)
@@ -0,0 +1,51 @@
+from sqlalchemy import func, extract
+from app.extensions import db
+from app.models import DiarioRollup
+from app.services.rollups import somar_periodo
+
+# Consultas agregadas dos relatórios (relatorios, imprimir_pdf, lucro_real).
+# Tudo é agrupado no banco sobre os buckets diários do DiarioRollup e volta como tuplas simples,
+# então a memória não cresce com o histórico do usuário.
+
+DIAS_SEMANA = ('Dom', 'Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb') # índice = dow do SQL (0 = Domingo)
+RESUMO_CAMPOS = ('ganho', 'despesa', 'km', 'horas', 'corridas', 'ganho_uber', 'qtd_uber', 'ganho_99', 'qtd_99', 'ganho_part', 'qtd_part', 'ganho_outros', 'qtd_outros')
+
+_despesa = DiarioRollup.despesa_combustivel + DiarioRollup.despesa_alimentacao + DiarioRollup.despesa_manutencao
+
+def _dias(user_id, start, end):
+    return (DiarioRollup.user_id == user_id, DiarioRollup.periodo == 'dia', DiarioRollup.inicio >= start, DiarioRollup.inicio <= end)
+
+def resumo_periodo(user_id, start, end):
+    """Tupla na ordem de RESUMO_CAMPOS (dinheiro em Decimal, km/horas em float, quantidades em int)."""
+    r = somar_periodo(user_id, start, end)
+    return (
+        r['ganho_bruto'], r['despesa_combustivel'] + r['despesa_alimentacao'] + r['despesa_manutencao'], r['km_percorrido'], r['horas_trabalhadas'],
+        r['qtd_uber'] + r['qtd_99'] + r['qtd_part'] + r['qtd_outros'],
+        r['ganho_uber'], r['qtd_uber'], r['ganho_99'], r['qtd_99'], r['ganho_part'], r['qtd_part'], r['ganho_outros'], r['qtd_outros'],
+    )
+
+def por_data(user_id, start, end):
+    """[(data, ganho, despesa, registros)] em ordem cronológica."""
+    return db.session.query(DiarioRollup.inicio, DiarioRollup.ganho_bruto, _despesa, DiarioRollup.registros).filter(
+        *_dias(user_id, start, end)
+    ).order_by(DiarioRollup.inicio.asc()).all()
+
+def por_dia_semana(user_id, start, end):
+    """[(dow, ganho, registros)] com dow 0 = Domingo ... 6 = Sábado."""
+    dow = extract('dow', DiarioRollup.inicio)
+    return [(int(d), g, int(n or 0)) for d, g, n in db.session.query(dow, func.sum(DiarioRollup.ganho_bruto), func.sum(DiarioRollup.registros)).filter(
+        *_dias(user_id, start, end)
+    ).group_by(dow).all()]
+
+def por_mes(user_id, start, end):
+    """[(ano, mês, ganho, registros)] em ordem cronológica."""
+    ano = extract('year', DiarioRollup.inicio); mes = extract('month', DiarioRollup.inicio)
+    return [(int(a), int(m), g, int(n or 0)) for a, m, g, n in db.session.query(ano, mes, func.sum(DiarioRollup.ganho_bruto), func.sum(DiarioRollup.registros)).filter(
+        *_dias(user_id, start, end)
+    ).group_by(ano, mes).order_by(ano, mes).all()]
+
+def melhor_dia(user_id, start, end):
+    """(data, ganho) do dia de maior faturamento no período, ou None."""
+    return db.session.query(DiarioRollup.inicio, DiarioRollup.ganho_bruto).filter(
+        *_dias(user_id, start, end)
+    ).order_by(DiarioRollup.ganho_bruto.desc(), DiarioRollup.inicio.asc()).first()
@@ -0,0 +1,216 @@
+import calendar
+from datetime import datetime, date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import event, func, or_, and_, extract
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import Diario, DiarioRollup
+
+# Colunas do Diario somadas em cada bucket (mesmo nome no DiarioRollup)
+CAMPOS_DINHEIRO = ('ganho_bruto', 'ganho_uber', 'ganho_99', 'ganho_part', 'ganho_outros', 'despesa_combustivel', 'despesa_alimentacao', 'despesa_manutencao')
+CAMPOS_INTEIROS = ('qtd_uber', 'qtd_99', 'qtd_part', 'qtd_outros')
+CAMPOS_FLOAT = ('km_percorrido', 'horas_trabalhadas')
+CAMPOS = CAMPOS_DINHEIRO + CAMPOS_INTEIROS + CAMPOS_FLOAT
+
+def inicio_semana(d):
+    """Domingo da semana da data (mesma regra de get_current_week_range)."""
+    return d - timedelta(days=(d.weekday() + 1) % 7)
+
+def buckets_da_data(d):
+    return (('dia', d), ('semana', inicio_semana(d)), ('mes', d.replace(day=1)))
+
+def _to_date(v):
+    if isinstance(v, datetime): return v.date()
+    if isinstance(v, str):
+        try: return datetime.strptime(v[:10], '%Y-%m-%d').date()
+        except: return None
+    return v
+
+def _to_int(v):
+    try: return int(v) if v not in (None, '') else None
+    except: return None
+
+def _num(campo, v):
+    if v is None or v == '': v = 0
+    if campo in CAMPOS_DINHEIRO: return Decimal(str(v)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if campo in CAMPOS_INTEIROS: return int(float(v))
+    return float(v)
+
+def zeros():
+    return {c: _num(c, 0) for c in CAMPOS}
+
+def snapshot_diario(row):
+    """Extrai (user_id, data, valores) de um Diario ou de um dict com as mesmas chaves."""
+    valores = {c: _num(c, row.get(c)) for c in CAMPOS}
+    return _to_int(row.get('user_id')), _to_date(row.get('data')), valores
+
+def aplicar_deltas(deltas, session=None):
+    """Aplica uma lista de (lançamento, sinal) nos buckets dia/semana/mês.
+
+    sinal=1 soma o lançamento e sinal=-1 retira. Buckets que ficam vazios são removidos
+    só no final, para que editar a data de um lançamento não apague e recrie o mesmo bucket.
+    """
+    session = session or db.session
+    tocados = {}
+    linhas = [row if isinstance(row, tuple) else snapshot_diario(row) for row, _ in deltas]
+    # Busca de uma vez os buckets de todos os lançamentos (carga em massa = uma consulta por usuário)
+    por_usuario = {}
+    for user_id, data, _ in linhas:
+        if user_id and data: por_usuario.setdefault(user_id, set()).update(buckets_da_data(data))
+    with session.no_autoflush:
+        for user_id, chaves in por_usuario.items():
+            chaves = sorted(chaves)
+            for i in range(0, len(chaves), 300):
+                for b in session.query(DiarioRollup).filter(
+                    DiarioRollup.user_id == user_id,
+                    or_(*[and_(DiarioRollup.periodo == p, DiarioRollup.inicio == ini) for p, ini in chaves[i:i + 300]])
+                ).all():
+                    tocados[(b.user_id, b.periodo, _to_date(b.inicio))] = b
+    for (user_id, data, valores), (_, sinal) in zip(linhas, deltas):
+        if not user_id or not data: continue
+        for chave in [(user_id, p, i) for p, i in buckets_da_data(data)]:
+            bucket = tocados.get(chave)
+            if bucket is None:
+                bucket = DiarioRollup(user_id=user_id, periodo=chave[1], inicio=chave[2], registros=0, **zeros())
+                session.add(bucket); tocados[chave] = bucket
+            bucket.registros = (bucket.registros or 0) + sinal
+            for c in CAMPOS: setattr(bucket, c, _num(c, getattr(bucket, c)) + sinal * valores[c])
+
+    for bucket in tocados.values():
+        if bucket.registros <= 0:
+            if bucket in session.new: session.expunge(bucket)
+            else: session.delete(bucket)
+
+def aplicar_diario(row, sinal=1, session=None):
+    """Soma (sinal=1) ou subtrai (sinal=-1) um único lançamento nos buckets."""
+    aplicar_deltas([(row, sinal)], session)
+
+def _valores_gravados(session, ids):
+    """Lê do banco os valores atuais (antes do flush) dos Diarios alterados ou excluídos."""
+    if not ids: return {}
+    rows = session.query(Diario.id, Diario.user_id, Diario.data, *[getattr(Diario, c) for c in CAMPOS]).filter(Diario.id.in_(ids)).all()
+    return {r[0]: (_to_int(r[1]), _to_date(r[2]), {c: _num(c, v) for c, v in zip(CAMPOS, r[3:])}) for r in rows}
+
+def diario_deltas(session):
+    """Lista (snapshot, sinal) das mudanças de Diario pendentes no flush."""
+    deltas = []
+    with session.no_autoflush:
+        alterados = [o for o in session.dirty if isinstance(o, Diario) and session.is_modified(o)]
+        excluidos = [o for o in session.deleted if isinstance(o, Diario)]
+        gravados = _valores_gravados(session, [o.id for o in alterados + excluidos if o.id])
+        for obj in session.new:
+            if isinstance(obj, Diario): deltas.append((snapshot_diario(obj), 1))
+        for obj in alterados:
+            if obj.id in gravados: deltas.append((gravados[obj.id], -1))
+            deltas.append((snapshot_diario(obj), 1))
+        for obj in excluidos:
+            if obj.id in gravados: deltas.append((gravados[obj.id], -1))
+    return deltas
+
+_diario_handlers = []
+
+def on_diario_change(fn):
+    """Registra fn(session, deltas) para rodar no mesmo flush das escritas em Diario."""
+    _diario_handlers.append(fn)
+    return fn
+
+@event.listens_for(Session, 'before_flush')
+def _sincronizar_diario(session, flush_context, instances):
+    # Mantém os buckets (e os contadores registrados) na mesma transação de qualquer escrita ORM em Diario.
+    # Escritas em massa (query.delete / bulk_insert) devem chamar rebuild_rollups.
+    deltas = diario_deltas(session)
+    if not deltas: return
+    aplicar_deltas(deltas, session)
+    for fn in _diario_handlers: fn(session, deltas)
+
+# --- LEITURA ---
+def anos_disponiveis(user):
+    """Anos com lançamentos (mais recente primeiro): uma consulta nos buckets mensais (no máximo 12 por ano)."""
+    ano = extract('year', DiarioRollup.inicio)
+    return sorted({int(a) for (a,) in db.session.query(ano).filter(DiarioRollup.user_id == user.id, DiarioRollup.periodo == 'mes', DiarioRollup.registros > 0).distinct()}, reverse=True)
+
+def decompor_periodo(start, end):
+    """Cobre [start, end] com o menor número de buckets: meses inteiros, semanas inteiras e dias avulsos."""
+    chaves = []
+    d = start
+    while d <= end:
+        fim_mes = date(d.year, d.month, calendar.monthrange(d.year, d.month)[1])
+        if d.day == 1 and fim_mes <= end:
+            chaves.append(('mes', d)); d = fim_mes + timedelta(days=1)
+        elif inicio_semana(d) == d and d + timedelta(days=6) <= end:
+            chaves.append(('semana', d)); d += timedelta(days=7)
+        else:
+            chaves.append(('dia', d)); d += timedelta(days=1)
+    return chaves
+
+def _filtro_buckets(chaves):
+    por_periodo = {}
+    for p, i in chaves: por_periodo.setdefault(p, []).append(i)
+    return or_(*[and_(DiarioRollup.periodo == p, DiarioRollup.inicio.in_(v)) for p, v in por_periodo.items()])
+
+def somar_periodo(user_id, start, end):
+    """Totais do Diario no período somando apenas os buckets necessários."""
+    chaves = decompor_periodo(start, end)
+    totais = zeros(); totais['registros'] = 0
+    if not chaves: return totais
+    row = db.session.query(func.sum(DiarioRollup.registros), *[func.sum(getattr(DiarioRollup, c)) for c in CAMPOS]).filter(
+        DiarioRollup.user_id == user_id, _filtro_buckets(chaves)
+    ).first()
+    if row and row[0]:
+        totais['registros'] = int(row[0])
+        for c, v in zip(CAMPOS, row[1:]): totais[c] = _num(c, v)
+    return totais
+
+def serie_diaria(user_id, start, end):
+    """Buckets diários do período em ordem cronológica."""
+    return DiarioRollup.query.filter(
+        DiarioRollup.user_id == user_id, DiarioRollup.periodo == 'dia',
+        DiarioRollup.inicio >= start, DiarioRollup.inicio <= end
+    ).order_by(DiarioRollup.inicio.asc()).all()
+
+# --- MANUTENÇÃO (rebuild / verify) ---
+def calcular_esperado(user_id=None):
+    """Recalcula todos os buckets a partir do Diario (agrupado por usuário e dia)."""
+    q = db.session.query(Diario.user_id, Diario.data, func.count(Diario.id), *[func.sum(getattr(Diario, c)) for c in CAMPOS]).group_by(Diario.user_id, Diario.data)
+    if user_id: q = q.filter(Diario.user_id == user_id)
+    esperado = {}
+    for row in q:
+        uid, data, qtd = row[0], _to_date(row[1]), int(row[2] or 0)
+        valores = {c: _num(c, v) for c, v in zip(CAMPOS, row[3:])}
+        for p, i in buckets_da_data(data):
+            b = esperado.setdefault((uid, p, i), dict(zeros(), registros=0))
+            b['registros'] += qtd
+            for c in CAMPOS: b[c] += valores[c]
+    return esperado
+
+def rebuild_rollups(user_id=None):
+    """Apaga e recria os buckets (de um usuário ou de todos). Não faz commit."""
+    q = DiarioRollup.query
+    if user_id: q = q.filter_by(user_id=user_id)
+    q.delete()
+    esperado = calcular_esperado(user_id)
+    db.session.bulk_insert_mappings(DiarioRollup, [dict(v, user_id=k[0], periodo=k[1], inicio=k[2]) for k, v in esperado.items()])
+    from app.services.dashboard_cache import bump_data_version
+    bump_data_version([user_id] if user_id else None) # rebuild vem depois de escritas em massa no Diario
+    return len(esperado)
+
+def _diferente(campo, a, b):
+    if campo in CAMPOS_FLOAT: return abs(float(a) - float(b)) > 0.001
+    return a != b
+
+def verificar_rollups(user_id=None):
+    """Compara os buckets gravados com o Diario. Retorna a lista de divergências."""
+    esperado = calcular_esperado(user_id)
+    q = DiarioRollup.query
+    if user_id: q = q.filter_by(user_id=user_id)
+    atual = {(b.user_id, b.periodo, _to_date(b.inicio)): b for b in q.all()}
+    divergencias = []
+    for chave in set(esperado) | set(atual):
+        exp = esperado.get(chave) or dict(zeros(), registros=0)
+        b = atual.get(chave)
+        cur = dict({c: _num(c, getattr(b, c)) for c in CAMPOS}, registros=int(b.registros or 0)) if b else dict(zeros(), registros=0)
+        for campo in ('registros',) + CAMPOS:
+            if _diferente(campo, exp[campo], cur[campo]):
+                divergencias.append({'user_id': chave[0], 'periodo': chave[1], 'inicio': chave[2], 'campo': campo, 'esperado': exp[campo], 'atual': cur[campo]})
+    divergencias.sort(key=lambda d: (d['user_id'], d['periodo'], d['inicio'] or date.min))
+    return divergencias
@@ -0,0 +1,42 @@
+from datetime import datetime
+from sqlalchemy import func, or_
+from app.extensions import db
+from app.models import User, ExpirySweep
+
+def data_validade(user):
+    """Validade do usuário como date (a coluna pode vir como texto em bancos antigos)."""
+    val = user.validade
+    if isinstance(val, str):
+        try: return datetime.strptime(val[:10], '%Y-%m-%d').date()
+        except: return None
+    return val.date() if isinstance(val, datetime) else val
+
+def assinatura_vencida(user, hoje=None):
+    """Só compara a validade já carregada no usuário (sem escrita)."""
+    val = data_validade(user)
+    return val is not None and val < (hoje or datetime.now().date())
+
+def varrer_expirados(origem='cli', hoje=None):
+    """Move todos os usuários com validade vencida para 'expired' com um único UPDATE e registra a execução.
+
+    Faz commit e retorna o ExpirySweep gravado.
+    """
+    hoje = hoje or datetime.now().date()
+    try:
+        expirados = User.query.filter(
+            User.validade < hoje, or_(User.category != 'expired', User.category.is_(None))
+        ).update({'category': 'expired'}, synchronize_session=False)
+        total_vencidos, total_ativos = db.session.query(
+            func.count(User.id).filter(User.category == 'expired'),
+            func.count(User.id).filter(User.category != 'expired'),
+        ).one()
+        registro = ExpirySweep(origem=origem, expirados=expirados or 0, total_vencidos=total_vencidos or 0, total_ativos=total_ativos or 0)
+        db.session.add(registro); db.session.commit()
+        return registro
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro varredura de expirados: {e}")
+        raise
+
+def ultima_varredura():
+    return ExpirySweep.query.order_by(ExpirySweep.executado_em.desc()).first()
@@ -0,0 +1,158 @@
+from datetime import timedelta
+from decimal import Decimal
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value, flag_modified
+from app.extensions import db
+from app.models import User, Diario, DiarioRollup, Agendamentos, UserStats
+from app.utils import get_brasilia_now
+from app.services.rollups import on_diario_change
+
+JANELA_KM_DIAS = 30
+CAMPOS_KM = ('km_total', 'km_30_dias')
+
+def _zeros():
+    return {'km_total': 0.0, 'km_30_dias': 0.0, 'km_30_ref': get_brasilia_now().date(), 'total_registros': 0, 'total_faturamento': Decimal('0.00'), 'agendamentos_concluidos': 0}
+
+def _agregados(session, user_id=None):
+    """Contadores de cada usuário calculados direto das tabelas (estado gravado, antes do flush atual)."""
+    hoje = get_brasilia_now().date()
+    q = session.query(Diario.user_id, func.count(Diario.id), func.sum(Diario.km_percorrido), func.sum(Diario.ganho_bruto)).group_by(Diario.user_id)
+    q30 = session.query(Diario.user_id, func.sum(Diario.km_percorrido)).filter(Diario.data >= hoje - timedelta(days=JANELA_KM_DIAS)).group_by(Diario.user_id)
+    qag = session.query(Agendamentos.user_id, func.count(Agendamentos.id)).filter(Agendamentos.status == 'concluido').group_by(Agendamentos.user_id)
+    if user_id:
+        q = q.filter(Diario.user_id == user_id); q30 = q30.filter(Diario.user_id == user_id); qag = qag.filter(Agendamentos.user_id == user_id)
+    res = {}
+    def linha(uid): return res.setdefault(uid, _zeros())
+    for uid, qtd, km, fat in q.all():
+        l = linha(uid); l['total_registros'] = int(qtd or 0); l['km_total'] = float(km or 0); l['total_faturamento'] = Decimal(str(fat or 0)).quantize(Decimal('0.01'))
+    for uid, km in q30.all(): linha(uid)['km_30_dias'] = float(km or 0)
+    for uid, qtd in qag.all(): linha(uid)['agendamentos_concluidos'] = int(qtd or 0)
+    if user_id: linha(user_id)
+    return res
+
+def _novo_stats(session, user_id):
+    """Cria o UserStats a partir do histórico gravado."""
+    stats = UserStats(user_id=user_id, **_agregados(session, user_id)[user_id])
+    session.add(stats)
+    return stats
+
+def _stats_na_sessao(session, user_id, cache):
+    if user_id in cache: return cache[user_id]
+    stats = None
+    for obj in session.new:
+        if isinstance(obj, UserStats) and obj.user_id == user_id: stats = obj
+    if stats is None:
+        with session.no_autoflush:
+            stats = session.get(UserStats, user_id) or _novo_stats(session, user_id)
+    cache[user_id] = stats
+    return stats
+
+def _km_30(session, user_id, hoje):
+    """km dos últimos 30 dias pelos buckets diários gravados (no máximo 31 linhas)."""
+    return float(session.query(func.coalesce(func.sum(DiarioRollup.km_percorrido), 0)).filter(
+        DiarioRollup.user_id == user_id, DiarioRollup.periodo == 'dia', DiarioRollup.inicio >= hoje - timedelta(days=JANELA_KM_DIAS)
+    ).scalar() or 0)
+
+@on_diario_change
+def _sincronizar_user_stats(session, deltas):
+    # Mesma transação da escrita em Diario; deletes/inserts em massa usam rebuild_user_stats.
+    hoje = get_brasilia_now().date(); cache = {}
+    for (user_id, data, valores), sinal in deltas:
+        if not user_id: continue
+        stats = _stats_na_sessao(session, user_id, cache)
+        if stats.km_30_ref != hoje:
+            # Janela virou o dia: recalcula pelo estado gravado (antes deste flush) e grava junto com a escrita
+            with session.no_autoflush: stats.km_30_dias = _km_30(session, user_id, hoje)
+            stats.km_30_ref = hoje
+        km = valores['km_percorrido'] * sinal
+        stats.km_total = (stats.km_total or 0.0) + km
+        if data and data >= hoje - timedelta(days=JANELA_KM_DIAS):
+            stats.km_30_dias = (stats.km_30_dias or 0.0) + km
+        flag_modified(stats, 'km_30_ref') # a leitura pode ter ajustado a janela só em memória
+        stats.total_registros = (stats.total_registros or 0) + sinal
+        stats.total_faturamento = Decimal(str(stats.total_faturamento or 0)) + valores['ganho_bruto'] * sinal
+
+@event.listens_for(Session, 'before_flush')
+def _sincronizar_agendamentos(session, flush_context, instances):
+    # Conta agendamentos que entram/saem do status 'concluido' (concluir_agendamento, restore, exclusões)
+    with session.no_autoflush:
+        alterados = [o for o in session.dirty if isinstance(o, Agendamentos) and session.is_modified(o)]
+        excluidos = [o for o in session.deleted if isinstance(o, Agendamentos)]
+        novos = [o for o in session.new if isinstance(o, Agendamentos)]
+        if not (alterados or excluidos or novos): return
+        ids = [o.id for o in alterados + excluidos if o.id]
+        gravados = {i: (uid, st) for i, uid, st in session.query(Agendamentos.id, Agendamentos.user_id, Agendamentos.status).filter(Agendamentos.id.in_(ids)).all()} if ids else {}
+        deltas = []
+        for o in novos: deltas.append((o.user_id, o.status, 1))
+        for o in alterados + excluidos:
+            if o.id in gravados: deltas.append((gravados[o.id][0], gravados[o.id][1], -1))
+        for o in alterados: deltas.append((o.user_id, o.status, 1))
+        cache = {}
+        for user_id, status, sinal in deltas:
+            if status != 'concluido' or not user_id: continue
+            stats = _stats_na_sessao(session, int(user_id), cache)
+            stats.agendamentos_concluidos = (stats.agendamentos_concluidos or 0) + sinal
+
+def get_user_stats(user_id):
+    """UserStats do usuário com a janela de 30 dias no dia atual. Só leitura: nunca faz flush/commit.
+
+    A linha é criada no caminho de escrita (before_flush do Diario/Agendamentos, criar_user_stats_faltantes);
+    sem ela, devolve um UserStats fora da sessão calculado das tabelas. Quando km_30_ref não é hoje, a janela
+    é recalculada pelos buckets diários só em memória (o próximo flush de escrita grava o valor do dia).
+    """
+    hoje = get_brasilia_now().date()
+    try:
+        stats = db.session.get(UserStats, user_id)
+        if stats is None: return UserStats(user_id=user_id, **_agregados(db.session, user_id)[user_id])
+        if stats.km_30_ref != hoje:
+            set_committed_value(stats, 'km_30_dias', _km_30(db.session, user_id, hoje)); set_committed_value(stats, 'km_30_ref', hoje)
+        return stats
+    except Exception as e:
+        print(f"Erro UserStats: {e}")
+        return UserStats(user_id=user_id, **_zeros())
+
+def rebuild_user_stats(user_id):
+    """Recalcula o UserStats a partir das tabelas (após deletes/inserts em massa). Não faz commit."""
+    db.session.flush()
+    stats = db.session.get(UserStats, user_id)
+    if stats: db.session.delete(stats); db.session.flush()
+    return _novo_stats(db.session, user_id)
+
+def rebuild_all_user_stats():
+    """Recria o UserStats de todos os usuários com 3 consultas agrupadas. Não faz commit."""
+    UserStats.query.delete()
+    agregados = _agregados(db.session)
+    linhas = [dict(agregados.get(uid) or _zeros(), user_id=uid) for (uid,) in db.session.query(User.id).all()]
+    db.session.bulk_insert_mappings(UserStats, linhas)
+    return len(linhas)
+
+def criar_user_stats_faltantes():
+    """Cria o UserStats dos usuários que ainda não têm (usado antes de consultas em lote). Não faz commit."""
+    faltando = [uid for (uid,) in db.session.query(User.id).filter(~User.id.in_(db.session.query(UserStats.user_id))).all()]
+    if not faltando: return 0
+    agregados = _agregados(db.session)
+    db.session.bulk_insert_mappings(UserStats, [dict(agregados.get(uid) or _zeros(), user_id=uid) for uid in faltando])
+    return len(faltando)
+
+def _diferente(campo, a, b):
+    if campo in CAMPOS_KM: return abs(float(a or 0) - float(b or 0)) > 0.001
+    if campo == 'total_faturamento': return Decimal(str(a or 0)) != Decimal(str(b or 0))
+    return int(a or 0) != int(b or 0)
+
+def verificar_user_stats(user_id=None, campos=None):
+    """Compara o UserStats gravado com as tabelas de origem. Retorna a lista de divergências."""
+    hoje = get_brasilia_now().date()
+    campos = campos or ('km_total', 'km_30_dias', 'total_registros', 'total_faturamento', 'agendamentos_concluidos')
+    esperado = _agregados(db.session, user_id)
+    sq = UserStats.query
+    if user_id: sq = sq.filter_by(user_id=user_id)
+    divergencias = []
+    for s in sq.all():
+        exp = esperado.get(s.user_id, {})
+        for campo in campos:
+            # A janela de 30 dias só é comparável quando foi calculada hoje
+            if campo == 'km_30_dias' and s.km_30_ref != hoje: continue
+            if _diferente(campo, exp.get(campo), getattr(s, campo)):
+                divergencias.append({'user_id': s.user_id, 'campo': campo, 'esperado': exp.get(campo, 0), 'atual': getattr(s, campo)})
+    return divergencias
@@ -24,8 +24,21 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     checkInstallState();
+    pedirSincronizacao();
 });
 
+// Fila offline: lançamentos salvos sem rede são enviados pelo service worker quando a conexão volta
+function pedirSincronizacao() {
+    if (!('serviceWorker' in navigator) || !navigator.onLine) return;
+    navigator.serviceWorker.ready.then(reg => { if (reg.active) reg.active.postMessage({ tipo: 'sincronizar-fila' }); });
+}
+window.addEventListener('online', pedirSincronizacao);
+if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.addEventListener('message', (e) => {
+        if (e.data && e.data.tipo === 'fila-sincronizada') console.log(`PWA: ${e.data.total} lançamento(s) offline sincronizado(s)`);
+    });
+}
+
 function checkInstallState() {
     const isStandalone = window.matchMedia('(display-mode: standalone)').matches || window.navigator.standalone === true;
     
@@ -1,14 +1,11 @@
-const CACHE_NAME = 'motoristapro-v1-glass-fix-pwa';
+// As duas linhas abaixo são reescritas pelo /sw.js a partir do manifesto de estáticos (flask assets build)
+const CACHE_NAME = 'motoristapro-dev';
+const PRECACHE_LOCAL = ['/static/style.css', '/static/js/pwa.js', '/static/js/onboarding.js', '/static/js/tour.js', '/static/icons/icon-192.png', '/static/icons/icon-512.png'];
 const ASSETS_TO_CACHE = [
   '/',
   '/offline.html',
-  '/static/style.css',
-  '/static/js/pwa.js',
-  '/static/js/onboarding.js',
-  '/static/js/tour.js',
   '/manifest.json',
-  '/static/icons/icon-192.png',
-  '/static/icons/icon-512.png',
+  ...PRECACHE_LOCAL,
   'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
   'https://cdn.jsdelivr.net/npm/chart.js',
   'https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700;800&display=swap',
@@ -48,11 +45,82 @@ self.addEventListener('activate', (event) => {
   self.clients.claim();
 });
 
-self.addEventListener('fetch', (event) => {
-  if (event.request.method !== 'GET') return;
+// --- FILA OFFLINE (IndexedDB + Background Sync) ---
+// POST de lançamento sem rede vai para a fila com uma chave de idempotência; ao voltar a conexão a fila
+// inteira é enviada num único POST para /api/v1/sync (reenvio da mesma chave não duplica no servidor).
+const FILA_DB = 'motoristapro-fila';
+const FILA_STORE = 'lancamentos';
+const SYNC_TAG = 'sync-lancamentos';
+const SYNC_LOTE = 200;
+const ROTAS_FILA = { '/adicionar': 'diario', '/novo_agendamento': 'agendamento' };
+
+function abrirFila() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open(FILA_DB, 1);
+    req.onupgradeneeded = () => req.result.createObjectStore(FILA_STORE, { keyPath: 'chave' });
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+function filaTx(modo, fn) {
+  return abrirFila().then((db) => new Promise((resolve, reject) => {
+    const tx = db.transaction(FILA_STORE, modo);
+    const req = fn(tx.objectStore(FILA_STORE));
+    tx.oncomplete = () => resolve(req ? req.result : undefined);
+    tx.onerror = () => reject(tx.error);
+  }));
+}
+
+async function enfileirar(request, tipo) {
+  const form = await request.formData();
+  const dados = {};
+  form.forEach((v, k) => { if (typeof v === 'string' && k !== 'csrf_token') dados[k] = v; });
+  await filaTx('readwrite', (store) => store.put({ chave: crypto.randomUUID(), tipo, dados, criado_em: Date.now() }));
+  if (self.registration.sync) {
+    try { await self.registration.sync.register(SYNC_TAG); } catch (e) { console.log('[SW] Background Sync indisponível'); }
+  }
+  return Response.redirect('/offline.html?fila=1', 303);
+}
+
+async function enviarFila() {
+  const itens = await filaTx('readonly', (store) => store.getAll());
+  if (!itens || !itens.length) return;
+  for (let i = 0; i < itens.length; i += SYNC_LOTE) {
+    const lote = itens.slice(i, i + SYNC_LOTE).map(({ chave, tipo, dados }) => ({ chave, tipo, dados }));
+    const resp = await fetch('/api/v1/sync', {
+      method: 'POST', credentials: 'same-origin',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ itens: lote })
+    });
+    if (!resp.ok || !(resp.headers.get('Content-Type') || '').includes('application/json')) throw new Error('[SW] Sync falhou: ' + resp.status);
+    const { resultados } = await resp.json();
+    // Criados, duplicados (já gravados num envio anterior) e inválidos saem da fila
+    await filaTx('readwrite', (store) => { resultados.forEach((r) => store.delete(r.chave)); });
+  }
+  const clientes = await self.clients.matchAll();
+  clientes.forEach((c) => c.postMessage({ tipo: 'fila-sincronizada', total: itens.length }));
+}
+
+self.addEventListener('sync', (event) => {
+  if (event.tag === SYNC_TAG) event.waitUntil(enviarFila());
+});
 
+// Navegadores sem Background Sync (iOS): a página pede o envio quando volta a ficar online
+self.addEventListener('message', (event) => {
+  if (event.data && event.data.tipo === 'sincronizar-fila') event.waitUntil(enviarFila().catch((e) => console.log(e.message)));
+});
+
+self.addEventListener('fetch', (event) => {
   const url = new URL(event.request.url);
 
+  if (event.request.method === 'POST' && ROTAS_FILA[url.pathname]) {
+    const copia = event.request.clone();
+    event.respondWith(fetch(event.request).catch(() => enfileirar(copia, ROTAS_FILA[url.pathname])));
+    return;
+  }
+  if (event.request.method !== 'GET') return;
+
   // Cache First para Estáticos
   if (
     url.pathname.startsWith('/static') ||
@@ -75,6 +143,28 @@ self.addEventListener('fetch', (event) => {
     return;
   }
 
+  // API de leitura (dashboard/relatórios em JSON): Network First, último resultado serve offline
+  if (url.pathname.startsWith('/api/v1/')) {
+    event.respondWith(
+      fetch(event.request).then((resp) => {
+        if (resp.ok) { const copia = resp.clone(); caches.open(CACHE_NAME).then((cache) => cache.put(event.request, copia)); }
+        return resp;
+      }).catch(() => caches.match(event.request).then((r) => r || new Response(JSON.stringify({ erro: 'offline' }), { status: 503, headers: { 'Content-Type': 'application/json' } })))
+    );
+    return;
+  }
+
+  // Formulários de lançamento ficam em cache para abrir sem rede (o envio cai na fila)
+  if (event.request.mode === 'navigate' && ROTAS_FILA[url.pathname]) {
+    event.respondWith(
+      fetch(event.request).then((resp) => {
+        if (resp.ok) { const copia = resp.clone(); caches.open(CACHE_NAME).then((cache) => cache.put(url.pathname, copia)); }
+        return resp;
+      }).catch(() => caches.match(url.pathname).then((r) => r || caches.match('/offline.html')))
+    );
+    return;
+  }
+
   // Network First para HTML
   if (event.request.mode === 'navigate') {
     event.respondWith(
@@ -1,7 +1,11 @@
 import re
 import logging
+import threading
+import hashlib
+import time
+from collections import OrderedDict
 from functools import wraps
-from flask import redirect, url_for, session
+from flask import redirect, url_for, session, g, has_request_context, request, current_app, make_response
 from app.extensions import db
 from datetime import datetime, date, timedelta
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
@@ -27,6 +31,56 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def filtro_sessao(prefixo, tipo_padrao):
+    """(tipo, valor) do filtro de período: argumentos da URL ou o último usado, guardado na sessão."""
+    tipo = request.args.get('tipo') or session.get(f'{prefixo}_tipo', tipo_padrao)
+    valor = request.args.get('valor') or session.get(f'{prefixo}_valor')
+    session[f'{prefixo}_tipo'] = tipo
+    if valor: session[f'{prefixo}_valor'] = valor
+    return tipo, valor
+
+def _etag_pagina(user, extra):
+    """Tudo o que muda o HTML das páginas de leitura. Não consulta o banco (exceto avisos gerais novos)."""
+    from app.services.notifications import total_nao_lidas
+    from flask_wtf.csrf import generate_csrf
+    generate_csrf() # cria o token da sessão antes do hash (senão a 1ª resposta teria outra ETag)
+    partes = (
+        user.id, user.data_version or 0, current_app.config.get('APP_VERSION'), request.full_path, request.headers.get('HX-Request'),
+        get_brasilia_now().date(), user.plan_type, user.category, user.validade, total_nao_lidas(user), request.cookies.get('darkMode'),
+        user.nome, user.email, user.profile_image, # cabeçalho/perfil do base.html (alterados sem mexer no data_version)
+        # Página guardada não pode carregar um token CSRF vencido: troca a cada meia validade do token
+        session.get('csrf_token'), int(time.time() * 2 // (current_app.config.get('WTF_CSRF_TIME_LIMIT') or 3600)),
+    ) + tuple(extra)
+    return hashlib.sha256(repr(partes).encode()).hexdigest()[:32]
+
+def etag_condicional(sessao=None):
+    """ETag forte nas páginas de leitura: com If-None-Match igual responde 304 antes de rodar a view.
+
+    sessao=(prefixo, tipo_padrao) para views que guardam o filtro de período na sessão (filtro_sessao).
+    Usar abaixo do @login_required. Só atua em GET/HEAD de usuário logado sem mensagens flash pendentes.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask_login import current_user
+            if request.method not in ('GET', 'HEAD') or not current_user.is_authenticated or session.get('_flashes'):
+                return view(*args, **kwargs)
+            try: etag = _etag_pagina(current_user, filtro_sessao(*sessao) if sessao else ())
+            except Exception as e:
+                print(f"Erro ETag: {e}")
+                return view(*args, **kwargs)
+            if any(request.if_none_match.contains(etag + sufixo) for sufixo in ('', '-gzip', '-br')): # variantes da compressão
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200: return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache' # guarda no navegador, mas sempre revalida
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
 def safe_decimal(value):
     """
     Converte valor para Decimal (Financeiro) com alta robustez.
@@ -72,11 +126,75 @@ def float_to_parts(val):
     m = int(round((val - h) * 60))
     return h, m
 
-def get_config(user_id, key, default=''):
+# --- CONFIGURAÇÕES DO USUÁRIO (cache por requisição + cache em processo) ---
+class LRUCache:
+    """Dicionário limitado e thread-safe (gunicorn gthread) que descarta o item mais antigo."""
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data: return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock: self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+_settings_cache = LRUCache(maxsize=512)
+
+def _get_config_version(user_id):
+    from flask_login import current_user
+    from app.models import User
+    if has_request_context() and current_user and getattr(current_user, 'id', None) == user_id:
+        return current_user.config_version or 0
+    return db.session.query(User.config_version).filter_by(id=user_id).scalar() or 0
+
+def _load_settings(user_id):
+    """Mapa chave -> valor do usuário: no máximo 1 query por requisição, nenhuma se o cache estiver na versão atual."""
     from app.models import Config
-    try: 
-        cfg = Config.query.filter_by(user_id=user_id, chave=key).first()
-        return cfg.valor if cfg else default
+    memo = g.setdefault('_user_settings', {}) if has_request_context() else {}
+    if user_id in memo: return memo[user_id]
+    version = _get_config_version(user_id)
+    cached = _settings_cache.get(user_id)
+    if cached and cached[0] == version:
+        settings = cached[1]
+    else:
+        rows = db.session.query(Config.chave, Config.valor).filter_by(user_id=user_id).all()
+        settings = {chave: valor for chave, valor in rows}
+        _settings_cache.set(user_id, (version, settings))
+    memo[user_id] = settings
+    return settings
+
+def get_user_settings(user_id):
+    """Cópia do mapa de configurações do usuário (pode ser alterada pelo chamador)."""
+    try: return dict(_load_settings(user_id))
+    except: return {}
+
+def bump_config_version(user_id):
+    """Invalida o cache de configurações. Chamar em toda escrita em Config (antes do commit)."""
+    from app.models import User
+    db.session.query(User).filter_by(id=user_id).update({User.config_version: db.func.coalesce(User.config_version, 0) + 1}, synchronize_session=False)
+    _settings_cache.pop(user_id)
+    if has_request_context(): g.setdefault('_user_settings', {}).pop(user_id, None)
+    from app.services.dashboard_cache import bump_data_version
+    bump_data_version([user_id]) # configurações entram no payload do dashboard (meta, km inicial)
+
+def get_config(user_id, key, default=''):
+    try:
+        settings = _load_settings(user_id)
+        return settings[key] if key in settings else default
     except: return default
 
 def set_config(user_id, key, val):
@@ -85,6 +203,7 @@ def set_config(user_id, key, val):
         cfg = Config.query.filter_by(user_id=user_id, chave=key).first()
         if cfg: cfg.valor = str(val)
         else: db.session.add(Config(chave=key, valor=str(val), user_id=user_id))
+        bump_config_version(user_id)
         db.session.commit()
     except: pass
 
@@ -112,8 +231,10 @@ def init_user_configs(user):
             'consumo_etanol': '7.0', 
             'consumo_gasolina': '10.0'
         }
+        existentes = {c for (c,) in db.session.query(Config.chave).filter_by(user_id=user.id).all()}
         for k, v in default_configs.items(): 
-            if not Config.query.filter_by(user_id=user.id, chave=k).first(): db.session.add(Config(chave=k, valor=v, user_id=user.id))
+            if k not in existentes: db.session.add(Config(chave=k, valor=v, user_id=user.id))
+        bump_config_version(user.id)
         db.session.commit()
     except: pass
 
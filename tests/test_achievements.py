@@ -0,0 +1,26 @@
+from decimal import Decimal
+from app.models import User, Diario, Achievement, UserAchievement
+from app.extensions import db
+from app.utils import get_brasilia_now
+from app.services.gamification import AchievementService, backfill_achievement, invalidate_achievement_catalog
+
+def test_regras_declarativas_e_backfill(app, sample_user):
+    db.session.add_all([
+        Achievement(id='primeira_marcha', nome='Primeira Marcha', descricao='1 dia'),
+        Achievement(id='viajante', nome='Viajante', descricao='1000 km'),
+        Achievement(id='meio_caminho', nome='Meio Caminho', descricao='500 km', metrica='km_total', meta=500),
+    ])
+    outro = User(email='outro@motorista.pro', nome='Outro', password_hash='x')
+    db.session.add(outro); db.session.commit()
+    invalidate_achievement_catalog()
+
+    db.session.add(Diario(user_id=sample_user.id, data=get_brasilia_now().date(), ganho_bruto=Decimal('10.00'), km_percorrido=600))
+    db.session.commit()
+    assert AchievementService.check_new_entries(sample_user) == ['primeira_marcha', 'meio_caminho']
+
+    # Usuário que já tinha histórico recebe a conquista nova sem precisar salvar nada
+    db.session.add(Diario(user_id=outro.id, data=get_brasilia_now().date(), km_percorrido=1200)); db.session.commit()
+    assert backfill_achievement('viajante') == 1
+    db.session.commit()
+    assert UserAchievement.query.filter_by(user_id=outro.id, achievement_id='viajante').count() == 1
+    assert backfill_achievement('viajante') == 0
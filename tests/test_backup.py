@@ -0,0 +1,83 @@
+import io
+import gzip
+import json
+import zipfile
+import pytest
+from decimal import Decimal
+from datetime import date
+from app.models import Diario
+from app.extensions import db
+from app.services import backup
+
+def test_backup_zip_em_streaming_com_manifesto(app, sample_user, monkeypatch):
+    monkeypatch.setattr(backup, 'LOTE_BACKUP', 2)
+    db.session.add_all([Diario(user_id=sample_user.id, data=date(2025, 1, d), ganho_bruto=Decimal('1.00')) for d in range(1, 6)])
+    db.session.commit()
+
+    pedacos = list(backup.gerar_backup_zip('teste'))
+    assert len(pedacos) > len(backup.ARQUIVOS_BACKUP) # enviou pedaços no meio do diarios.csv
+    zf = zipfile.ZipFile(io.BytesIO(b''.join(pedacos)))
+    manifesto = json.loads(zf.read('manifest.json'))
+    assert manifesto['arquivos']['diarios.csv'] == 5 and manifesto['arquivos']['users.csv'] == 1
+    assert len(zf.read('diarios.csv').decode().splitlines()) == 6
+
+def test_restore_em_lotes_relata_inseridos_atualizados_e_ignorados(app, sample_user):
+    db.session.add_all([Diario(user_id=sample_user.id, data=date(2025, 2, d), ganho_bruto=Decimal('2.00')) for d in range(1, 4)])
+    db.session.commit()
+    conteudo = b''.join(backup.gerar_backup_zip())
+
+    Diario.query.filter(Diario.data == date(2025, 2, 1)).delete(); db.session.commit()
+    zf_mem = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as origem, zipfile.ZipFile(zf_mem, 'w') as destino:
+        for nome in origem.namelist():
+            dados = origem.read(nome)
+            if nome == 'diarios.csv': dados += b'99,data-invalida,1.00,0,0,0,0,0,0,0,0,0,0,0,0,0,1\r\n'
+            destino.writestr(nome, dados)
+    zf_mem.seek(0)
+
+    rel = backup.restaurar_backup_zip(zf_mem, lote=2, commit_a_cada=1)
+    assert rel['arquivos']['diarios.csv'] == {'inseridos': 1, 'atualizados': 2, 'ignorados': 1}
+    assert Diario.query.count() == 3
+    from app.services.rollups import somar_periodo
+    assert somar_periodo(sample_user.id, date(2025, 2, 1), date(2025, 2, 28))['ganho_bruto'] == Decimal('6.00')
+
+def test_restore_com_falha_apos_commit_recalcula_derivados(app, sample_user, monkeypatch):
+    from app.services.rollups import somar_periodo
+    db.session.add_all([Diario(user_id=sample_user.id, data=date(2025, 3, d), ganho_bruto=Decimal('5.00')) for d in range(1, 5)]); db.session.commit()
+    conteudo = b''.join(backup.gerar_backup_zip())
+    Diario.query.delete(); db.session.commit()
+
+    original, chamadas = backup._processar_lote, []
+    def falha_no_terceiro(model_class, *args):
+        if model_class is Diario: chamadas.append(1)
+        if len(chamadas) == 3: raise RuntimeError('disco cheio')
+        return original(model_class, *args)
+    monkeypatch.setattr(backup, '_processar_lote', falha_no_terceiro)
+    with pytest.raises(RuntimeError):
+        backup.restaurar_backup_zip(io.BytesIO(conteudo), lote=1, commit_a_cada=1)
+    assert Diario.query.count() == 2 # dois lotes commitados antes da falha
+    assert somar_periodo(sample_user.id, date(2025, 3, 1), date(2025, 3, 31))['ganho_bruto'] == Decimal('10.00')
+
+def test_export_json_em_streaming_com_gzip(app, sample_user):
+    db.session.add_all([Diario(user_id=sample_user.id, data=date(2024, 1, d), ganho_bruto=100, km_percorrido=50) for d in range(1, 4)]); db.session.commit()
+    texto = ''.join(backup.gerar_export_json(sample_user))
+    dados = json.loads(texto)
+    assert dados['schema_version'] == backup.EXPORT_SCHEMA and len(dados['diarios']) == 3 and 'password_hash' not in dados['user']
+    compactado = b''.join(backup.gzip_stream(backup.gerar_export_json(sample_user)))
+    assert json.loads(gzip.decompress(compactado)) == dados
+
+def test_importar_dados_incremental_em_lotes(app, sample_user, monkeypatch):
+    from app.models import DiarioRollup
+    monkeypatch.setattr(backup.LeitorJson, 'BLOCO', 7) # blocos minúsculos: valores cortados entre leituras
+    db.session.add_all([Diario(user_id=sample_user.id, data=date(2024, 2, d), ganho_bruto=Decimal('10.50'), km_percorrido=12.5) for d in range(1, 6)]); db.session.commit()
+    arquivo = b''.join(backup.gzip_stream(backup.gerar_export_json(sample_user)))
+
+    r = backup.importar_export_json(sample_user, io.BytesIO(arquivo), lote=2); db.session.commit()
+    assert r['schema_version'] == backup.EXPORT_SCHEMA and r['importados']['diarios'] == 5 and r['lotes'] >= 3 and r['ignorados'] == 0
+    assert Diario.query.filter_by(user_id=sample_user.id).count() == 5
+    assert DiarioRollup.query.filter_by(user_id=sample_user.id, periodo='mes').one().ganho_bruto == Decimal('52.50')
+
+    legado = json.dumps({'user': {'nome': 'Novo'}, 'diarios': [{'data': '2024-03-01', 'ganho_bruto': '7'}, {'data': 'x'}]}).encode()
+    r = backup.importar_export_json(sample_user, io.BytesIO(legado)); db.session.commit()
+    assert r['schema_version'] == 1 and r['importados'] == {'diarios': 1} and r['ignorados'] == 1 and sample_user.nome == 'Novo'
+    with pytest.raises(ValueError): backup.importar_export_json(sample_user, io.BytesIO(b'{"schema_version": 99, "diarios": []}'))
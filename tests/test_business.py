@@ -0,0 +1,15 @@
+from decimal import Decimal
+from app.models import Diario
+from app.extensions import db
+from app.utils import get_brasilia_now
+from app.services.business import gerar_snapshot, snapshots_recentes, contexto_snapshot
+
+def test_snapshot_guarda_historico_e_alimenta_o_painel(app, sample_user):
+    db.session.add(Diario(user_id=sample_user.id, data=get_brasilia_now().date(), ganho_bruto=Decimal('80.00'), ganho_uber=Decimal('80.00'), km_percorrido=40))
+    db.session.commit()
+    primeiro = gerar_snapshot(); segundo = gerar_snapshot()
+
+    assert [s.id for s in snapshots_recentes()] == [segundo.id, primeiro.id]
+    ctx = contexto_snapshot(segundo)
+    assert ctx['media_reais_km'] == 2.0 and ctx['share_data'][0] == 80.0
+    assert ctx['top_users'][0]['total_ganho'] == 80.0
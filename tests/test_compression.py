@@ -0,0 +1,11 @@
+import gzip
+
+def test_resposta_comprimida_conforme_accept_encoding(app):
+    client = app.test_client()
+    r = client.get('/', headers={'Accept-Encoding': 'gzip'}) # landing (anônimo)
+    assert r.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in r.headers['Vary']
+    html = gzip.decompress(r.data)
+    assert len(html) > len(r.data) and client.get('/').data == html
+
+    assert 'Content-Encoding' not in client.get('/healthz', headers={'Accept-Encoding': 'gzip'}).headers # abaixo do mínimo
+    assert 'Content-Encoding' not in client.post('/webhook/mercadopago', headers={'Accept-Encoding': 'gzip'}).headers
@@ -0,0 +1,22 @@
+from datetime import date
+from app.models import User, Diario, Manutencao
+from app.extensions import db
+from app.services.dashboard_cache import chave_dashboard, get_payload, set_payload
+from app.services.rollups import rebuild_rollups
+
+def _versao(user_id):
+    return db.session.query(User.data_version).filter_by(id=user_id).scalar()
+
+def test_versao_dos_dados_invalida_o_payload(app, sample_user):
+    uid = sample_user.id
+    chave = chave_dashboard(sample_user, 'dia', date.today()); set_payload(chave, {'ok': True})
+    assert get_payload(chave_dashboard(sample_user, 'dia', date.today())) == {'ok': True}
+
+    v = _versao(uid)
+    db.session.add(Diario(user_id=uid, data=date.today(), ganho_bruto=10)); db.session.commit()
+    assert _versao(uid) == v + 1
+    assert get_payload(chave_dashboard(sample_user, 'dia', date.today())) is None
+
+    db.session.add(Manutencao(user_id=uid, item='Óleo', km_proxima=1000)); db.session.commit()
+    Diario.query.filter_by(user_id=uid).delete(); rebuild_rollups(uid); db.session.commit() # caminho em massa
+    assert _versao(uid) == v + 3
@@ -0,0 +1,31 @@
+from app.models import Diario, Agendamentos
+from app.services.lancamentos import sincronizar_lote
+
+def _itens():
+    return [
+        {'chave': 'a1', 'tipo': 'diario', 'dados': {'data': '2026-01-10', 'ganho_uber': '120,50', 'ganho_99': '30', 'horas_qtd': '6', 'minutos_qtd': '30'}},
+        {'chave': 'a2', 'tipo': 'agendamento', 'dados': {'cliente': 'Ana', 'data_ag': '2026-01-11', 'hora_ag': '08:00', 'origem': 'A', 'destino': 'B', 'valor': '45'}},
+        {'chave': 'a3', 'tipo': 'diario', 'dados': {'data': 'ontem'}},
+    ]
+
+def test_reenvio_da_fila_nao_duplica(app, sample_user):
+    r1 = sincronizar_lote(sample_user, _itens())
+    assert [r['status'] for r in r1] == ['criado', 'criado', 'erro']
+    d = Diario.query.filter_by(user_id=sample_user.id).one()
+    assert d.ganho_bruto == 150.5 and d.horas_trabalhadas == 6.5
+
+    r2 = sincronizar_lote(sample_user, _itens())
+    assert [r['status'] for r in r2] == ['duplicado', 'duplicado', 'erro']
+    assert r2[0]['id'] == r1[0]['id']
+    assert Diario.query.filter_by(user_id=sample_user.id).count() == 1
+    assert Agendamentos.query.filter_by(user_id=sample_user.id).count() == 1
+
+def test_carga_em_massa_de_diarios(app, sample_user):
+    from app.models import DiarioRollup
+    from app.services.lancamentos import inserir_diarios
+    entradas = [{'data': f'2026-02-{d:02d}', 'ganho_uber': 100, 'total_combustivel': '30,00', 'km_percorrido': 120} for d in range(1, 11)]
+    entradas.insert(2, {'data': '31/02/2026'})
+    resultados, _ = inserir_diarios(sample_user, entradas)
+    assert [r['status'] for r in resultados].count('criado') == 10 and resultados[2]['status'] == 'erro'
+    mes = DiarioRollup.query.filter_by(user_id=sample_user.id, periodo='mes').one()
+    assert mes.registros == 10 and float(mes.ganho_bruto) == 1000 and float(mes.despesa_combustivel) == 300
@@ -0,0 +1,57 @@
+from app.models import User, Notification
+from app.extensions import db
+from app.services.notifications import verificar_nao_lidas, zerar_nao_lidas, incrementar_nao_lidas
+
+def _contador(user_id):
+    return db.session.query(User.notificacoes_nao_lidas).filter_by(id=user_id).scalar()
+
+def test_contador_de_nao_lidas_acompanha_as_escritas(app, sample_user):
+    uid = sample_user.id
+    a = Notification(user_id=uid, message='a'); b = Notification(user_id=uid, message='b')
+    db.session.add_all([a, b, Notification(user_id=uid, message='lida', is_read=True)]); db.session.commit()
+    assert _contador(uid) == 2
+
+    a.is_read = True; db.session.commit()
+    assert _contador(uid) == 1
+    db.session.delete(b); db.session.commit()
+    assert _contador(uid) == 0
+
+    # Caminhos em massa (broadcast do admin / marcar todas como lidas)
+    db.session.bulk_insert_mappings(Notification, [{'user_id': uid, 'message': 'x', 'is_read': False}]); incrementar_nao_lidas(); db.session.commit()
+    assert _contador(uid) == 1 and verificar_nao_lidas() == []
+    Notification.query.filter_by(user_id=uid).update({'is_read': True}); zerar_nao_lidas(uid); db.session.commit()
+    assert _contador(uid) == 0 and verificar_nao_lidas() == []
+
+def test_aviso_geral_sem_linha_por_usuario(app, sample_user):
+    from app.models import BroadcastMessage, BroadcastRead
+    from app.services.notifications import enviar_broadcast, total_nao_lidas, pagina_notificacoes, marcar_broadcast_lido, marcar_broadcasts_lidos
+    b1 = enviar_broadcast('manutenção'); b2 = enviar_broadcast('novidade'); db.session.commit()
+    assert Notification.query.filter_by(user_id=sample_user.id).count() == 0
+    assert total_nao_lidas(sample_user) == 2
+    assert [n.tipo for n in pagina_notificacoes(sample_user)[0]] == ['aviso', 'aviso']
+
+    marcar_broadcast_lido(sample_user, b1.id); db.session.commit()
+    assert total_nao_lidas(sample_user) == 1
+    marcar_broadcasts_lidos(sample_user, ocultar=True); db.session.commit()
+    assert total_nao_lidas(sample_user) == 0 and pagina_notificacoes(sample_user) == ([], None)
+    assert BroadcastRead.query.count() == 0 and BroadcastMessage.query.count() == 2
+
+def test_feed_paginado_por_cursor(app, sample_user):
+    from datetime import datetime, timedelta
+    from app.models import BroadcastMessage
+    from app.services.notifications import pagina_notificacoes
+    base = datetime.now()
+    db.session.add_all([Notification(user_id=sample_user.id, message=f'n{i}', created_at=base - timedelta(minutes=i)) for i in range(5)])
+    db.session.add_all([BroadcastMessage(message='aviso', created_at=base - timedelta(minutes=2)), Notification(user_id=sample_user.id, message='empate', created_at=base - timedelta(minutes=2))])
+    # Linhas legadas sem created_at entram no fim do feed
+    db.session.add_all([Notification(user_id=sample_user.id, message=f'legado{i}') for i in range(3)] + [BroadcastMessage(message='aviso legado')]); db.session.commit()
+    Notification.query.filter(Notification.message.like('legado%')).update({'created_at': None}, synchronize_session=False)
+    BroadcastMessage.query.filter_by(message='aviso legado').update({'created_at': None}, synchronize_session=False); db.session.commit()
+    vistos, cursor = [], None
+    while True:
+        itens, cursor = pagina_notificacoes(sample_user, cursor, limite=2)
+        vistos += [(n.tipo, n.id, n.created_at) for n in itens]
+        if not cursor: break
+    assert len(vistos) == 11 and len({v[:2] for v in vistos}) == 11
+    assert all(v[2] is None for v in vistos[7:])
+    assert not db.session.dirty
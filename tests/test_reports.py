@@ -0,0 +1,21 @@
+from decimal import Decimal
+from datetime import date
+from app.models import Diario
+from app.extensions import db
+from app.services import reports
+
+def test_agregacoes_por_data_dia_da_semana_e_mes(app, sample_user):
+    uid = sample_user.id
+    db.session.add_all([
+        Diario(user_id=uid, data=date(2025, 1, 5), ganho_bruto=Decimal('100.00'), despesa_combustivel=Decimal('20.00')), # Domingo
+        Diario(user_id=uid, data=date(2025, 1, 5), ganho_bruto=Decimal('50.00')),
+        Diario(user_id=uid, data=date(2025, 2, 3), ganho_bruto=Decimal('300.00')), # Segunda
+    ])
+    db.session.commit()
+    inicio, fim = date(2025, 1, 1), date(2025, 12, 31)
+
+    assert reports.por_data(uid, inicio, fim)[0] == (date(2025, 1, 5), Decimal('150.00'), Decimal('20.00'), 2)
+    assert reports.por_dia_semana(uid, inicio, fim) == [(0, Decimal('150.00'), 2), (1, Decimal('300.00'), 1)]
+    assert [(m, g) for _, m, g, _ in reports.por_mes(uid, inicio, fim)] == [(1, Decimal('150.00')), (2, Decimal('300.00'))]
+    assert reports.melhor_dia(uid, inicio, fim) == (date(2025, 2, 3), Decimal('300.00'))
+    assert reports.resumo_periodo(uid, inicio, fim)[:2] == (Decimal('450.00'), Decimal('20.00'))
@@ -0,0 +1,48 @@
+from decimal import Decimal
+from datetime import date
+from app.models import Diario, DiarioRollup
+from app.extensions import db
+from app.services.rollups import somar_periodo, verificar_rollups, rebuild_rollups, decompor_periodo
+
+def test_decompor_periodo_usa_mes_semana_e_dia():
+    # Janeiro/2025 inteiro vira um único bucket mensal
+    assert decompor_periodo(date(2025, 1, 1), date(2025, 1, 31)) == [('mes', date(2025, 1, 1))]
+    # Domingo a Sábado vira um bucket semanal
+    assert decompor_periodo(date(2025, 1, 5), date(2025, 1, 11)) == [('semana', date(2025, 1, 5))]
+
+def test_rollups_acompanham_insercao_edicao_e_exclusao(app, sample_user):
+    d1 = Diario(user_id=sample_user.id, data=date(2025, 1, 4), ganho_bruto=Decimal('100.10'), despesa_combustivel=Decimal('33.33'), km_percorrido=120)
+    d2 = Diario(user_id=sample_user.id, data=date(2025, 1, 6), ganho_bruto=Decimal('50.05'), km_percorrido=30)
+    db.session.add_all([d1, d2]); db.session.commit()
+
+    mes = somar_periodo(sample_user.id, date(2025, 1, 1), date(2025, 1, 31))
+    assert mes['registros'] == 2 and mes['ganho_bruto'] == Decimal('150.15') and mes['km_percorrido'] == 150
+
+    # Move o lançamento para fevereiro: sai dos buckets de janeiro
+    d1.data = date(2025, 2, 3); db.session.commit()
+    assert somar_periodo(sample_user.id, date(2025, 1, 1), date(2025, 1, 31))['ganho_bruto'] == Decimal('50.05')
+    assert somar_periodo(sample_user.id, date(2025, 2, 2), date(2025, 2, 8))['ganho_bruto'] == Decimal('100.10')
+
+    db.session.delete(d2); db.session.commit()
+    assert somar_periodo(sample_user.id, date(2025, 1, 1), date(2025, 1, 31))['registros'] == 0
+    assert verificar_rollups(sample_user.id) == []
+
+def test_verify_detecta_e_rebuild_corrige_divergencia(app, sample_user):
+    db.session.add(Diario(user_id=sample_user.id, data=date(2025, 3, 10), ganho_bruto=Decimal('80.00')))
+    db.session.commit()
+    DiarioRollup.query.filter_by(user_id=sample_user.id, periodo='mes').update({'ganho_bruto': Decimal('1.00')})
+    db.session.commit()
+
+    assert [d['campo'] for d in verificar_rollups(sample_user.id)] == ['ganho_bruto']
+    rebuild_rollups(sample_user.id); db.session.commit()
+    assert verificar_rollups(sample_user.id) == []
+
+def test_anos_disponiveis_acompanham_os_buckets(app, sample_user):
+    from app.services.rollups import anos_disponiveis
+    jan = Diario(user_id=sample_user.id, data=date(2024, 1, 10), ganho_bruto=Decimal('10.00'))
+    db.session.add_all([jan, Diario(user_id=sample_user.id, data=date(2025, 5, 2), ganho_bruto=Decimal('20.00'))]); db.session.commit()
+    assert anos_disponiveis(sample_user) == [2025, 2024]
+
+    db.session.delete(jan); db.session.commit()
+    assert anos_disponiveis(sample_user) == [2025]
+    assert verificar_rollups(sample_user.id) == []
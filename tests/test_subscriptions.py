@@ -0,0 +1,17 @@
+from datetime import timedelta
+from app.models import User
+from app.extensions import db
+from app.utils import get_brasilia_now
+from app.services.subscriptions import varrer_expirados, assinatura_vencida
+
+def test_varredura_expira_vencidos_em_lote(app, sample_user):
+    hoje = get_brasilia_now().date()
+    sample_user.validade = hoje - timedelta(days=1)
+    db.session.add(User(email='ok@motorista.pro', password_hash='x', category='subscriber', validade=hoje + timedelta(days=10)))
+    db.session.commit()
+    assert assinatura_vencida(sample_user, hoje)
+
+    r = varrer_expirados(hoje=hoje)
+    assert (r.expirados, r.total_vencidos, r.total_ativos) == (1, 1, 1)
+    assert db.session.query(User.category).filter_by(id=sample_user.id).scalar() == 'expired'
+    assert varrer_expirados(hoje=hoje).expirados == 0
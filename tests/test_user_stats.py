@@ -0,0 +1,35 @@
+from decimal import Decimal
+from datetime import timedelta
+from app.models import Diario, Agendamentos
+from app.extensions import db
+from app.utils import get_brasilia_now, set_config
+from app.services import get_odometro
+from app.services.user_stats import get_user_stats, verificar_user_stats
+
+def test_odometro_e_contadores_acompanham_o_diario(app, sample_user):
+    hoje = get_brasilia_now().date()
+    set_config(sample_user.id, 'km_atual_carro', '1000')
+    antigo = Diario(user_id=sample_user.id, data=hoje - timedelta(days=60), ganho_bruto=Decimal('10.00'), km_percorrido=500)
+    recente = Diario(user_id=sample_user.id, data=hoje, ganho_bruto=Decimal('100.50'), km_percorrido=90)
+    db.session.add_all([antigo, recente]); db.session.commit()
+
+    odo, media = get_odometro(sample_user)
+    assert odo == 1590 and media == 3.0
+
+    antigo.data = hoje; antigo.km_percorrido = 300; db.session.commit()
+    stats = get_user_stats(sample_user.id)
+    assert stats.km_total == 390 and stats.km_30_dias == 390
+    assert stats.total_registros == 2 and stats.total_faturamento == Decimal('110.50')
+
+    db.session.delete(recente); db.session.commit()
+    assert get_user_stats(sample_user.id).total_registros == 1
+    assert verificar_user_stats(sample_user.id) == []
+
+def test_agendamentos_concluidos_sao_contados(app, sample_user):
+    a = Agendamentos(cliente='Ana', data_hora=get_brasilia_now(), valor=Decimal('50.00'), user_id=sample_user.id)
+    db.session.add(a); db.session.commit()
+    assert get_user_stats(sample_user.id).agendamentos_concluidos == 0
+
+    a.status = 'concluido'; db.session.commit()
+    assert get_user_stats(sample_user.id).agendamentos_concluidos == 1
+    assert verificar_user_stats(sample_user.id) == []